@@ -0,0 +1,28 @@
+#----------------------------------------------------------------------------#
+# Access tokens.
+#----------------------------------------------------------------------------#
+
+# @requires_token(setting) guards the endpoints that aren't for site
+# visitors (the operational /_* pages, bulk import/export): a request must
+# carry "Authorization: Bearer <app.config[setting]>" or it gets a 403.
+# While the setting is unset the endpoint is disabled.
+
+import hmac
+from functools import wraps
+from flask import abort, current_app, request
+
+
+def has_token(setting):
+  token = current_app.config.get(setting)
+  given = request.headers.get('Authorization', '')
+  return bool(token) and hmac.compare_digest(given.encode(), ('Bearer %s' % token).encode())
+
+def requires_token(setting):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if not has_token(setting):
+        abort(403)
+      return view(*args, **kwargs)
+    return wrapper
+  return decorator
@@ -2,22 +2,43 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+# first, so the startup phases (see warmup.py) cover every import
+from warmup import startup, warm, warmup_cli, DeferredCommand
+import io
 import json
-import dateutil.parser
-import babel
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from models import db, Artist, Venue, Shows
+from sqlalchemy.orm import raiseload, selectinload
+from models import db, Artist, Venue, Shows, forbid_lazy_loads
+from queries import venue_areas, venue_detail, artist_detail, venue_artist_ids, artist_venue_ids, show_feed, show_stream, decode_show_cursor, calendar_days
+from queries import venue_version, artist_version, venues_version, artists_version, shows_version, calendar_version
+import search
+from suggest import suggestions
+from cache import cache
+from fragments import fragments
+from assets import assets, assets_cli
+from jobs import jobs, jobs_cli, task
+from conditional import conditional
+from access import requires_token
+from engine import engine_options, init_engine, pool_metrics
+from routing import init_replicas
+import counters
+import bulk
+import dates
+import show_calendar
+from genres import lookup_genres, parse_genre_args, has_genre
+from geo import gazetteer, nearby_venues, geo_cli
+from instrument import instrumentation
 import collections
 collections.Callable = collections.abc.Callable
+startup.mark('imports')
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -26,23 +47,71 @@ collections.Callable = collections.abc.Callable
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+init_engine(app)
 db.init_app(app)
-migrate = Migrate(app, db)
+init_replicas(app, engine_options)
+app.cli.add_command(counters.counters_cli)
+app.cli.add_command(bulk.fyyur_cli)
+app.cli.add_command(geo_cli)
+app.cli.add_command(show_calendar.calendar_cli)
+app.cli.add_command(warmup_cli)
+app.cli.add_command(assets_cli)
+app.cli.add_command(jobs_cli)
+
+def migrate_cli():
+  # Flask-Migrate imports alembic, a fifth of the startup time, and only
+  # the `flask db` commands need it
+  from flask_migrate import Migrate
+  Migrate(app, db)
+  return app.cli.commands['db']
+
+app.cli.add_command(DeferredCommand('db', migrate_cli, help='Perform database migrations.'))
+
+suggestions.init_app(app)
+cache.init_app(app)
+fragments.init_app(app)
+assets.init_app(app)
+gazetteer.init_app(app)
+jobs.init_app(app)
+instrumentation.init_app(app)
+startup.init_app(app)
+
+if app.config['RAISE_ON_LAZY_LOAD']:
+  forbid_lazy_loads()
+
+startup.mark('app')
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# precompiled babel patterns and a bounded memo, see dates.py
+dates.set_cache_size(app.config['DATETIME_CACHE_SIZE'])
+app.jinja_env.filters['datetime'] = dates.format_datetime
+app.jinja_env.filters['date'] = dates.format_date
 
-app.jinja_env.filters['datetime'] = format_datetime
+#----------------------------------------------------------------------------#
+# Jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-up work the write handlers enqueue, see jobs.py. A write still
+# invalidates the pages it changed itself before responding, so the
+# redirect shows the change; the pages that merely link to the changed
+# row (an edited venue's artists, ...) are invalidated in the background.
+
+@task()
+def invalidate_pages(*groups):
+  cache.invalidate(*groups)
+
+@task()
+def invalidate_venue_artists(venue_id):
+  cache.invalidate(*['artist:%d' % id for id in venue_artist_ids(venue_id)])
+
+@task()
+def invalidate_artist_venues(artist_id):
+  cache.invalidate(*['venue:%d' % id for id in artist_venue_ids(artist_id)])
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -56,70 +125,59 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(venues_version)
+@cache.cached('venues', args=('genre',))
 def venues():
-  show_venues = Venue.query.distinct(Venue.city, Venue.state).all()
-  data = []
-  for show_venue in show_venues:
-    location = {"city": show_venue.city, "state": show_venue.state}
-    venues = Venue.query.filter_by(city=show_venue.city, state=show_venue.state).all()
-    layout_venues = []
-    for venue in venues:
-      layout_venues.append({"id": venue.id, "name": venue.name, "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))})  
-    location["venues"] = layout_venues
-    data.append(location)
-
-  #TODO: replace with real venues data.
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  # one grouped statement for every area, see queries.venue_areas;
+  # ?genre=Jazz (repeatable or comma-separated) narrows it down
+  data = venue_areas(genres=parse_genre_args(request.args.getlist('genre')))
+  return render_template('pages/venues.html', areas=data)
+
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-  search_term = request.form.get("search_term", "")
-
-  search_results = {}
-  venues = list(Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all())
-  search_results["count"] = len(venues)
-  search_results["data"] = []
-
-  for venue in venues:
-    each_venue = {
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
-    }
-    search_results["data"].append(each_venue)
-
-  return render_template('pages/search_venues.html', results=search_results, search_term=search_term)
+  # the navbar form POSTs the first page, "more results" links GET the rest
+  search_term = request.values.get("search_term", "")
+  page = request.args.get("page", 1, type=int)
+  if page < 1:
+    abort(400)
+  genres = parse_genre_args(request.values.getlist('genre'))
+  search_results = search.search_venues(search_term, page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'], genres=genres)
+
+  return render_template('pages/search_venues.html', results=search_results, search_term=search_term, genres=genres)
+
+@app.route('/venues/nearby')
+def venues_nearby():
+  # venues within ?radius= km of ?lat=&lng=, nearest first, see geo.py
+  lat = request.args.get('lat', type=float)
+  lng = request.args.get('lng', type=float)
+  radius = request.args.get('radius', app.config['NEARBY_RADIUS_KM'], type=float)
+  limit = request.args.get('limit', app.config['NEARBY_LIMIT'], type=int)
+  if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180) or not radius > 0:
+    abort(400)
+  radius = min(radius, app.config['NEARBY_MAX_RADIUS_KM'])
+  limit = min(max(limit, 1), 100)
+  return jsonify({
+    "lat": lat,
+    "lng": lng,
+    "radius_km": radius,
+    "venues": nearby_venues(lat, lng, radius, limit=limit),
+  })
 
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_version)
+@cache.cached('venue:{venue_id}', args=('past_page',))
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  setattr(venue, "genres", venue.genre.split(", "))
-  today = datetime.now()
-
-  # get information about upcoming shows
-  upcoming_shows_query = db.session.query(Shows).join(Artist).filter(Shows.venue_id==venue_id).filter(Shows.start_time>today).all()
-  upcoming_shows = [] 
-  for show in upcoming_shows_query:
-    info = {"artist_name": show.artists.name, "artist_id": show.artists.id, "artist_image_link": show.artists.image_link, "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")}
-    upcoming_shows.append(info)
-  setattr(venue, "upcoming_shows", upcoming_shows)    
-  setattr(venue,"upcoming_shows_count", len(upcoming_shows))
-
-  # get information about past shows
-  past_shows_query = db.session.query(Shows).join(Artist).filter(Shows.venue_id==venue_id).filter(Shows.start_time<today).all()
-  past_shows = []
-  for show in past_shows_query:
-    info = {"artist_name": show.artists.name, "artist_id": show.artists.id, "artist_image_link": show.artists.image_link, "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")}
-    past_shows.append(info)
-  setattr(venue, "past_shows", past_shows)    
-  setattr(venue,"past_shows_count", len(past_shows))
-
+  past_page = request.args.get("past_page", 1, type=int)
+  if past_page < 1:
+    abort(400)
+  venue = venue_detail(venue_id, past_page=past_page, per_page=app.config['PAST_SHOWS_PER_PAGE'])
+  if venue is None or (past_page > 1 and not venue["past_shows"]):
+    abort(404)
   return render_template('pages/show_venue.html', venue=venue)
 
 #  Create Venue
@@ -143,15 +201,18 @@ def create_venue_submission():
       state = form.state.data
       address = form.address.data
       phone = form.phone.data
-      genre = " ".join(form.genres.data)
+      genres = lookup_genres(form.genres.data)
       image_link = form.image_link.data
       facebook_link = form.facebook_link.data
       website_link = form.website_link.data
       seeking_talent = form.seeking_talent.data
       seeking_description = form.seeking_description.data
-      create_venue = Venue(name = name, city = city, state = state, address = address, phone = phone, genre = genre, image_link = image_link, facebook_link = facebook_link, website_link = website_link, seeking_talent = seeking_talent, seeking_description = seeking_description)
+      create_venue = Venue(name = name, city = city, state = state, address = address, phone = phone, genres = genres, image_link = image_link, facebook_link = facebook_link, website_link = website_link, seeking_talent = seeking_talent, seeking_description = seeking_description)
+      gazetteer.locate(create_venue)
       db.session.add(create_venue)
       db.session.commit()
+      suggestions.saved('venue', create_venue.id, name, city, state)
+      cache.invalidate('venues')
       # on successful db insert, flash success
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
@@ -175,9 +236,18 @@ def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   try:
-    venue = Venue.query.get(venue_id)
+    # the delete cascades to the venue's shows, load them up front
+    venue = Venue.query.options(selectinload(Venue.shows), selectinload(Venue.genres)).get(venue_id)
+    artist_ids = set(show.artist_id for show in venue.shows)
+    show_calendar.venue_deleted(venue.id)
     db.session.delete(venue)
+    db.session.flush()
+    counters.refresh(Artist, Artist.id.in_(artist_ids))
+    if artist_ids:
+      jobs.enqueue(invalidate_pages, *['artist:%d' % id for id in sorted(artist_ids)])
     db.session.commit()
+    suggestions.deleted('venue', int(venue_id))
+    cache.invalidate('venues', 'shows', 'venue:%s' % venue_id)
     flash("Venue " + venue.name + " was deleted successfully!")
   except:
       db.session.rollback()
@@ -186,67 +256,51 @@ def delete_venue(venue_id):
   finally:
       db.session.close()
       
-  return render_template('venues.html')
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  return redirect(url_for('index'))
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(artists_version)
+@cache.cached('artists', args=('genre',))
 def artists():
   # TODO: replace with real data returned from querying the database
-  data = db.session.query(Artist.id, Artist.name).all()
+  query = db.session.query(Artist.id, Artist.name)
+  genres = parse_genre_args(request.args.getlist('genre'))
+  if genres:
+    query = query.filter(has_genre(Artist, genres))
+  data = query.all()
   
   return render_template('pages/artists.html', artists=data)
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  search_term = request.form.get("search_term", "")
-  search_results = {}
-  artists = list(Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all())
-  search_results["count"] = len(artists)
-  search_results["data"] = []
-
-  for artist in artists:
-    each_artist = {
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), artist.shows)))
-    }
-    search_results["data"].append(each_artist)
-
-  return render_template('pages/search_artists.html', results=search_results, search_term=search_term)
+  # the navbar form POSTs the first page, "more results" links GET the rest
+  search_term = request.values.get("search_term", "")
+  page = request.args.get("page", 1, type=int)
+  if page < 1:
+    abort(400)
+  genres = parse_genre_args(request.values.getlist('genre'))
+  search_results = search.search_artists(search_term, page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'], genres=genres)
+
+  return render_template('pages/search_artists.html', results=search_results, search_term=search_term, genres=genres)
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_version)
+@cache.cached('artist:{artist_id}', args=('past_page',))
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  artist = Artist.query.get(artist_id)
-  setattr(artist, "genres", artist.genres.split(", "))
-  today = datetime.now()
-
-  # get information about upcoming shows
-  upcoming_shows_query = db.session.query(Shows).join(Venue).filter(Shows.artist_id==artist_id).filter(Shows.start_time>today).all()
-  upcoming_shows = []
-  for show in upcoming_shows_query:
-    info = {"venue_name": show.venues.name, "venue_id": show.venues.id, "venue_image_link": show.venues.image_link, "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")}
-    upcoming_shows.append(info)
-  setattr(artist, "upcoming_shows", upcoming_shows)    
-  setattr(artist,"upcoming_shows_count", len(upcoming_shows))
-
-  # get information about past shows
-  past_shows_query = db.session.query(Shows).join(Venue).filter(Shows.artist_id==artist_id).filter(Shows.start_time<today).all()
-  past_shows = []
-  for show in past_shows_query:
-    info = {"venue_name": show.venues.name, "venue_id": show.venues.id, "venue_image_link": show.venues.image_link, "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")}
-    past_shows.append(info)
-  setattr(artist, "past_shows", past_shows)
-  setattr(artist,"past_shows_count", len(past_shows))
-
+  past_page = request.args.get("past_page", 1, type=int)
+  if past_page < 1:
+    abort(400)
+  artist = artist_detail(artist_id, past_page=past_page, per_page=app.config['PAST_SHOWS_PER_PAGE'])
+  if artist is None or (past_page > 1 and not artist["past_shows"]):
+    abort(404)
   return render_template('pages/show_artist.html', artist=artist)
 
 #  Update
@@ -256,7 +310,7 @@ def edit_artist(artist_id):
   # TODO: populate form with fields from artist with ID <artist_id>
   form = ArtistForm(request.form)
   data = {}
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.options(raiseload(Artist.shows), selectinload(Artist.genres)).get(artist_id)
 
   data = {
     "id": artist.id,
@@ -264,7 +318,7 @@ def edit_artist(artist_id):
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
-    "genres": artist.genres,
+    "genres": [genre.name for genre in artist.genres],
     "facebook_link": artist.facebook_link,
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
@@ -288,21 +342,27 @@ def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
   form = ArtistForm(request.form)
-  edit_artist = Artist.query.get(artist_id)
+  edit_artist = Artist.query.options(raiseload(Artist.shows), selectinload(Artist.genres)).get(artist_id)
   if form.validate():
     try:
       edit_artist.name = form.name.data
       edit_artist.city = form.city.data
       edit_artist.state = form.state.data
       edit_artist.phone = form.phone.data
-      edit_artist.genres = " ".join(form.genres.data)
+      if set(genre.name for genre in edit_artist.genres) != set(form.genres.data):
+        edit_artist.genres = lookup_genres(form.genres.data)
+        # the row itself may not change, keep the ETags honest
+        edit_artist.updated_at = datetime.utcnow()
       edit_artist.image_link = form.image_link.data
       edit_artist.facebook_link = form.facebook_link.data
       edit_artist.website_link = form.website_link.data
       edit_artist.seeking_venue = form.seeking_venue.data
       edit_artist.seeking_description = form.seeking_description.data
       db.session.add(edit_artist)
+      jobs.enqueue(invalidate_artist_venues, artist_id)
       db.session.commit()
+      suggestions.saved('artist', artist_id, form.name.data, form.city.data, form.state.data)
+      cache.invalidate('artists', 'shows', 'artist:%d' % artist_id)
       # on successful db insert, flash success
       flash('Artist ' + request.form['name'] + ' was successfully updated!')
 
@@ -326,7 +386,7 @@ def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id>
   form = VenueForm(request.form)
   data = {}
-  venue = Venue.query.get(venue_id)
+  venue = Venue.query.options(raiseload(Venue.shows), selectinload(Venue.genres)).get(venue_id)
 
   data = {
     "id": venue.id,
@@ -335,7 +395,7 @@ def edit_venue(venue_id):
     "state": venue.state,
     "address": venue.address,
     "phone": venue.phone,
-    "genres": venue.genre,
+    "genres": [genre.name for genre in venue.genres],
     "facebook_link": venue.facebook_link,
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
@@ -360,22 +420,32 @@ def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
   form = VenueForm(request.form)
-  edit_venue = Venue.query.get(venue_id)
+  edit_venue = Venue.query.options(raiseload(Venue.shows), selectinload(Venue.genres)).get(venue_id)
   if form.validate():
     try:
+      moved = (edit_venue.city, edit_venue.state) != (form.city.data, form.state.data)
       edit_venue.name = form.name.data
       edit_venue.city = form.city.data
       edit_venue.state = form.state.data
       edit_venue.phone = form.phone.data
       edit_venue.address = form.address.data
-      edit_venue.genre = " ".join(form.genres.data)
+      gazetteer.locate(edit_venue)
+      if set(genre.name for genre in edit_venue.genres) != set(form.genres.data):
+        edit_venue.genres = lookup_genres(form.genres.data)
+        # the row itself may not change, keep the ETags honest
+        edit_venue.updated_at = datetime.utcnow()
       edit_venue.image_link = form.image_link.data
       edit_venue.facebook_link = form.facebook_link.data
       edit_venue.website_link = form.website_link.data
       edit_venue.seeking_talent = form.seeking_talent.data
       edit_venue.seeking_description = form.seeking_description.data
       db.session.add(edit_venue)
+      if moved:
+        show_calendar.venue_moved(edit_venue)
+      jobs.enqueue(invalidate_venue_artists, venue_id)
       db.session.commit()
+      suggestions.saved('venue', venue_id, form.name.data, form.city.data, form.state.data)
+      cache.invalidate('venues', 'shows', 'venue:%d' % venue_id)
       # on successful db insert, flash success
       flash('Venue ' + request.form['name'] + ' was successfully updated!')
 
@@ -414,7 +484,7 @@ def create_artist_submission():
       city = form.city.data
       state = form.state.data
       phone = form.phone.data
-      genres = " ".join(form.genres.data)
+      genres = lookup_genres(form.genres.data)
       image_link = form.image_link.data
       facebook_link = form.facebook_link.data
       website_link = form.website_link.data
@@ -423,6 +493,8 @@ def create_artist_submission():
       create_artist = Artist(name = name, city = city, state = state, phone = phone, genres = genres, image_link = image_link, facebook_link = facebook_link, website_link = website_link, seeking_venue = seeking_venue, seeking_description = seeking_description)
       db.session.add(create_artist)
       db.session.commit()
+      suggestions.saved('artist', create_artist.id, name, city, state)
+      cache.invalidate('artists')
       # on successful db insert, flash success
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
@@ -440,37 +512,182 @@ def create_artist_submission():
     flash('An error occurred. Artist ' + request.form['name'] +  ' could not be listed. Please check your form data and try again')
   return render_template('pages/home.html')
   
+#  Search
+#  ----------------------------------------------------------------
+
+@app.route('/search/suggest')
+def search_suggest():
+  # typeahead for venues, artists and "City, State" areas, answered from
+  # the in-process prefix index in suggest.py
+  q = request.args.get("q", "")
+  limit = min(max(request.args.get("limit", app.config['SUGGEST_LIMIT'], type=int), 1), 20)
+  return jsonify(suggestions.suggest(q, limit=limit))
+
+@app.route('/_cache/stats')
+@requires_token('OPS_TOKEN')
+def cache_stats():
+  return jsonify(dict(cache.stats(), fragments=fragments.stats()))
+
+@app.route('/_jobs/stats')
+@requires_token('OPS_TOKEN')
+def job_stats():
+  return jsonify(jobs.stats())
+
+@app.route('/_db/pool')
+@requires_token('OPS_TOKEN')
+def pool_stats():
+  return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+@app.route('/_metrics')
+@requires_token('OPS_TOKEN')
+def metrics():
+  # Prometheus scrape target: per-endpoint request/SQL/template totals from
+  # instrument.py, plus the pool wait, response and fragment cache counters,
+  # the background jobs and the startup phases
+  pool = pool_metrics.snapshot(db.engine.pool)
+  extra = [
+    ('fyyur_db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.', [((), pool['checkouts'])]),
+    ('fyyur_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.', [((), pool['wait_total_ms'] / 1000.0)]),
+    ('fyyur_cache_requests_total', 'counter', 'Response cache lookups, by result.',
+     [((('result', 'hit'),), cache.hits), ((('result', 'miss'),), cache.misses)]),
+    ('fyyur_fragment_cache_requests_total', 'counter', 'Template fragment cache lookups, by result.',
+     [((('result', 'hit'),), fragments.hits), ((('result', 'miss'),), fragments.misses)]),
+    ('fyyur_fragment_cache_bytes', 'gauge', 'Size of the cached template fragments.', [((), fragments.stats()['bytes'])]),
+    ('fyyur_jobs_total', 'counter', 'Background job runs of this process, by result.',
+     [((('result', result),), getattr(jobs, result)) for result in ('succeeded', 'retried', 'failed')]),
+    ('fyyur_jobs_pending', 'gauge', 'Jobs of this process waiting or running in its pool.', [((), jobs.pending)]),
+    ('fyyur_startup_seconds', 'gauge', 'Time this process spent starting up, by phase.',
+     [((('phase', name),), seconds) for name, seconds in startup.phases]),
+  ]
+  if jobs.backend == 'database':
+    depth = jobs.depth()
+    extra += [
+      ('fyyur_jobs_queued', 'gauge', 'Jobs in the job table, by status.',
+       [((('status', status),), count) for status, (count, _) in sorted(depth.items())]),
+      ('fyyur_jobs_oldest_seconds', 'gauge', 'Age of the oldest job in the job table, by status.',
+       [((('status', status),), age) for status, (_, age) in sorted(depth.items())]),
+    ]
+  return Response(instrumentation.prometheus(extra), mimetype='text/plain; version=0.0.4')
+
+#  Bulk import / export
+#  ----------------------------------------------------------------
+
+@app.route('/api/import/<kind>', methods=['POST'])
+@requires_token('BULK_IMPORT_TOKEN')
+def bulk_import(kind):
+  # the request body is read and written batch by batch; each batch report
+  # is streamed back as one JSON line as soon as it is committed
+  fmt = request.args.get('format', 'csv')
+  if kind not in bulk.KINDS or fmt not in bulk.FORMATS:
+    abort(404)
+  batch_size = request.args.get('batch_size', app.config['BULK_BATCH_SIZE'], type=int)
+  lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+  reports = bulk.import_rows(kind, lines, fmt, max(batch_size, 1))
+  return Response(stream_with_context(json.dumps(report) + '\n' for report in reports), mimetype='application/x-ndjson')
+
+@app.route('/api/export/<kind>')
+@requires_token('BULK_IMPORT_TOKEN')
+def bulk_export(kind):
+  # whole tables, and a connection held for as long as the client reads
+  fmt = request.args.get('format', 'csv')
+  if kind not in bulk.KINDS or fmt not in bulk.FORMATS:
+    abort(404)
+  mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+  response = Response(stream_with_context(bulk.export_rows(kind, fmt, app.config['BULK_BATCH_SIZE'])), mimetype=mimetype)
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, fmt)
+  return response
+
 #  Shows
 #  ----------------------------------------------------------------
 
+CALENDAR_ARGS = ('from', 'to', 'city', 'state')
+
+def is_calendar():
+  return any(name in request.args for name in CALENDAR_ARGS)
+
+def shows_page_version():
+  if is_calendar():
+    return calendar_version(date.today())
+  return shows_version()
+
 @app.route('/shows')
+@conditional(shows_page_version)
+@cache.cached('shows', args=('after',) + CALENDAR_ARGS)
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  data = []
+  # displays list of shows at /shows, one keyset page at a time; with
+  # from/to/city/state it shows the calendar of those days instead
+  if is_calendar():
+    return calendar()
+  after = request.args.get('after')
+  if after:
+    try:
+      after = decode_show_cursor(after)
+    except ValueError:
+      abort(400)
+  data, next_cursor = show_feed(after=after, limit=app.config['SHOWS_PER_PAGE'])
+  return render_template("pages/shows.html", shows=data, next_cursor=next_cursor)
+
+def calendar():
+  # ?from=&to= are dates (default: the coming week), ?city= matches the
+  # venue city case-insensitively, ?state= the two-letter state
   try:
-    shows = Shows.query.all()
+    start = dates.parse(request.args['from']).date() if request.args.get('from') else date.today()
+    end = dates.parse(request.args['to']).date() if request.args.get('to') else start + timedelta(days=6)
+  except (ValueError, OverflowError):
+    abort(400)
+  if end < start or (end - start).days >= app.config['SHOW_CALENDAR_MAX_DAYS']:
+    abort(400)
+  city = request.args.get('city', '').strip()
+  state = request.args.get('state', '').strip()
+  days = calendar_days(start, end, city=city or None, state=state or None)
+  return render_template('pages/show_calendar.html', days=days, start=start, end=end, city=city, state=state)
+
+@app.route('/api/shows')
+def api_shows():
+  # streams every matching show as NDJSON (default) or, with format=json, as
+  # one JSON array sent in chunks; the first rows go out while the rest are
+  # still being fetched
+  args = request.args
+  fmt = args.get('format', 'ndjson')
+  if fmt not in ('ndjson', 'json'):
+    abort(400)
+  # a filter that doesn't parse is an error, not a request for every show
+  try:
+    start = dates.parse(args['from']) if args.get('from') else None
+    end = dates.parse(args['to']) if args.get('to') else None
+    venue_id = int(args['venue_id']) if args.get('venue_id') else None
+    artist_id = int(args['artist_id']) if args.get('artist_id') else None
+  except (ValueError, OverflowError):
+    abort(400)
+  shows = show_stream(
+    venue_id=venue_id,
+    artist_id=artist_id,
+    city=args.get('city'),
+    state=args.get('state'),
+    start=start,
+    end=end,
+    genres=parse_genre_args(args.getlist('genre')),
+    batch_size=app.config['API_SHOWS_BATCH_SIZE'],
+  )
+
+  def chunks():
+    buffer = []
+    first = True
+    if fmt == 'json':
+      yield '['
     for show in shows:
-      venue_id = show.venue_id
-      artist_id = show.artist_id
-      artist = Artist.query.get(artist_id)
-
-      layout_shows = {
-          "venue_id": venue_id,
-          "venue_name": Venue.query.get(venue_id).name,
-          "artist_id": artist_id,
-          "artist_name": artist.name,
-          "artist_image_link": artist.image_link,
-          "start_time": str(show.start_time),
-      }
-      data.append(layout_shows)
-
-  except:
-    db.session.rollback()
-    print(sys.exc_info())
-
-  finally:
-    return render_template("pages/shows.html", shows=data)
+      if fmt == 'json':
+        buffer.append(('' if first else ',') + json.dumps(show))
+        first = False
+      else:
+        buffer.append(json.dumps(show) + '\n')
+      if len(buffer) == 100:
+        yield ''.join(buffer)
+        buffer = []
+    yield ''.join(buffer) + (']' if fmt == 'json' else '')
+
+  mimetype = 'application/json' if fmt == 'json' else 'application/x-ndjson'
+  return Response(stream_with_context(chunks()), mimetype=mimetype)
 
 @app.route('/shows/create')
 def create_shows():
@@ -491,7 +708,10 @@ def create_show_submission():
         start_time=form.start_time.data
         )
       db.session.add(new_show)
+      counters.show_added(new_show)
+      show_calendar.show_added(new_show)
       db.session.commit()
+      cache.invalidate('shows', 'venues', 'venue:%d' % int(form.venue_id.data), 'artist:%d' % int(form.artist_id.data))
       # on successful db insert, flash success
       flash('Show was successfully listed!')
 
@@ -526,6 +746,12 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+startup.mark('routes')
+
+# compile templates, open a connection etc. before serving, see warmup.py
+if app.config['WARMUP']:
+  warm(app)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
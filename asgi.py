@@ -0,0 +1,201 @@
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+
+# Optional async serving mode, e.g.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The read pages in ASYNC_ENDPOINTS run on the event loop over an async
+# engine (asyncpg for Postgres, aiosqlite for SQLite). They are the same
+# Flask views app.py serves: each request runs in a greenlet through
+# AsyncSession.run_sync with db.session bound to that async session, so
+# every statement hands the loop back while the database works. ETags,
+# the response cache and the instrumentation behave as under WSGI. A
+# process keeps thousands of slow clients and queued requests open
+# without a thread each; at most ASYNC_DB_POOL_SIZE (+ DB_MAX_OVERFLOW)
+# queries are in flight and the rest wait for a connection on the loop.
+#
+# Binding the session is not a Flask-SQLAlchemy feature: bind_session sets
+# the entry of db.session's scoped_session registry for the current app
+# context, which relies on how Flask-SQLAlchemy 3.0 scopes its session
+# (hence the pin in requirements.txt). AsyncApp checks for that registry
+# on start-up and tests/test_asgi.py serves pages through this module, so
+# an upgrade that changes it fails there instead of in production.
+#
+# Every other route (forms, writes, the streaming APIs) goes to the WSGI
+# app on asgiref's thread pool and works exactly as under a WSGI server.
+# Read replicas are not used in this mode. `python app.py` and WSGI
+# servers keep serving the sync app unchanged.
+#
+# Needs asgiref, an ASGI server such as uvicorn, and the async driver.
+
+import contextvars
+import io
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.util import ScopedRegistry
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from app import app
+from models import db
+
+ASYNC_ENDPOINTS = frozenset([
+  'venues', 'artists', 'shows', 'show_venue', 'show_artist', 'search_venues', 'search_artists', 'venues_nearby',
+])
+ASYNC_DRIVERS = {
+  'postgresql': 'postgresql+asyncpg',
+  'sqlite': 'sqlite+aiosqlite',
+}
+
+# the sync facade of the request's AsyncSession, see bind_session
+_session = contextvars.ContextVar('fyyur_async_session', default=None)
+
+
+def async_url(uri):
+  url = make_url(uri)
+  backend = url.get_backend_name()
+  if backend not in ASYNC_DRIVERS:
+    raise ValueError('no async driver for %s databases' % backend)
+  return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def async_engine_options(config):
+  # engine.engine_options, minus the custom pool classes, which are sync
+  url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+  options = {"pool_pre_ping": config['DB_POOL_PRE_PING']}
+  if url.database in (None, '', ':memory:'):
+    # in-memory SQLite is a single shared connection
+    return options
+  options.update(
+    pool_size=config['ASYNC_DB_POOL_SIZE'],
+    max_overflow=config['DB_MAX_OVERFLOW'],
+    pool_timeout=config['DB_POOL_TIMEOUT'],
+    pool_recycle=config['DB_POOL_RECYCLE'],
+  )
+  timeout = config['DB_STATEMENT_TIMEOUT_MS']
+  if url.get_backend_name() == 'postgresql' and timeout and not config['DB_PGBOUNCER']:
+    options["connect_args"] = {"server_settings": {"statement_timeout": str(timeout)}}
+  return options
+
+
+def check_session_registry():
+  # bind_session replaces the session in Flask-SQLAlchemy's registry
+  registry = getattr(db.session, 'registry', None)
+  if not isinstance(registry, ScopedRegistry):
+    raise RuntimeError('asgi.py needs db.session to be a scoped_session keyed by app context '
+                       '(Flask-SQLAlchemy 3.0, see requirements.txt), got %r' % (db.session,))
+
+def bind_session():
+  # before_request: inside AsyncApp, db.session is the async session
+  session = _session.get()
+  if session is not None:
+    db.session.registry.set(session)
+
+
+def path_info(scope):
+  script_name, path = scope.get('root_path', ''), scope['path']
+  if script_name and path.startswith(script_name):
+    return path[len(script_name):]
+  return path
+
+def environ_for(scope, body):
+  script_name = scope.get('root_path', '')
+  path = path_info(scope)
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+    'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope['query_string'].decode('latin-1'),
+    'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name = name.decode('latin-1').upper().replace('-', '_')
+    if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+      name = 'HTTP_' + name
+    value = value.decode('latin-1')
+    environ[name] = environ[name] + ',' + value if name in environ else value
+  return environ
+
+
+class AsyncApp(object):
+
+  def __init__(self, app):
+    self.app = app
+    check_session_registry()
+    self.wsgi = WsgiToAsgi(app)
+    self.engine = create_async_engine(async_url(app.config['SQLALCHEMY_DATABASE_URI']), **async_engine_options(app.config))
+    self.sessions = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+    app.before_request(bind_session)
+
+  def is_async(self, scope):
+    if scope['method'] not in ('GET', 'HEAD', 'POST'):
+      return False
+    try:
+      endpoint, _ = self.app.url_map.bind('localhost').match(path_info(scope), method=scope['method'])
+    except (HTTPException, RequestRedirect):
+      return False
+    return endpoint in ASYNC_ENDPOINTS
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return await self.lifespan(receive, send)
+    if scope['type'] != 'http' or not self.is_async(scope):
+      return await self.wsgi(scope, receive, send)
+
+    chunks = []
+    while True:
+      message = await receive()
+      if message['type'] == 'http.disconnect':
+        return
+      chunks.append(message.get('body', b''))
+      if not message.get('more_body'):
+        break
+    async with self.sessions() as session:
+      status, headers, body = await session.run_sync(self.call_view, environ_for(scope, b''.join(chunks)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+  def call_view(self, session, environ):
+    # runs in the greenlet: the whole Flask request, with db.session bound
+    response = []
+    def start_response(status, headers, exc_info=None):
+      response[:] = [int(status.split(' ', 1)[0]),
+                     [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+    token = _session.set(session)
+    try:
+      result = self.app(environ, start_response)
+      try:
+        body = b''.join(result)
+      finally:
+        if hasattr(result, 'close'):
+          result.close()
+    finally:
+      _session.reset(token)
+    return response[0], response[1], body
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        await self.engine.dispose()
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+
+application = AsyncApp(app)
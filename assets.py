@@ -0,0 +1,233 @@
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# Build step and helpers for the files under static/:
+#
+#     flask assets build [--clean]
+#
+# concatenates each of BUNDLES into one minified file, copies every other
+# static file, names each output after a hash of its content and writes
+# them to static/build/ with a manifest.json mapping the logical names to
+# the built ones. Text files are also pre-compressed next to the original
+# (.gz, plus .br when the brotli package is installed). url() references
+# in the bundled CSS are rewritten to the built names.
+#
+# Templates link assets through the helpers this registers:
+#
+#     {{ static_url('img/front-splash.jpg') }}
+#     {% for url in bundle_urls('main.css') %} ... {% endfor %}
+#
+# Once the manifest exists, static_url gives the fingerprinted file and a
+# bundle is its one built file; without it (a fresh checkout) they fall
+# back to the source files. Built files never change under their name, so
+# they are served with a year-long immutable Cache-Control, and the
+# .br/.gz variant the client accepts is sent instead of the original.
+# Builds add files without removing older ones, so pages cached before a
+# deploy keep working; --clean starts from an empty directory.
+#
+# Minifying JS needs the rjsmin package; without it the bundles are
+# concatenated (the libraries are minified already).
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+BUNDLES = {
+  'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css', 'css/main.quickfix.css'],
+  # blocking scripts in <head>
+  'head.js': ['js/libs/modernizr-2.8.2.min.js'],
+  # deferred scripts, in execution order
+  'app.js': ['js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/libs/moment.min.js', 'js/plugins.js', 'js/script.js'],
+}
+BUILD_DIR = 'build'
+COMPRESSIBLE = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.eot', '.otf', '.ttf', '.ico')
+# pre-compressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_TOKENS = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|/\*.*?\*/|\s+', re.S)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+URL_PARTS = re.compile(r'([^?#]*)(?:([?#])(.*))?$', re.S)
+
+
+#  Build
+#  ----------------------------------------------------------------
+
+def minify_css(text):
+  # drops comments and collapses whitespace outside of strings; a space
+  # before ':' is kept, it is significant in selectors ("a :hover")
+  def token(match):
+    if match.group(1):
+      return match.group(1)
+    return '' if match.group(0).startswith('/*') else ' '
+  parts = re.split(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')', CSS_TOKENS.sub(token, text))
+  for i in range(0, len(parts), 2):
+    parts[i] = CSS_PUNCTUATION.sub(r'\1\2', parts[i]).replace(';}', '}')
+  return ''.join(parts).strip()
+
+def minify_js(text):
+  try:
+    import rjsmin
+  except ImportError:
+    return text
+  return rjsmin.jsmin(text)
+
+def fingerprint(name, data):
+  # css/main.css -> css/main.1a2b3c4d5e.css
+  root, ext = posixpath.splitext(name)
+  return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:10], ext)
+
+def compress(path, data, brotli):
+  # writes path.gz / path.br where it saves at least a tenth
+  if not path.endswith(COMPRESSIBLE):
+    return
+  variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+  if brotli is not None:
+    variants.append(('.br', brotli.compress(data)))
+  for suffix, compressed in variants:
+    if len(compressed) < len(data) * 0.9:
+      with open(path + suffix, 'wb') as f:
+        f.write(compressed)
+
+def rewrite_urls(css, source, target, manifest):
+  # url(...) in source (a static/ name) -> relative to target, built names
+  def replace(match):
+    url = match.group(2)
+    if ':' in url or url.startswith(('/', '#', 'data:')):
+      return match.group(0)
+    path, sep, suffix = URL_PARTS.match(url).groups(default='')
+    name = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    built = posixpath.relpath(manifest.get(name, name), posixpath.dirname(target))
+    return 'url("%s%s%s")' % (built, sep, suffix)
+  return CSS_URL.sub(replace, css)
+
+def source_files(static_folder):
+  for directory, dirs, files in os.walk(static_folder):
+    relative = os.path.relpath(directory, static_folder)
+    if relative == BUILD_DIR:
+      dirs[:] = []
+      continue
+    for filename in files:
+      if not filename.startswith('.'):
+        yield posixpath.normpath(posixpath.join(relative.replace(os.sep, '/'), filename))
+
+def build(static_folder, clean=False):
+  # builds static/build/ and its manifest.json, returns the manifest
+  try:
+    import brotli
+  except ImportError:
+    brotli = None
+  out = os.path.join(static_folder, BUILD_DIR)
+  if clean:
+    shutil.rmtree(out, ignore_errors=True)
+  manifest = {}
+
+  def write(name, data):
+    built = fingerprint(name, data)
+    path = os.path.join(out, built)
+    if not os.path.exists(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'wb') as f:
+        f.write(data)
+      compress(path, data, brotli)
+    manifest[name] = posixpath.join(BUILD_DIR, built)
+
+  for name in sorted(source_files(static_folder)):
+    with open(os.path.join(static_folder, name), 'rb') as f:
+      write(name, f.read())
+  for bundle, sources in sorted(BUNDLES.items()):
+    parts = []
+    for source in sources:
+      with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+        text = f.read()
+      if bundle.endswith('.css'):
+        parts.append(minify_css(rewrite_urls(text, source, posixpath.join(BUILD_DIR, bundle), manifest)))
+      else:
+        parts.append(text if source.endswith('.min.js') else minify_js(text))
+    # ';' keeps concatenated scripts apart
+    write(bundle, ('\n' if bundle.endswith('.css') else ';\n').join(parts).encode('utf-8'))
+
+  with open(os.path.join(out, 'manifest.json'), 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  return manifest
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+class Assets(object):
+
+  def __init__(self):
+    self.manifest = {}
+    self.built = set()
+    self.max_age = 365 * 24 * 3600
+
+  def init_app(self, app):
+    self.max_age = app.config.get('ASSETS_MAX_AGE', self.max_age)
+    self.load(app)
+    app.jinja_env.globals.update(static_url=static_url, bundle_urls=bundle_urls)
+    app.view_functions['static'] = send_static
+
+  def load(self, app):
+    path = os.path.join(app.static_folder, BUILD_DIR, 'manifest.json')
+    try:
+      with open(path) as f:
+        self.manifest = json.load(f)
+    except FileNotFoundError:
+      self.manifest = {}
+    self.built = set(self.manifest.values())
+
+  def url(self, name):
+    return url_for('static', filename=self.manifest.get(name, name))
+
+  def bundle(self, name):
+    if name in self.manifest:
+      return [self.url(name)]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+assets = Assets()
+
+def static_url(name):
+  return assets.url(name)
+
+def bundle_urls(name):
+  return assets.bundle(name)
+
+def send_static(filename):
+  # the static endpoint: built files are immutable and sent pre-compressed
+  if filename not in assets.built:
+    return current_app.send_static_file(filename)
+  folder = current_app.static_folder
+  mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+  for encoding, suffix in ENCODINGS:
+    if encoding in request.accept_encodings and os.path.exists(os.path.join(folder, filename + suffix)):
+      response = send_from_directory(folder, filename + suffix, mimetype=mimetype, max_age=assets.max_age)
+      response.content_encoding = encoding
+      break
+  else:
+    response = send_from_directory(folder, filename, max_age=assets.max_age)
+  response.vary.add('Accept-Encoding')
+  response.cache_control.public = True
+  response.cache_control.immutable = True
+  return response
+
+
+assets_cli = AppGroup('assets', help='Build the static assets.')
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Remove earlier builds first.')
+def build_command(clean):
+  """Bundle, minify, fingerprint and pre-compress static/ into static/build/."""
+  manifest = build(current_app.static_folder, clean=clean)
+  assets.load(current_app)
+  click.echo('%d files, %d bundles' % (len(manifest), len(BUNDLES)))
@@ -0,0 +1,54 @@
+#----------------------------------------------------------------------------#
+# Static asset benchmark.
+#----------------------------------------------------------------------------#
+
+# Page weight of the stylesheets and scripts a page links, served from the
+# source files (no build, as before the asset pipeline) and from the build
+# `flask assets build` writes, uncompressed, gzip and brotli. The repeat
+# view counts what a browser with a warm cache still requests: source files
+# are revalidated one by one, built files are immutable and not requested.
+# The build is written to static/build/ first. No database is needed.
+#
+#   python -m benchmarks.assets [path]
+
+import re
+import sys
+from benchmarks.common import bench_app
+
+LINKED = re.compile(r'<(?:link[^>]+href|script[^>]+src)="(/static/[^"]+\.(?:css|js))"')
+
+
+def weigh(client, path, encoding):
+  html = client.get(path).get_data(as_text=True)
+  urls = LINKED.findall(html)
+  total = 0
+  revalidated = 0
+  for url in urls:
+    response = client.get(url, headers={'Accept-Encoding': encoding} if encoding else {})
+    total += len(response.get_data())
+    cache_control = response.headers.get('Cache-Control', '')
+    if 'immutable' not in cache_control:
+      revalidated += 1
+  return len(urls), total, revalidated
+
+
+def main(path):
+  app = bench_app()
+  import assets
+  client = app.test_client()
+  with app.app_context():
+    assets.build(app.static_folder)
+  for label, use_build in (('source', False), ('build', True)):
+    if use_build:
+      assets.assets.load(app)
+    else:
+      assets.assets.manifest, assets.assets.built = {}, set()
+    for encoding in ('', 'gzip', 'br'):
+      requests, total, revalidated = weigh(client, path, encoding)
+      print(f"{label:<7} {encoding or 'identity':<9} requests={requests:>2}  bytes={total:>8}"
+            f"  repeat view requests={revalidated:>2}")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else '/'))
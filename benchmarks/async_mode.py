@@ -0,0 +1,170 @@
+#----------------------------------------------------------------------------#
+# Sync vs async serving benchmark.
+#----------------------------------------------------------------------------#
+
+# Serves the same seeded database twice from a separate process: the WSGI
+# app on a werkzeug server with a fixed pool of --threads worker threads
+# (like a threaded WSGI worker), then asgi.application on uvicorn. Each is
+# hit by growing numbers of concurrent slow clients that pause --client-delay
+# seconds half way through sending their request, and the read pages'
+# throughput and latency percentiles are printed side by side. On SQLite
+# every statement is delayed by --db-latency to stand in for the network
+# round trip to Postgres; with BENCH_DATABASE_URL the real one is measured.
+#
+#   python -m benchmarks.async_mode [--concurrency 10 100 1000]
+#
+# Needs uvicorn, asgiref and the async driver (aiosqlite or asyncpg).
+
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import bench_app, percentile, reset_db, seed
+
+PATHS = ['/venues/%d', '/artists/%d', '/shows', '/venues/search?search_term=venue+%d', '/artists/search?search_term=artist+%d']
+
+
+def serve(mode, database_uri, port, threads, db_latency):
+  # runs in the server process
+  import logging
+  from sqlalchemy import event
+  from sqlalchemy.engine import Engine
+  app = bench_app(database_uri)
+  logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+  @event.listens_for(Engine, 'connect')
+  def add_latency(dbapi_connection, connection_record):
+    # every SQLite statement sleeps db_latency seconds in the thread running
+    # it (aiosqlite's own thread in async mode), like a database round trip
+    if not db_latency or not database_uri.startswith('sqlite'):
+      return
+    delay = lambda statement: time.sleep(db_latency)
+    driver_connection = getattr(dbapi_connection, 'driver_connection', dbapi_connection)
+    if hasattr(dbapi_connection, 'await_'):
+      dbapi_connection.await_(driver_connection.set_trace_callback(delay))
+    else:
+      driver_connection.set_trace_callback(delay)
+  if mode == 'async':
+    import uvicorn
+    from asgi import application
+    uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+    return
+
+  from werkzeug.serving import BaseWSGIServer
+
+  class PooledWSGIServer(BaseWSGIServer):
+    # a werkzeug server that handles connections on a fixed thread pool
+    request_queue_size = 4096
+
+    def __init__(self, *args, **kwargs):
+      super(PooledWSGIServer, self).__init__(*args, **kwargs)
+      self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+      self.pool.submit(self.handle_connection, request, client_address)
+
+    def handle_connection(self, request, client_address):
+      try:
+        self.finish_request(request, client_address)
+      except Exception:
+        self.handle_error(request, client_address)
+      finally:
+        self.shutdown_request(request)
+
+  PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+def wait_for(port, timeout=30):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return
+    except OSError:
+      time.sleep(0.1)
+  raise RuntimeError('server on port %d did not start' % port)
+
+
+async def fetch(port, path, delay):
+  # (status, ms); the request is sent in two halves, delay seconds apart
+  start = time.perf_counter()
+  try:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('GET %s HTTP/1.1\r\nHost: 127.0.0.1:%d\r\n' % (path, port)).encode())
+    await writer.drain()
+    if delay:
+      await asyncio.sleep(delay)
+    writer.write(b'Connection: close\r\n\r\n')
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    status = int(data.split(b' ', 2)[1]) if data else 0
+  except OSError:
+    status = 0
+  return status, (time.perf_counter() - start) * 1000
+
+async def load(port, concurrency, requests, delay, num_venues):
+  async def client(n):
+    results = []
+    for k in range(requests):
+      path = PATHS[(n + k) % len(PATHS)]
+      results.append(await fetch(port, path % ((n + k) % num_venues + 1) if '%d' in path else path, delay))
+    return results
+  start = time.perf_counter()
+  results = await asyncio.gather(*[client(n) for n in range(concurrency)])
+  return [result for client_results in results for result in client_results], time.perf_counter() - start
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.async_mode', description='Compare the sync and async serving modes.')
+  parser.add_argument('--venues', type=int, default=500, help='venues to seed (default 500)')
+  parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000], help='concurrent clients (default 10 100 1000)')
+  parser.add_argument('--requests', type=int, default=5, help='requests per client (default 5)')
+  parser.add_argument('--client-delay', type=float, default=0.1, help='seconds each client stalls mid-request (default 0.1)')
+  parser.add_argument('--db-latency', type=float, default=20.0, help='ms added to every SQLite statement (default 20)')
+  parser.add_argument('--threads', type=int, default=16, help='worker threads of the sync server (default 16)')
+  args = parser.parse_args(argv)
+
+  # one socket per client
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, max(args.concurrency) * 2 + 256)), hard))
+
+  app = bench_app()
+  database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+  from models import db
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, args.venues))
+    db.engine.dispose()
+
+  context = multiprocessing.get_context('spawn')
+  for mode in ('sync', 'async'):
+    port = free_port()
+    server = context.Process(target=serve, args=(mode, database_uri, port, args.threads, args.db_latency / 1000.0), daemon=True)
+    server.start()
+    try:
+      wait_for(port)
+      for concurrency in args.concurrency:
+        results, elapsed = asyncio.run(load(port, concurrency, args.requests, args.client_delay, args.venues // 2))
+        ok = [ms for status, ms in results if status == 200]
+        errors = len(results) - len(ok)
+        ok = ok or [0.0]
+        print(f"{mode:<5} clients={concurrency:>5}  {len(results) / elapsed:8.1f} req/s  p50={percentile(ok, 50):8.2f}ms"
+              f"  p95={percentile(ok, 95):8.2f}ms  p99={percentile(ok, 99):8.2f}ms  errors={errors}")
+    finally:
+      server.terminate()
+      server.join()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
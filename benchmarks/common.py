@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Benchmark helpers.
+#----------------------------------------------------------------------------#
+
+# Shared setup for the scripts in this package: point the app at a scratch
+# database, seed synthetic venues/artists/shows and count the statements a
+# request issues. Run the scripts from the repository root, e.g.
+#
+#   python -m benchmarks.venues_listing
+#
+# BENCH_DATABASE_URL selects the database (defaults to a throwaway SQLite
+# file). The tables are dropped and re-created, never point it at real data.
+
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import config
+
+CITIES = [
+  ("San Francisco", "CA"), ("Los Angeles", "CA"), ("New York", "NY"),
+  ("Austin", "TX"), ("Seattle", "WA"), ("Chicago", "IL"), ("Boston", "MA"),
+  ("Denver", "CO"), ("Portland", "OR"), ("Nashville", "TN"),
+]
+
+
+def bench_app(database_uri=None):
+  # app.py reads config at import time, so the URI is swapped before import
+  database_uri = database_uri or os.environ.get('BENCH_DATABASE_URL')
+  if not database_uri:
+    database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+  config.SQLALCHEMY_DATABASE_URI = database_uri
+  # any implicit lazy load during a benchmark is an N+1 regression
+  config.RAISE_ON_LAZY_LOAD = True
+  # measure the pages themselves, not the response cache
+  config.CACHE_BACKEND = os.environ.get('BENCH_CACHE_BACKEND') or None
+  # every query goes to the scratch database
+  config.DB_REPLICA_URLS = []
+  # follow-up jobs run within the request that enqueued them, so their
+  # statements are counted with it
+  config.JOBS_BACKEND = os.environ.get('BENCH_JOBS_BACKEND') or 'inline'
+  from app import app
+  app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+  app.config['WTF_CSRF_ENABLED'] = False
+  return app
+
+
+def reset_db(db):
+  db.drop_all()
+  if db.engine.dialect.name == 'postgresql':
+    with db.engine.begin() as conn:
+      conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+  db.create_all()
+
+
+def seed(db, num_venues, num_artists=None, shows_per_venue=5, seed_value=0):
+  # bulk executemany inserts; much faster than going through the ORM
+  from models import Venue, Artist, Shows, Genre, venue_genre, artist_genre
+  from genres import seed_genres
+  from geo import gazetteer, geohash
+  import counters
+  import show_calendar
+  rng = random.Random(seed_value)
+  num_artists = num_artists or max(1, num_venues // 2)
+  now = datetime.now()
+
+  venues = []
+  for i in range(1, num_venues + 1):
+    city, state = CITIES[i % len(CITIES)]
+    # scattered up to ~50km around the city centre
+    lat, lng = gazetteer.lookup(city, state)
+    lat, lng = lat + rng.uniform(-0.45, 0.45), lng + rng.uniform(-0.45, 0.45)
+    venues.append({"id": i, "name": f"Venue {i}", "city": city, "state": state,
+                   "address": f"{i} Main St", "latitude": lat, "longitude": lng, "geohash": geohash(lat, lng),
+                   "image_link": f"https://example.com/venue/{i}.jpg", "seeking_talent": bool(i % 2)})
+  artists = []
+  for i in range(1, num_artists + 1):
+    city, state = CITIES[i % len(CITIES)]
+    artists.append({"id": i, "name": f"Artist {i}", "city": city, "state": state,
+                    "image_link": f"https://example.com/artist/{i}.jpg", "seeking_venue": bool(i % 2)})
+  shows = []
+  for venue_id in range(1, num_venues + 1):
+    for _ in range(shows_per_venue):
+      shows.append({"venue_id": venue_id, "artist_id": rng.randint(1, num_artists),
+                    "start_time": now + timedelta(days=rng.randint(-365, 365), minutes=rng.randint(0, 1439))})
+
+  seed_genres()
+  genre_ids = [id for id, in db.session.query(Genre.id).order_by(Genre.id)]
+  # two genres each, spread evenly over the seeded list
+  venue_genres = [{"venue_id": venue["id"], "genre_id": genre_ids[(venue["id"] + k) % len(genre_ids)]}
+                  for venue in venues for k in (0, 7)]
+  artist_genres = [{"artist_id": artist["id"], "genre_id": genre_ids[(artist["id"] + k) % len(genre_ids)]}
+                   for artist in artists for k in (0, 7)]
+
+  for table, rows in ((Venue.__table__, venues), (Artist.__table__, artists), (Shows.__table__, shows),
+                      (venue_genre, venue_genres), (artist_genre, artist_genres)):
+    for start in range(0, len(rows), 10000):
+      db.session.execute(table.insert(), rows[start:start + 10000])
+  counters.rebuild(now)
+  show_calendar.refresh()
+  db.session.commit()
+  return {"venues": len(venues), "artists": len(artists), "shows": len(shows)}
+
+
+class QueryCounter(object):
+  # counts statements sent to the engine while the block is active
+
+  def __init__(self, engine):
+    self.engine = engine
+    self.count = 0
+    self.statements = []
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    self.count += 1
+    self.statements.append(statement)
+
+  def __enter__(self):
+    event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+    return self
+
+  def __exit__(self, *exc):
+    event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+    return False
+
+
+def percentile(samples, pct):
+  samples = sorted(samples)
+  return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def timed_get(client, db, url, repeat=5):
+  # (status, best wall time in ms, statements per request)
+  best = None
+  for _ in range(repeat):
+    with QueryCounter(db.engine) as counter:
+      start = time.perf_counter()
+      response = client.get(url)
+      elapsed = (time.perf_counter() - start) * 1000
+    best = elapsed if best is None else min(best, elapsed)
+  return response.status_code, best, counter.count
@@ -0,0 +1,72 @@
+#----------------------------------------------------------------------------#
+# `datetime` filter benchmark.
+#----------------------------------------------------------------------------#
+
+# Renders a list of show times through the `datetime` Jinja filter and
+# compares the old path (route stringifies, filter re-parses with dateutil
+# and calls babel.dates.format_datetime) with the dates.py filter, with and
+# without the memo. No database is needed.
+#
+#   python -m benchmarks.datetime_filter [number of rows]
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+from jinja2 import Environment
+import dates
+
+TEMPLATE = "{% for show in shows %}<h4>{{ show.start_time|datetime('full') }}</h4>{% endfor %}"
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+
+def render(filter, shows, repeat=3):
+  env = Environment()
+  env.filters['datetime'] = filter
+  template = env.from_string(TEMPLATE)
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    html = template.render(shows=shows)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best, html
+
+
+def main(rows):
+  rng = random.Random(0)
+  now = datetime(2030, 1, 1, 20, 0)
+  times = [now + timedelta(days=rng.randint(-365, 365), minutes=rng.randrange(0, 1440, 30)) for _ in range(rows)]
+  as_strings = [{"start_time": str(t)} for t in times]
+  as_datetimes = [{"start_time": t} for t in times]
+
+  legacy, expected = render(legacy_format_datetime, as_strings)
+  dates.set_cache_size(0)
+  uncached, html = render(dates.format_datetime, as_datetimes)
+  assert html == expected
+  # sized to hold every distinct time; an LRU smaller than the working set
+  # misses on every row of a repeated in-order render
+  dates.set_cache_size(rows)
+  cold, html = render(dates.format_datetime, as_datetimes, repeat=1)
+  warm, html = render(dates.format_datetime, as_datetimes)
+  assert html == expected
+
+  print(f"{rows} rows, {len(set(times))} distinct times")
+  print(f"  str + dateutil + babel  {legacy * 1000:8.1f}ms")
+  print(f"  precompiled, no memo    {uncached * 1000:8.1f}ms")
+  print(f"  memo, cold              {cold * 1000:8.1f}ms")
+  print(f"  memo, warm              {warm * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,71 @@
+#----------------------------------------------------------------------------#
+# Fragment cache benchmark.
+#----------------------------------------------------------------------------#
+
+# Renders the listing and detail pages with the {% cache %} fragments
+# disabled, cold and warm, and once more after a single show changed, when
+# only that show's tiles should render again. The response cache is off,
+# so every request runs its view and template; times are the template
+# rendering time from the Server-Timing header (best of five, except for
+# the single cold and changed renders).
+#
+#   python -m benchmarks.fragments [--venues 200] [--per-page 100]
+
+import argparse
+import re
+import sys
+from datetime import datetime
+from benchmarks.common import bench_app, reset_db, seed
+
+
+def template_ms(client, path, repeat=1):
+  # (status, best tpl duration of the Server-Timing header)
+  best = None
+  for _ in range(repeat):
+    response = client.get(path)
+    ms = float(re.search(r'tpl;dur=([0-9.]+)', response.headers['Server-Timing']).group(1))
+    best = ms if best is None else min(best, ms)
+  return response.status_code, best
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.fragments', description='Measure the template fragment cache.')
+  parser.add_argument('--venues', type=int, default=200, help='venues to seed (default 200)')
+  parser.add_argument('--shows-per-venue', type=int, default=50, help='shows per venue (default 50)')
+  parser.add_argument('--per-page', type=int, default=100, help='shows per page on /shows and the detail pages (default 100)')
+  args = parser.parse_args(argv)
+
+  app = bench_app()
+  app.config['SHOWS_PER_PAGE'] = args.per_page
+  app.config['PAST_SHOWS_PER_PAGE'] = args.per_page
+  from fragments import fragments
+  from models import db, Shows
+  client = app.test_client()
+  paths = ['/shows', '/venues', '/venues/1', '/artists/1']
+  max_entries = fragments.max_entries
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, args.venues, shows_per_venue=args.shows_per_venue))
+    for path in paths:
+      fragments.max_entries = 0
+      _, off = template_ms(client, path, repeat=5)
+      fragments.max_entries = max_entries
+      fragments.clear()
+      _, cold = template_ms(client, path)
+      status, warm = template_ms(client, path, repeat=5)
+
+      # touch one show on the page, as editing it would
+      show_id = db.session.query(Shows.id).filter(Shows.venue_id == 1).order_by(Shows.start_time).limit(1).scalar() \
+        if path != '/shows' else db.session.query(Shows.id).order_by(Shows.start_time, Shows.id).limit(1).scalar()
+      db.session.query(Shows).filter(Shows.id == show_id).update({Shows.updated_at: datetime.utcnow()})
+      db.session.commit()
+      stale = fragments.stale
+      _, changed = template_ms(client, path)
+      print(f"{path:<12} {status}  off={off:8.2f}ms  cold={cold:8.2f}ms  warm={warm:8.2f}ms"
+            f"  one show changed={changed:8.2f}ms ({fragments.stale - stale} fragments re-rendered)")
+  print("stats", fragments.stats())
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
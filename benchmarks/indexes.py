@@ -0,0 +1,94 @@
+#----------------------------------------------------------------------------#
+# Index benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds a large dataset, then runs the hot query shapes with the indexes
+# declared on the models dropped ("before") and re-created ("after"),
+# printing the query plan and the best-of-N latency of each.
+#
+#   python -m benchmarks.indexes [number of venues]
+
+import sys
+import time
+from datetime import datetime
+from benchmarks.common import bench_app, reset_db, seed
+
+
+def explain(db, query):
+  compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+  params = compiled.construct_params()
+  if compiled.positional:
+    params = tuple(params[name] for name in compiled.positiontup)
+  prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+  with db.engine.connect() as conn:
+    rows = conn.exec_driver_sql(prefix + str(compiled), params).fetchall()
+  return [str(row[-1]) for row in rows]
+
+
+def best_ms(query, repeat=5):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    query.all()
+    elapsed = (time.perf_counter() - start) * 1000
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def hot_queries(db, now):
+  from models import Artist, Venue, Shows
+  from genres import has_genre
+  venue_id = artist_id = 42
+  return [
+    ("venue detail, upcoming shows",
+     db.session.query(Shows.id, Artist.name).join(Artist, Artist.id == Shows.artist_id)
+       .filter(Shows.venue_id == venue_id, Shows.start_time > now)),
+    ("artist detail, past shows",
+     db.session.query(Shows.id, Venue.name).join(Venue, Venue.id == Shows.venue_id)
+       .filter(Shows.artist_id == artist_id, Shows.start_time < now)),
+    ("venues in one area",
+     db.session.query(Venue.id, Venue.name).filter(Venue.city == "Austin", Venue.state == "TX")),
+    ("jazz venues in one area",
+     db.session.query(Venue.id, Venue.name).filter(Venue.city == "Austin", Venue.state == "TX", has_genre(Venue, ["Jazz"]))),
+    ("shows feed page",
+     db.session.query(Shows.id, Shows.start_time).filter(Shows.start_time > now)
+       .order_by(Shows.start_time, Shows.id).limit(30)),
+  ]
+
+
+def run(db, label, now):
+  print(f"--- {label} ---")
+  for name, query in hot_queries(db, now):
+    print(f"{name:<32} best={best_ms(query):8.2f}ms")
+    for line in explain(db, query):
+      print(f"    {line}")
+
+
+def main(num_venues):
+  app = bench_app()
+  from models import db
+  with app.app_context():
+    reset_db(db)
+    counts = seed(db, num_venues, shows_per_venue=20)
+    print("seeded", counts)
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    now = datetime.now()
+
+    with db.engine.begin() as conn:
+      for index in indexes:
+        index.drop(conn)
+    run(db, "before (primary keys only)", now)
+
+    with db.engine.begin() as conn:
+      for index in indexes:
+        index.create(conn)
+      if db.engine.dialect.name == 'sqlite':
+        conn.exec_driver_sql('ANALYZE')
+      else:
+        conn.exec_driver_sql('ANALYZE shows; ANALYZE venue; ANALYZE artist; ANALYZE venue_genre; ANALYZE genre')
+    run(db, "after (" + ", ".join(index.name for index in indexes) + ")", now)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,86 @@
+#----------------------------------------------------------------------------#
+# Background job benchmark.
+#----------------------------------------------------------------------------#
+
+# Response time of POST /venues/<id>/edit, whose follow-up job invalidates
+# the cached pages of every artist playing the venue, with the job run in
+# the request ('inline'), on the in-process thread pool and queued in the
+# job table. The artist pages are cached (file backend, as shared by the
+# workers of one host) before each edit, so the invalidation has work to
+# do; the time for the pool or one `flask jobs work` thread to run the
+# queued jobs is printed as well. On SQLite the commit's fsync can dwarf
+# the fan-out; the difference grows with the venue's artists and with a
+# cache backend further away (redis).
+#
+#   python -m benchmarks.jobs [--venues 50] [--shows-per-venue 40] [--edits 20]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from benchmarks.common import percentile
+
+import config
+
+
+def venue_form(venue_id, i):
+  return {"name": "Venue %d (%d)" % (venue_id, i), "city": "Austin", "state": "TX", "address": "1 Main St",
+          "phone": "512-555-0100", "genres": ["Jazz"], "facebook_link": "https://facebook.com/venue%d" % venue_id,
+          "image_link": "", "website_link": "", "seeking_description": ""}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.jobs', description='Measure write handlers with background jobs.')
+  parser.add_argument('--venues', type=int, default=50, help='venues to seed (default 50)')
+  parser.add_argument('--shows-per-venue', type=int, default=40, help='shows per venue (default 40)')
+  parser.add_argument('--edits', type=int, default=20, help='venue edits per backend (default 20)')
+  args = parser.parse_args(argv)
+
+  os.environ.setdefault('BENCH_CACHE_BACKEND', 'file')
+  config.CACHE_DIR = tempfile.mkdtemp()
+  from benchmarks.common import bench_app, reset_db, seed
+  app = bench_app()
+  from jobs import jobs
+  from models import db
+  from queries import venue_artist_ids
+  client = app.test_client()
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, args.venues, shows_per_venue=args.shows_per_venue))
+    artists = dict((venue_id, venue_artist_ids(venue_id)) for venue_id in range(1, args.edits + 1))
+    db.session.remove()
+  # untimed, so the first backend doesn't pay for the cold database file
+  for venue_id in artists:
+    client.post('/venues/%d/edit' % venue_id, data=venue_form(venue_id, 0))
+  jobs.wait()
+  print("artists per edited venue: %.1f" % (sum(len(ids) for ids in artists.values()) / float(len(artists))))
+
+  for run, backend in enumerate(('inline', 'thread', 'database')):
+    app.config['JOBS_BACKEND'] = backend
+    jobs.init_app(app)
+    samples = []
+    for i in range(args.edits):
+      venue_id = i % len(artists) + 1
+      for artist_id in artists[venue_id]:
+        client.get('/artists/%d' % artist_id)
+      start = time.perf_counter()
+      # a new name each time, so every edit writes
+      response = client.post('/venues/%d/edit' % venue_id, data=venue_form(venue_id, (run + 1) * args.edits + i))
+      samples.append((time.perf_counter() - start) * 1000)
+      assert response.status_code == 302, response.status_code
+    start = time.perf_counter()
+    if backend == 'database':
+      with app.app_context():
+        jobs.work(1, burst=True)
+    else:
+      jobs.wait()
+    drained = (time.perf_counter() - start) * 1000
+    jobs.shutdown()
+    print(f"{backend:<9} POST /venues/<id>/edit  p50={percentile(samples, 50):7.2f}ms  p95={percentile(samples, 95):7.2f}ms"
+          f"  queue drained in {drained:7.2f}ms")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
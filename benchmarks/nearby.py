@@ -0,0 +1,45 @@
+#----------------------------------------------------------------------------#
+# /venues/nearby benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds venues scattered around the benchmark cities and reports latency
+# percentiles of GET /venues/nearby for random points near them at a few
+# radii, with the number of venues found. Target: milliseconds at 100k
+# venues for city-sized radii.
+#
+#   python -m benchmarks.nearby [number of venues]
+
+import random
+import sys
+import time
+from benchmarks.common import CITIES, bench_app, percentile, reset_db, seed
+
+
+def main(num_venues, requests=200):
+  app = bench_app()
+  from models import db
+  from geo import gazetteer
+  client = app.test_client()
+  rng = random.Random(0)
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, num_venues, shows_per_venue=0))
+    centres = [gazetteer.lookup(city, state) for city, state in CITIES]
+
+    for radius in (1, 5, 25, 100):
+      samples, found = [], 0
+      for _ in range(requests):
+        lat, lng = rng.choice(centres)
+        query = {"lat": lat + rng.uniform(-0.3, 0.3), "lng": lng + rng.uniform(-0.3, 0.3), "radius": radius}
+        start = time.perf_counter()
+        response = client.get('/venues/nearby', query_string=query)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+        found += len(response.get_json()["venues"])
+      print(f"radius={radius:>4}km  p50={percentile(samples, 50):7.2f}ms  p95={percentile(samples, 95):7.2f}ms"
+            f"  p99={percentile(samples, 99):7.2f}ms  avg results={found / requests:.1f}")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
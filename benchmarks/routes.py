@@ -0,0 +1,280 @@
+#----------------------------------------------------------------------------#
+# Route benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds synthetic data at one of SCALES and measures every route in app.py
+# two ways:
+#
+#   * in-process through the Flask test client, one request at a time:
+#     p50/p95/p99 latency and the SQL statements each request issues
+#   * under load: the app is served by a threaded werkzeug server on a
+#     local port and --workers processes request the read routes for
+#     --duration seconds: throughput and latency percentiles
+#
+# --save writes the results to a JSON baseline. --check compares the run
+# with a baseline and exits non-zero on a regression: a changed status, more
+# statements, or latency/throughput worse than --tolerance. CI runs
+#
+#   python -m benchmarks.routes --check benchmarks/baseline.json
+#
+# Statement counts are exact and compare across machines; latencies only
+# mean something against a baseline recorded on similar hardware and the
+# same database, so re-record it (--save) when either changes.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+from benchmarks.common import bench_app, percentile, reset_db, seed, QueryCounter
+
+# name: (venues, shows per venue); artists are half the venues
+SCALES = {
+  '1k': (200, 5),
+  '100k': (5000, 20),
+  '1m': (20000, 50),
+}
+IMPORT_TOKEN = 'bench'
+OPS_TOKEN = 'bench-ops'
+
+
+def venue_form(i):
+  return {"name": "Bench Venue %d" % i, "city": "Austin", "state": "TX", "address": "%d Bench St" % i,
+          "phone": "5125550100", "genres": ["Jazz", "Blues"], "image_link": "https://example.com/venue.jpg",
+          "facebook_link": "https://www.facebook.com/benchvenue%d" % i, "website_link": "https://example.com",
+          "seeking_talent": "y", "seeking_description": "Looking for bands"}
+
+def artist_form(i):
+  return {"name": "Bench Artist %d" % i, "city": "Austin", "state": "TX", "phone": "5125550100",
+          "genres": ["Rock n Roll"], "image_link": "https://example.com/artist.jpg",
+          "facebook_link": "https://www.facebook.com/benchartist%d" % i, "website_link": "https://example.com"}
+
+def import_body(i):
+  rows = [{"artist_id": i % 10 + 1, "venue_id": k + 1, "start_time": "2030-01-%02d 20:00:00" % (k + 1)} for k in range(10)]
+  return {"data": "".join(json.dumps(row) + "\n" for row in rows),
+          "headers": {"Authorization": "Bearer %s" % IMPORT_TOKEN}}
+
+
+def route_table(num_venues, num_artists):
+  # (name, method, path(i), test client kwargs(i) or None, used under load)
+  # for every route in app.py. Reads cycle over the first hundred ids; the
+  # delete takes venues from the top so the reads never miss.
+  hot_venues = max(1, min(num_venues // 2, 100))
+  hot_artists = max(1, min(num_artists, 100))
+  venue = lambda i: i % hot_venues + 1
+  artist = lambda i: i % hot_artists + 1
+
+  def read(name, path, load=True):
+    return (name, 'GET', path, None, load)
+
+  def ops(name, path):
+    return (name, 'GET', path, lambda i: {"headers": {"Authorization": "Bearer %s" % OPS_TOKEN}}, False)
+
+  return [
+    read('GET /', lambda i: '/'),
+    read('GET /venues', lambda i: '/venues'),
+    read('GET /venues?genre', lambda i: '/venues?genre=jazz'),
+    read('GET /venues/search', lambda i: '/venues/search?search_term=venue+%d' % venue(i)),
+    ('POST /venues/search', 'POST', lambda i: '/venues/search', lambda i: {"data": {"search_term": "venue %d" % venue(i)}}, False),
+    read('GET /venues/nearby', lambda i: '/venues/nearby?lat=30.27&lng=-97.74&radius=25'),
+    read('GET /venues/<id>', lambda i: '/venues/%d' % venue(i)),
+    read('GET /venues/<id>/edit', lambda i: '/venues/%d/edit' % venue(i)),
+    read('GET /venues/create', lambda i: '/venues/create'),
+    read('GET /artists', lambda i: '/artists'),
+    read('GET /artists/search', lambda i: '/artists/search?search_term=artist+%d' % artist(i)),
+    ('POST /artists/search', 'POST', lambda i: '/artists/search', lambda i: {"data": {"search_term": "artist %d" % artist(i)}}, False),
+    read('GET /artists/<id>', lambda i: '/artists/%d' % artist(i)),
+    read('GET /artists/<id>/edit', lambda i: '/artists/%d/edit' % artist(i)),
+    read('GET /artists/create', lambda i: '/artists/create'),
+    read('GET /search/suggest', lambda i: '/search/suggest?q=ven'),
+    read('GET /shows', lambda i: '/shows'),
+    read('GET /shows?city', lambda i: '/shows?city=austin&from=%s' % (date.today() + timedelta(days=i % 30))),
+    read('GET /shows/create', lambda i: '/shows/create'),
+    read('GET /api/shows', lambda i: '/api/shows?venue_id=%d' % venue(i)),
+    ('GET /api/export/venues', 'GET', lambda i: '/api/export/venues?format=jsonl',
+     lambda i: {"headers": {"Authorization": "Bearer %s" % IMPORT_TOKEN}}, False),
+    ops('GET /_cache/stats', lambda i: '/_cache/stats'),
+    ops('GET /_jobs/stats', lambda i: '/_jobs/stats'),
+    ops('GET /_db/pool', lambda i: '/_db/pool'),
+    ops('GET /_metrics', lambda i: '/_metrics'),
+    ('POST /venues/create', 'POST', lambda i: '/venues/create', lambda i: {"data": venue_form(i)}, False),
+    ('POST /venues/<id>/edit', 'POST', lambda i: '/venues/%d/edit' % venue(i), lambda i: {"data": venue_form(i)}, False),
+    ('POST /artists/create', 'POST', lambda i: '/artists/create', lambda i: {"data": artist_form(i)}, False),
+    ('POST /artists/<id>/edit', 'POST', lambda i: '/artists/%d/edit' % artist(i), lambda i: {"data": artist_form(i)}, False),
+    ('POST /shows/create', 'POST', lambda i: '/shows/create',
+     lambda i: {"data": {"artist_id": artist(i), "venue_id": venue(i), "start_time": "2030-06-01 20:00:00"}}, False),
+    ('POST /api/import/shows', 'POST', lambda i: '/api/import/shows?format=jsonl', import_body, False),
+    ('DELETE /venues/<id>', 'DELETE', lambda i: '/venues/%d' % (num_venues - i), None, False),
+  ]
+
+
+def latency(samples):
+  return dict(("p%d_ms" % pct, round(percentile(samples, pct), 3)) for pct in (50, 95, 99))
+
+
+#  In-process
+#  ----------------------------------------------------------------
+
+def run_client(app, db, routes, requests):
+  results = {}
+  for name, method, path, kwargs, _ in routes:
+    # a fresh client per route, so flashed messages don't carry over
+    client = app.test_client()
+    if method == 'GET':
+      # untimed first request, so template compilation isn't in the samples
+      client.get(path(0), **(kwargs(0) if kwargs else {})).get_data()
+    samples, queries, status = [], 0, None
+    for i in range(requests):
+      with QueryCounter(db.engine) as counter:
+        start = time.perf_counter()
+        response = client.open(path(i), method=method, **(kwargs(i) if kwargs else {}))
+        response.get_data()
+        samples.append((time.perf_counter() - start) * 1000)
+      queries = max(queries, counter.count)
+      status = response.status_code
+    results[name] = dict(status=status, queries=queries, **latency(samples))
+    print(f"{name:<26} {status}  p50={results[name]['p50_ms']:8.2f}ms  p95={results[name]['p95_ms']:8.2f}ms"
+          f"  p99={results[name]['p99_ms']:8.2f}ms  queries={queries}")
+  return results
+
+
+#  Under load
+#  ----------------------------------------------------------------
+
+def load_worker(args):
+  # runs in a separate process: GET random paths until the deadline
+  base_url, paths, duration, seed_value = args
+  rng = random.Random(seed_value)
+  samples, errors = [], 0
+  deadline = time.perf_counter() + duration
+  while time.perf_counter() < deadline:
+    name, path = rng.choice(paths)
+    start = time.perf_counter()
+    try:
+      with urllib.request.urlopen(base_url + path, timeout=30) as response:
+        response.read()
+    except (urllib.error.URLError, OSError):
+      errors += 1
+      continue
+    samples.append((name, (time.perf_counter() - start) * 1000))
+  return samples, errors
+
+
+def run_load(app, routes, workers, duration):
+  from werkzeug.serving import make_server
+  logging.getLogger('werkzeug').setLevel(logging.ERROR)
+  server = make_server('127.0.0.1', 0, app, threaded=True)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  base_url = 'http://127.0.0.1:%d' % server.server_port
+  paths = [(name, path(i)) for name, method, path, _, load in routes if load for i in range(20)]
+
+  start = time.perf_counter()
+  with multiprocessing.get_context('spawn').Pool(workers) as pool:
+    results = pool.map(load_worker, [(base_url, paths, duration, n) for n in range(workers)])
+  elapsed = time.perf_counter() - start
+  server.shutdown()
+
+  samples = [sample for worker_samples, _ in results for sample in worker_samples]
+  errors = sum(worker_errors for _, worker_errors in results)
+  by_route = {}
+  for name, ms in samples:
+    by_route.setdefault(name, []).append(ms)
+  summary = dict(workers=workers, duration_s=duration, requests=len(samples), errors=errors,
+                 throughput_rps=round(len(samples) / elapsed, 1), **latency([ms for _, ms in samples] or [0.0]))
+  summary["routes"] = dict((name, dict(requests=len(ms), **latency(ms))) for name, ms in sorted(by_route.items()))
+  print(f"load: {workers} workers, {len(samples)} requests, {errors} errors, {summary['throughput_rps']} req/s"
+        f"  p50={summary['p50_ms']:.2f}ms  p95={summary['p95_ms']:.2f}ms  p99={summary['p99_ms']:.2f}ms")
+  return summary
+
+
+#  Baseline
+#  ----------------------------------------------------------------
+
+def compare(baseline, results, tolerance, min_ms):
+  # regressions of results against baseline, as messages
+  problems = []
+  for key in ('scale', 'database'):
+    if baseline.get(key) != results[key]:
+      problems.append("baseline %s is %r, this run is %r" % (key, baseline.get(key), results[key]))
+  if problems:
+    return problems
+
+  def slower(name, new, old):
+    if new['p95_ms'] > old['p95_ms'] * (1 + tolerance) and new['p95_ms'] - old['p95_ms'] > min_ms:
+      problems.append("%s: p95 %.2fms, baseline %.2fms" % (name, new['p95_ms'], old['p95_ms']))
+
+  for name, new in results['routes'].items():
+    old = baseline['routes'].get(name)
+    if old is None:
+      continue
+    if new['status'] != old['status']:
+      problems.append("%s: status %s, baseline %s" % (name, new['status'], old['status']))
+    if new['queries'] > old['queries']:
+      problems.append("%s: %d queries, baseline %d" % (name, new['queries'], old['queries']))
+    slower(name, new, old)
+
+  new, old = results.get('load'), baseline.get('load')
+  if new and old:
+    if new['errors']:
+      problems.append("load: %d failed requests" % new['errors'])
+    if new['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+      problems.append("load: %.1f req/s, baseline %.1f" % (new['throughput_rps'], old['throughput_rps']))
+    slower('load', new, old)
+  return problems
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.routes', description='Benchmark every route in app.py.')
+  parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='number of shows to seed (default 1k)')
+  parser.add_argument('--requests', type=int, default=20, help='test client requests per route (default 20)')
+  parser.add_argument('--workers', type=int, default=4, help='load generator processes (default 4)')
+  parser.add_argument('--duration', type=float, default=10.0, help='seconds of load (default 10, 0 skips it)')
+  parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+  parser.add_argument('--check', metavar='PATH', help='fail on regressions against a JSON baseline')
+  parser.add_argument('--tolerance', type=float, default=0.5, help='allowed latency/throughput change (default 0.5)')
+  parser.add_argument('--min-ms', type=float, default=2.0, help='ignore p95 increases smaller than this (default 2)')
+  args = parser.parse_args(argv)
+
+  app = bench_app()
+  app.config['BULK_IMPORT_TOKEN'] = IMPORT_TOKEN
+  app.config['OPS_TOKEN'] = OPS_TOKEN
+  from models import db
+  num_venues, shows_per_venue = SCALES[args.scale]
+  with app.app_context():
+    reset_db(db)
+    counts = seed(db, num_venues, shows_per_venue=shows_per_venue)
+    print("seeded", counts)
+    routes = route_table(counts['venues'], counts['artists'])
+    results = {
+      "scale": args.scale,
+      "database": db.engine.dialect.name,
+      "seeded": counts,
+      "routes": run_client(app, db, routes, args.requests),
+    }
+  if args.duration > 0:
+    results["load"] = run_load(app, routes, args.workers, args.duration)
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+      f.write('\n')
+    print("baseline written to", args.save)
+  if args.check:
+    with open(args.check) as f:
+      problems = compare(json.load(f), results, args.tolerance, args.min_ms)
+    for problem in problems:
+      print("REGRESSION:", problem)
+    if problems:
+      return 1
+    print("OK: no regressions against", args.check)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,43 @@
+#----------------------------------------------------------------------------#
+# /shows feed benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds a growing shows table and times the first and a deep page of
+# GET /shows. Both should cost the same number of statements and roughly
+# the same time at every scale.
+#
+#   python -m benchmarks.shows_feed [show counts...]
+
+import sys
+from benchmarks.common import bench_app, reset_db, seed, timed_get
+
+
+def main(scales):
+  app = bench_app()
+  from models import db, Shows
+  from queries import encode_show_cursor
+  client = app.test_client()
+  counts = set()
+  with app.app_context():
+    for num_shows in scales:
+      reset_db(db)
+      seed(db, num_venues=max(1, num_shows // 10), shows_per_venue=10)
+      # cursor pointing at the middle of the table
+      middle = db.session.query(Shows.start_time, Shows.id) \
+        .order_by(Shows.start_time, Shows.id).offset(num_shows // 2).first()
+      deep_url = '/shows?after=' + encode_show_cursor(middle.start_time, middle.id)
+      for label, url in (('first', '/shows'), ('deep', deep_url)):
+        status, ms, queries = timed_get(client, db, url)
+        counts.add(queries)
+        print(f"shows={num_shows:>8}  page={label:<5}  status={status}  best={ms:8.2f}ms  queries={queries}")
+
+  if len(counts) != 1:
+    print("FAIL: query count depends on the size of the shows table")
+    return 1
+  print(f"OK: {counts.pop()} queries per page at every scale")
+  return 0
+
+
+if __name__ == '__main__':
+  scales = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+  sys.exit(main(scales))
@@ -0,0 +1,108 @@
+#----------------------------------------------------------------------------#
+# Startup benchmark.
+#----------------------------------------------------------------------------#
+
+# Time to first request of a fresh worker process. Each run starts a new
+# interpreter that imports the app and requests a few pages through the
+# test client, in three modes:
+#
+#   cold      no template bytecode cache, no warm-up (a new deploy)
+#   bytecode  templates loaded from a filled TEMPLATE_CACHE_DIR
+#   warmup    WARMUP on with the bytecode cache, WARMUP_PATHS /venues,/shows
+#
+# and prints, as medians over --runs processes, the wall time from spawning
+# the process to its first response, the import time, each page's first
+# response and the startup phases recorded by warmup.py.
+#
+#   python -m benchmarks.startup [--runs 5]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import bench_app, reset_db, seed
+
+PATHS = ['/venues', '/shows', '/venues/1', '/artists/1']
+
+
+def child(database_uri):
+  # runs in the measured process
+  started = time.perf_counter()
+  app = bench_app(database_uri)
+  imported = time.perf_counter()
+  from warmup import startup
+  client = app.test_client()
+  first = {}
+  for path in PATHS:
+    start = time.perf_counter()
+    client.get(path)
+    first[path] = (time.perf_counter() - start) * 1000
+    if path == PATHS[0]:
+      # wall clock, comparable with the parent's
+      first_response_at = time.time()
+  print(json.dumps({
+    "first_response_at": first_response_at,
+    "import_ms": (imported - started) * 1000,
+    "first_ms": first,
+    "phases": dict((name, seconds * 1000) for name, seconds in startup.phases),
+  }))
+
+def run(database_uri, env):
+  spawned_at = time.time()
+  output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', database_uri],
+                          env=dict(os.environ, **env), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+  result = json.loads(output.decode().strip().splitlines()[-1])
+  result['to_first_ms'] = (result['first_response_at'] - spawned_at) * 1000
+  return result
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) // 2]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.startup', description='Measure worker time to first request.')
+  parser.add_argument('--venues', type=int, default=500, help='venues to seed (default 500)')
+  parser.add_argument('--runs', type=int, default=5, help='processes per mode (default 5)')
+  parser.add_argument('--child', metavar='DATABASE_URI', help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+  if args.child:
+    child(args.child)
+    return 0
+
+  app = bench_app()
+  database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+  from models import db
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, args.venues))
+    db.engine.dispose()
+
+  template_cache = tempfile.mkdtemp()
+  modes = [
+    ('cold', {'TEMPLATE_CACHE_DIR': '', 'WARMUP': 'false'}),
+    ('bytecode', {'TEMPLATE_CACHE_DIR': template_cache, 'WARMUP': 'false'}),
+    ('warmup', {'TEMPLATE_CACHE_DIR': template_cache, 'WARMUP': 'true', 'WARMUP_PATHS': '/venues,/shows'}),
+  ]
+  # fill the bytecode cache
+  run(database_uri, modes[1][1])
+  try:
+    for mode, env in modes:
+      results = [run(database_uri, env) for _ in range(args.runs)]
+      first = '  '.join('%s=%.1fms' % (path, median([r['first_ms'][path] for r in results])) for path in PATHS)
+      phases = '  '.join('%s=%.1fms' % (name, median([r['phases'][name] for r in results])) for name in results[0]['phases'])
+      print(f"{mode:<9} to first response={median([r['to_first_ms'] for r in results]):7.1f}ms"
+            f"  import={median([r['import_ms'] for r in results]):7.1f}ms")
+      print(f"          first responses: {first}")
+      print(f"          phases: {phases}")
+  finally:
+    shutil.rmtree(template_cache, ignore_errors=True)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
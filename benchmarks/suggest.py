@@ -0,0 +1,45 @@
+#----------------------------------------------------------------------------#
+# /search/suggest benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds venues and artists, builds the prefix index once and reports
+# latency percentiles of GET /search/suggest for short random prefixes.
+# Target: p99 under 10 ms.
+#
+#   python -m benchmarks.suggest [number of venues]
+
+import random
+import sys
+import time
+from benchmarks.common import bench_app, percentile, reset_db, seed
+
+
+def main(num_venues, requests=2000):
+  app = bench_app()
+  from models import db
+  from suggest import suggestions
+  client = app.test_client()
+  rng = random.Random(0)
+  with app.app_context():
+    reset_db(db)
+    print("seeded", seed(db, num_venues, shows_per_venue=0))
+    start = time.perf_counter()
+    suggestions.build()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    words = ["venue", "artist", "san", "new", "aus", "v", "a", "venue 1", "artist 42", "chi", "x"]
+    samples = []
+    for _ in range(requests):
+      q = rng.choice(words)
+      start = time.perf_counter()
+      response = client.get('/search/suggest', query_string={"q": q})
+      samples.append((time.perf_counter() - start) * 1000)
+      assert response.status_code == 200
+
+  p50, p95, p99 = (percentile(samples, pct) for pct in (50, 95, 99))
+  print(f"requests={requests}  p50={p50:.2f}ms  p95={p95:.2f}ms  p99={p99:.2f}ms")
+  return 0 if p99 < 10 else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
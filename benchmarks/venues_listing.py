@@ -0,0 +1,37 @@
+#----------------------------------------------------------------------------#
+# /venues listing benchmark.
+#----------------------------------------------------------------------------#
+
+# Seeds a growing number of venues and checks that GET /venues issues the
+# same number of SQL statements at every scale.
+#
+#   python -m benchmarks.venues_listing [venue counts...]
+
+import sys
+from benchmarks.common import bench_app, reset_db, seed, timed_get
+
+
+def main(scales):
+  app = bench_app()
+  from models import db
+  client = app.test_client()
+  results = []
+  with app.app_context():
+    for num_venues in scales:
+      reset_db(db)
+      seed(db, num_venues)
+      status, ms, queries = timed_get(client, db, '/venues')
+      results.append((num_venues, status, ms, queries))
+      print(f"venues={num_venues:>7}  status={status}  best={ms:8.2f}ms  queries={queries}")
+
+  counts = set(queries for _, _, _, queries in results)
+  if len(counts) != 1:
+    print("FAIL: query count grows with the number of venues")
+    return 1
+  print(f"OK: {counts.pop()} queries per request at every scale")
+  return 0
+
+
+if __name__ == '__main__':
+  scales = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000]
+  sys.exit(main(scales))
@@ -0,0 +1,301 @@
+#----------------------------------------------------------------------------#
+# Bulk import / export.
+#----------------------------------------------------------------------------#
+
+# Streams venues, artists and shows in and out as CSV or JSON Lines in
+# bounded memory. Imported rows are validated with the same VenueForm /
+# ArtistForm / ShowForm rules as the create pages and written in batches of
+# multi-row INSERTs, one transaction per batch; a failing batch is rolled
+# back and reported without stopping the import.
+#
+#   flask fyyur import venues venues.csv
+#   flask fyyur import shows shows.jsonl --batch-size 5000
+#   flask fyyur export artists artists.csv
+#
+# The same pipeline is exposed as POST /api/import/<kind> and
+# GET /api/export/<kind>?format=csv|jsonl, both requiring BULK_IMPORT_TOKEN.
+#
+# CSV cells holding several genres separate them with ';'. An optional id
+# column keeps ids stable, e.g. when importing shows for exported venues.
+
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Shows
+from cache import cache
+from suggest import suggestions
+from genres import lookup_genres, genre_names_by_id
+from geo import gazetteer
+import counters
+import show_calendar
+
+FORMATS = ('csv', 'jsonl')
+
+# kind -> (model, form, exported/imported columns)
+KINDS = {
+  'venues': (Venue, VenueForm, ['id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+                                'facebook_link', 'website_link', 'seeking_talent', 'seeking_description']),
+  'artists': (Artist, ArtistForm, ['id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+                                   'facebook_link', 'website_link', 'seeking_venue', 'seeking_description']),
+  'shows': (Shows, ShowForm, ['id', 'artist_id', 'venue_id', 'start_time']),
+}
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n')
+START_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+#  Reading
+#  ----------------------------------------------------------------
+
+def read_rows(lines, fmt):
+  # yields (line number, dict) from an iterable of text lines
+  if fmt == 'csv':
+    reader = csv.DictReader(lines)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for number, line in enumerate(lines, 1):
+      if line.strip():
+        try:
+          row = json.loads(line)
+        except ValueError as e:
+          yield number, e
+          continue
+        yield number, row if isinstance(row, dict) else ValueError('expected a JSON object')
+
+def formdata(row):
+  data = MultiDict()
+  for key, value in row.items():
+    if isinstance(value, list):
+      data.setlist(key, [str(item) for item in value])
+    elif key == 'genres' and isinstance(value, str):
+      data.setlist(key, [genre.strip() for genre in value.split(';') if genre.strip()])
+    elif key in ('seeking_talent', 'seeking_venue'):
+      # BooleanField only looks at presence, so drop the false spellings
+      if value is not None and str(value).strip().lower() not in FALSE_VALUES:
+        data[key] = 'y'
+    elif value is not None:
+      data[key] = str(value)
+  return data
+
+def validate(kind, row):
+  # (column values, None) or (None, errors)
+  model, form_class, columns = KINDS[kind]
+  form = form_class(formdata=formdata(row), meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+  values = {}
+  for field in form:
+    if field.name in columns:
+      values[field.name] = field.data
+  if kind == 'shows':
+    for key in ('artist_id', 'venue_id'):
+      try:
+        values[key] = int(values[key])
+      except (TypeError, ValueError):
+        return None, {key: ['Not a valid id.']}
+  if row.get('id') not in (None, ''):
+    try:
+      values['id'] = int(row['id'])
+    except ValueError:
+      return None, {'id': ['Not a valid id.']}
+  return values, None
+
+
+#  Writing
+#  ----------------------------------------------------------------
+
+def missing_parents(rows):
+  # line numbers of show rows whose venue or artist does not exist
+  missing = {}
+  for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    wanted = set(values[key] for _, values in rows)
+    found = set(id for id, in db.session.query(model.id).filter(model.id.in_(wanted)))
+    for line, values in rows:
+      if values[key] not in found:
+        missing[line] = {key: ['No such %s.' % model.__tablename__]}
+  return missing
+
+def write_batch(kind, rows):
+  model = KINDS[kind][0]
+  errors = {}
+  if kind == 'shows':
+    errors = missing_parents(rows)
+    rows = [(line, values) for line, values in rows if line not in errors]
+  if not rows:
+    return 0, errors
+  payload = [values for _, values in rows]
+  try:
+    if kind == 'shows':
+      # the ORM's Python-side defaults do not apply to Core executemany inserts
+      now = datetime.utcnow()
+      db.session.execute(model.__table__.insert(), [dict(values, updated_at=now) for values in payload])
+      for party, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        counters.refresh(party, party.id.in_(set(values[key] for values in payload)))
+      show_calendar.refresh(Venue.id.in_(set(values['venue_id'] for values in payload)))
+    else:
+      # through the ORM so the genre links get the new ids; the flush still
+      # sends multi-row INSERTs
+      genres = dict((genre.name, genre) for genre in lookup_genres(set(name for values in payload for name in values['genres'])))
+      entities = [model(**dict(values, genres=[genres[name] for name in values['genres']])) for values in payload]
+      if model is Venue:
+        for venue in entities:
+          gazetteer.locate(venue)
+      db.session.add_all(entities)
+    db.session.commit()
+  except Exception as e:
+    db.session.rollback()
+    errors[rows[0][0]] = {'batch': [str(getattr(e, 'orig', e))]}
+    return 0, errors
+  invalidate(kind, payload)
+  return len(payload), errors
+
+def invalidate(kind, payload):
+  if kind == 'shows':
+    groups = ['shows', 'venues']
+    groups += ['venue:%d' % values['venue_id'] for values in payload]
+    groups += ['artist:%d' % values['artist_id'] for values in payload]
+    cache.invalidate(*groups)
+  else:
+    cache.invalidate(kind)
+    suggestions.expire()
+
+def fix_sequence(kind):
+  # explicit ids leave Postgres sequences behind the table
+  if db.engine.dialect.name == 'postgresql':
+    table = KINDS[kind][0].__tablename__
+    db.session.execute(db.text(
+      "SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE((SELECT max(id) FROM %s), 1))" % table
+    ), {"table": table})
+    db.session.commit()
+
+def import_rows(kind, lines, fmt, batch_size=1000):
+  # yields one report per batch: {"batch", "first_line", "last_line", "inserted", "errors"}
+  batch, errors, first_line, number = [], {}, None, 0
+  explicit_ids = False
+  for line, row in read_rows(lines, fmt):
+    if first_line is None:
+      first_line = line
+    if isinstance(row, Exception):
+      errors[line] = {'row': [str(row)]}
+    else:
+      values, row_errors = validate(kind, row)
+      if row_errors:
+        errors[line] = row_errors
+      else:
+        explicit_ids = explicit_ids or 'id' in values
+        batch.append((line, values))
+    if len(batch) + len(errors) >= batch_size:
+      number += 1
+      yield report(kind, number, first_line, line, batch, errors)
+      batch, errors, first_line = [], {}, None
+  if first_line is not None:
+    number += 1
+    yield report(kind, number, first_line, line, batch, errors)
+  if explicit_ids:
+    fix_sequence(kind)
+
+def report(kind, number, first_line, last_line, batch, errors):
+  inserted, batch_errors = write_batch(kind, batch)
+  errors.update(batch_errors)
+  return {
+    "batch": number,
+    "first_line": first_line,
+    "last_line": last_line,
+    "inserted": inserted,
+    "errors": [{"line": line, "errors": errors[line]} for line in sorted(errors)],
+  }
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+def export_batch(kind, fmt, columns, rows):
+  if not rows:
+    return ''
+  model = KINDS[kind][0]
+  if 'genres' in columns:
+    # one lookup per batch for the genre names of its rows
+    genres = genre_names_by_id(model, [row.id for row in rows])
+    rows = [dict(row._asdict(), genres=genres[row.id]) for row in rows]
+  else:
+    rows = [row._asdict() for row in rows]
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    values = [row[column] for column in columns]
+    values = [value.strftime(START_TIME_FORMAT) if isinstance(value, datetime) else value for value in values]
+    if fmt == 'csv':
+      writer.writerow([';'.join(value) if isinstance(value, list) else value for value in values])
+    else:
+      buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+  return buffer.getvalue()
+
+def export_rows(kind, fmt, batch_size=1000):
+  # yields chunks of CSV / JSON Lines text, reading through a server-side cursor
+  model, _, columns = KINDS[kind]
+  query = db.session.query(*[getattr(model, column) for column in columns if column != 'genres']) \
+    .order_by(model.id) \
+    .execution_options(stream_results=True) \
+    .yield_per(batch_size)
+  if fmt == 'csv':
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(columns)
+    yield buffer.getvalue()
+  batch = []
+  for row in query:
+    batch.append(row)
+    if len(batch) == batch_size:
+      yield export_batch(kind, fmt, columns, batch)
+      batch = []
+  yield export_batch(kind, fmt, columns, batch)
+
+
+#  CLI
+#  ----------------------------------------------------------------
+
+fyyur_cli = AppGroup('fyyur', help='Bulk import and export.')
+
+def guess_format(path, fmt):
+  if fmt:
+    return fmt
+  return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+@click.option('--batch-size', type=int, help='Defaults to BULK_BATCH_SIZE.')
+def import_command(kind, path, fmt, batch_size):
+  """Import venues, artists or shows from a CSV or JSON Lines file."""
+  fmt = guess_format(path, fmt)
+  batch_size = batch_size or current_app.config['BULK_BATCH_SIZE']
+  inserted = failed = 0
+  with click.open_file(path, encoding='utf-8') as lines:
+    for batch in import_rows(kind, lines, fmt, batch_size):
+      inserted += batch["inserted"]
+      failed += len(batch["errors"])
+      click.echo('batch %d (lines %d-%d): %d inserted, %d rejected' % (
+        batch["batch"], batch["first_line"], batch["last_line"], batch["inserted"], len(batch["errors"])))
+      for error in batch["errors"]:
+        click.echo('  line %d: %s' % (error["line"], json.dumps(error["errors"])), err=True)
+  click.echo('%d rows inserted, %d rejected' % (inserted, failed))
+  if failed:
+    sys.exit(1)
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(allow_dash=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+def export_command(kind, path, fmt):
+  """Export venues, artists or shows as CSV or JSON Lines."""
+  fmt = guess_format(path, fmt)
+  with click.open_file(path, 'w', encoding='utf-8') as out:
+    for chunk in export_rows(kind, fmt, current_app.config['BULK_BATCH_SIZE']):
+      out.write(chunk)
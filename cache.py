@@ -0,0 +1,331 @@
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+
+# Server-side cache for the read pages. Views opt in with
+# @cached(group, args), where group names the data the page is built from
+# ('venues', 'venue:{venue_id}', ...) and args the query arguments the view
+# reads; each variant of the page is stored under that group, keyed by the
+# path and those arguments only, so unknown query strings share an entry.
+# The write handlers in app.py call cache.invalidate(...) with the groups
+# they touched after committing; under @conditional an entry is also only
+# served while the page's version is the one it was rendered from.
+#
+# CACHE_BACKEND picks the store: 'memory' (per-process LRU), 'file'
+# (CACHE_DIR, shared by the workers on one host), 'redis' (CACHE_REDIS_URL,
+# needs the redis package) or None to disable caching. Entries expire after
+# CACHE_TTL seconds; every backend holds at most CACHE_MAX_ENTRIES, the
+# memory and file backends at most CACHE_MAX_BYTES, dropping the oldest.
+
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import g, request, session, make_response
+
+
+class MemoryBackend(object):
+
+  def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, group, key):
+    with self._lock:
+      item = self._entries.get((group, key))
+      if item is None:
+        return None
+      expires_at, value, size = item
+      if expires_at < time.time():
+        self._pop((group, key))
+        return None
+      self._entries.move_to_end((group, key))
+      return value
+
+  def set(self, group, key, value, ttl):
+    size = len(value[1])
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      self._pop((group, key))
+      self._entries[(group, key)] = (time.time() + ttl, value, size)
+      self._bytes += size
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._pop(next(iter(self._entries)))
+        self.evictions += 1
+
+  def delete_group(self, group):
+    with self._lock:
+      for entry in [entry for entry in self._entries if entry[0] == group]:
+        self._pop(entry)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def _pop(self, entry):
+    item = self._entries.pop(entry, None)
+    if item is not None:
+      self._bytes -= item[2]
+
+
+class FileBackend(object):
+  # one directory per group, one pickle per key; a file's mtime is its
+  # expiry time, so sweep() finds expired and oldest entries from stat()
+
+  def __init__(self, directory, max_entries=1024, max_bytes=64 * 1024 * 1024):
+    self.directory = directory
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.evictions = 0
+    # each process sweeps after this many writes of its own
+    self.sweep_every = max(1, max_entries // 16)
+    self._writes = 0
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+    self.sweep()
+
+  def __len__(self):
+    return sum(len(files) for _, _, files in os.walk(self.directory))
+
+  def _group_dir(self, group):
+    return os.path.join(self.directory, hashlib.sha1(group.encode()).hexdigest())
+
+  def _path(self, group, key):
+    return os.path.join(self._group_dir(group), hashlib.sha1(key.encode()).hexdigest())
+
+  def get(self, group, key):
+    path = self._path(group, key)
+    try:
+      with open(path, 'rb') as f:
+        expires_at, value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+      return None
+    if expires_at < time.time():
+      self._remove(path)
+      return None
+    return value
+
+  def set(self, group, key, value, ttl):
+    if len(value[1]) > self.max_bytes:
+      return
+    path = self._path(group, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename so readers never see a partial file
+    expires_at = time.time() + ttl
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+      pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+    os.utime(tmp, (expires_at, expires_at))
+    os.replace(tmp, path)
+    with self._lock:
+      self._writes += 1
+      sweep = self._writes >= self.sweep_every
+      if sweep:
+        self._writes = 0
+    if sweep:
+      self.sweep()
+
+  def sweep(self):
+    # drop expired entries, then the oldest until within the bounds
+    now = time.time()
+    entries = []
+    for root, _, files in os.walk(self.directory):
+      for name in files:
+        path = os.path.join(root, name)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        if name.endswith('.tmp'):
+          # left behind by a writer that died mid-write
+          if stat.st_ctime < now - 60:
+            self._remove(path)
+        elif stat.st_mtime < now:
+          self._remove(path)
+        else:
+          entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    count, size = len(entries), sum(entry[1] for entry in entries)
+    for _, entry_size, path in entries:
+      if count <= self.max_entries and size <= self.max_bytes:
+        break
+      self._remove(path)
+      self.evictions += 1
+      count -= 1
+      size -= entry_size
+
+  def _remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+  def delete_group(self, group):
+    shutil.rmtree(self._group_dir(group), ignore_errors=True)
+
+  def clear(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+    os.makedirs(self.directory, exist_ok=True)
+
+
+class RedisBackend(object):
+  # each group is a hash; invalidating a group is a single DEL. The sorted
+  # set at prefix + 'index' scores every 'group\0key' by its expiry time,
+  # which is how expired and oldest entries are found across groups
+
+  def __init__(self, url, prefix='fyyur:cache:', max_entries=1024, max_bytes=64 * 1024 * 1024):
+    import redis
+    self.client = redis.Redis.from_url(url)
+    self.prefix = prefix
+    self.index = prefix + 'index'
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.evictions = 0
+
+  def __len__(self):
+    return self.client.zcard(self.index)
+
+  def get(self, group, key):
+    raw = self.client.hget(self.prefix + group, key)
+    if raw is None:
+      return None
+    expires_at, value = pickle.loads(raw)
+    return value if expires_at >= time.time() else None
+
+  def set(self, group, key, value, ttl):
+    if len(value[1]) > self.max_bytes:
+      return
+    name = self.prefix + group
+    expires_at = time.time() + ttl
+    pipe = self.client.pipeline()
+    pipe.hset(name, key, pickle.dumps((expires_at, value), pickle.HIGHEST_PROTOCOL))
+    pipe.expire(name, ttl)
+    pipe.zadd(self.index, {'%s\0%s' % (group, key): expires_at})
+    pipe.zcard(self.index)
+    count = pipe.execute()[-1]
+    # expired entries first, then the oldest
+    stale = self.client.zrangebyscore(self.index, '-inf', time.time())
+    over = count - len(stale) - self.max_entries
+    if over > 0:
+      stale += self.client.zrange(self.index, len(stale), len(stale) + over - 1)
+      self.evictions += over
+    if stale:
+      self._drop(stale)
+
+  def _drop(self, members):
+    pipe = self.client.pipeline()
+    for member in members:
+      group, _, key = member.decode().partition('\0')
+      pipe.hdel(self.prefix + group, key)
+    pipe.zrem(self.index, *members)
+    pipe.execute()
+
+  def delete_group(self, group):
+    name = self.prefix + group
+    keys = self.client.hkeys(name)
+    pipe = self.client.pipeline()
+    pipe.delete(name)
+    if keys:
+      pipe.zrem(self.index, *['%s\0%s' % (group, key.decode()) for key in keys])
+    pipe.execute()
+
+  def clear(self):
+    for name in self.client.scan_iter(self.prefix + '*'):
+      self.client.delete(name)
+
+
+def cache_key(args):
+  # the path and, in a fixed order, the values of the arguments in args
+  query = [(name, value) for name in args for value in request.args.getlist(name)]
+  return request.path + ('?' + urlencode(query) if query else '')
+
+
+class ResponseCache(object):
+
+  def __init__(self):
+    self.backend = None
+    self.ttl = 60
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+
+  def init_app(self, app):
+    kind = app.config.get('CACHE_BACKEND')
+    self.ttl = app.config.get('CACHE_TTL', self.ttl)
+    bounds = (app.config.get('CACHE_MAX_ENTRIES', 1024), app.config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    if kind == 'memory':
+      self.backend = MemoryBackend(*bounds)
+    elif kind == 'file':
+      self.backend = FileBackend(app.config['CACHE_DIR'], *bounds)
+    elif kind == 'redis':
+      self.backend = RedisBackend(app.config['CACHE_REDIS_URL'], 'fyyur:cache:', *bounds)
+    elif kind:
+      raise ValueError('unknown CACHE_BACKEND %r' % kind)
+    else:
+      self.backend = None
+
+  def cached(self, group, args=()):
+    # group is formatted with the view arguments, e.g. 'venue:{venue_id}';
+    # args are the query arguments the view reads, the rest are ignored
+    def decorator(view):
+      @wraps(view)
+      def wrapper(**kwargs):
+        # pages rendered with flashed messages are one-offs, never cache them
+        if self.backend is None or '_flashes' in session:
+          return view(**kwargs)
+        name = group.format(**kwargs)
+        key = cache_key(args)
+        # the version @conditional validated this request against; an
+        # entry rendered from another one (a write in another process
+        # that didn't reach this backend) is stale
+        version = g.get('response_version')
+        hit = self.backend.get(name, key)
+        if hit is not None and len(hit) == 4 and hit[3] == version:
+          self.hits += 1
+          status, body, mimetype, _ = hit
+          response = make_response(body, status)
+          response.mimetype = mimetype
+          response.headers['X-Cache'] = 'HIT'
+          return response
+        self.misses += 1
+        response = make_response(view(**kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+          self.backend.set(name, key, (response.status_code, response.get_data(), response.mimetype, version), self.ttl)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *groups):
+    if self.backend is None:
+      return
+    for group in set(groups):
+      self.backend.delete_group(group)
+      self.invalidations += 1
+
+  def stats(self):
+    return {
+      "backend": type(self.backend).__name__ if self.backend else None,
+      "entries": len(self.backend) if self.backend else 0,
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.backend.evictions if self.backend else 0,
+      "invalidations": self.invalidations,
+    }
+
+
+cache = ResponseCache()
@@ -0,0 +1,60 @@
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+# @conditional(version) answers If-None-Match / If-Modified-Since with a
+# 304 before the view runs. version(**view_args) is one of the *_version
+# lookups in queries.py: a tuple whose hash (with the full path, so each
+# page/cursor differs) is the ETag. Only a version made of timestamps alone
+# also gives Last-Modified (the newest): row counts and time buckets change
+# without any updated_at moving forward, e.g. on a delete, so those pages
+# are validated by ETag only.
+#
+# The version is kept on flask.g for @cache.cached below it, which stores
+# it with the body and ignores an entry rendered from another version.
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import g, request, session, make_response
+
+
+def as_utc(value):
+  # updated_at is stored as naive UTC
+  if value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value.astimezone(timezone.utc)
+
+def conditional(version):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      # pages carrying flashed messages are one-offs
+      if '_flashes' in session:
+        return view(**kwargs)
+      parts = version(**kwargs)
+      if parts is None:
+        return view(**kwargs)
+      g.response_version = parts
+      etag = hashlib.sha1(repr((request.full_path, parts)).encode()).hexdigest()
+      last_modified = None
+      if parts and all(isinstance(part, datetime) for part in parts):
+        # HTTP dates have second precision
+        last_modified = max(as_utc(part) for part in parts).replace(microsecond=0)
+
+      if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+      elif request.if_modified_since and last_modified:
+        not_modified = last_modified <= as_utc(request.if_modified_since)
+      else:
+        not_modified = False
+
+      response = make_response('', 304) if not_modified else make_response(view(**kwargs))
+      if response.status_code in (200, 304):
+        response.set_etag(etag)
+        if last_modified:
+          response.last_modified = last_modified
+        response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
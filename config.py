@@ -6,10 +6,126 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Enable debug mode.
 DEBUG = True
 
+def env_flag(name, default):
+  return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyurapp')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Engine and connection pool, see engine.py. Size the pool so that
+# gunicorn workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below the
+# server's max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+# recycle connections older than this many seconds (-1 disables)
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# test connections on checkout so stale ones are replaced transparently
+DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+# per-statement timeout in milliseconds on Postgres (0 disables)
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+# connecting through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = env_flag('DB_PGBOUNCER', False)
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyurapp'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Read replicas for GET traffic, see routing.py (comma-separated URLs)
+DB_REPLICA_URLS = [url for url in os.environ.get('DB_REPLICA_URLS', '').split(',') if url]
+# skip replicas further behind the primary than this
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_LAG_CHECK_SECONDS', 5))
+# keep a client on the primary this long after it wrote
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+
+# Connections the async engine (asgi.py) keeps open; each serves one query
+# at a time for any number of concurrent requests
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+
+# Fail any request that triggers an implicit relationship lazy load
+# (catches N+1 regressions in tests and CI)
+RAISE_ON_LAZY_LOAD = False
+
+# Number of shows per page on /shows
+SHOWS_PER_PAGE = 30
+
+# Longest from..to range, in days, the /shows calendar filters accept
+SHOW_CALENDAR_MAX_DAYS = 92
+
+# Number of past shows per page on the venue and artist pages
+PAST_SHOWS_PER_PAGE = 12
+
+# Number of results per page on /venues/search and /artists/search
+SEARCH_RESULTS_PER_PAGE = 20
+
+# /search/suggest: default number of matches per kind, and how often each
+# process rebuilds its prefix index from the database
+SUGGEST_LIMIT = 5
+SUGGEST_REBUILD_SECONDS = 300
+
+# Server-side cache for the read pages: 'memory', 'file', 'redis' or None,
+# at most CACHE_MAX_ENTRIES entries (and CACHE_MAX_BYTES), see cache.py
+CACHE_BACKEND = 'memory'
+CACHE_TTL = 60
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_DIR = os.path.join(basedir, '.cache', 'pages')
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
+
+# Rendered template fragments kept per process by the {% cache %} tag,
+# see fragments.py (0 entries disables it)
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000))
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Background jobs for the write handlers' follow-up work (jobs.py):
+# 'thread' or 'process' run them in a pool of JOBS_WORKERS in each web
+# process, 'database' queues them in the job table for `flask jobs work`,
+# 'inline' (or None) runs them right after the commit. A failing job runs
+# up to JOBS_MAX_ATTEMPTS times, JOBS_RETRY_SECONDS apart, doubling.
+JOBS_BACKEND = os.environ.get('JOBS_BACKEND', 'thread')
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+JOBS_RETRY_SECONDS = float(os.environ.get('JOBS_RETRY_SECONDS', 5))
+# 'database': how often an idle worker polls, and after how many seconds a
+# running job is assumed lost with its worker and run again
+JOBS_POLL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', 1))
+JOBS_LOCK_SECONDS = int(os.environ.get('JOBS_LOCK_SECONDS', 300))
+
+# Bulk import/export (bulk.py): rows per INSERT batch, and the bearer token
+# /api/import/<kind> and /api/export/<kind> require (disabled while unset)
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1000))
+BULK_IMPORT_TOKEN = os.environ.get('BULK_IMPORT_TOKEN')
+
+# /api/shows: rows fetched per round trip from the server-side cursor
+API_SHOWS_BATCH_SIZE = int(os.environ.get('API_SHOWS_BATCH_SIZE', 500))
+
+# Formatted strings memoized by the `datetime` template filter (0 disables)
+DATETIME_CACHE_SIZE = int(os.environ.get('DATETIME_CACHE_SIZE', 4096))
+
+# /venues/nearby: offline gazetteer used to geocode venues (city, state,
+# latitude, longitude CSV), default/maximum radius in km and result count
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', os.path.join(basedir, 'data', 'us_cities.csv'))
+NEARBY_RADIUS_KM = 25.0
+NEARBY_MAX_RADIUS_KM = 500.0
+NEARBY_LIMIT = 20
+
+# Cache lifetime, in seconds, of the fingerprinted files `flask assets
+# build` writes to static/build/ (assets.py)
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Worker warm-up (warmup.py): compile the templates, open a database
+# connection and request WARMUP_PATHS (comma-separated) before serving.
+# Compiled templates are cached in TEMPLATE_CACHE_DIR ('' disables).
+WARMUP = env_flag('WARMUP', False)
+WARMUP_PATHS = [path for path in os.environ.get('WARMUP_PATHS', '').split(',') if path]
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(basedir, '.cache', 'templates'))
+
+# Bearer token for the operational endpoints (/_metrics, /_cache/stats,
+# /_db/pool, /_jobs/stats); they answer 403 while it is unset
+OPS_TOKEN = os.environ.get('OPS_TOKEN')
 
+# Request instrumentation (instrument.py): Server-Timing headers and the
+# /_metrics totals, the threshold for slow-query warnings, and whether every
+# request is logged as a JSON line
+INSTRUMENT_REQUESTS = env_flag('INSTRUMENT_REQUESTS', True)
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+REQUEST_LOG = env_flag('REQUEST_LOG', False)
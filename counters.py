@@ -0,0 +1,79 @@
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Maintains the denormalized upcoming_shows_count, past_shows_count and
+# next_show_at columns on venue and artist, so listings read one column
+# instead of counting shows.
+#
+# - show_added() bumps both parties of a new show inside the caller's
+#   transaction.
+# - refresh() recomputes the counters of the matching rows from shows,
+#   used after deletes and by the roll-over.
+# - rollover() recomputes every row whose next show has started, which
+#   moves those shows from upcoming to past. Run it periodically:
+#
+#     flask counters rollover      (e.g. every minute from cron)
+#     flask counters rebuild       (recompute everything)
+
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, or_
+from models import db, Artist, Venue, Shows
+
+PARTIES = ((Venue, Shows.venue_id), (Artist, Shows.artist_id))
+
+
+def show_added(show, now=None):
+  now = now or datetime.now()
+  for model, _ in PARTIES:
+    entity_id = show.venue_id if model is Venue else show.artist_id
+    if show.start_time > now:
+      values = {
+        model.upcoming_shows_count: model.upcoming_shows_count + 1,
+        model.next_show_at: case(
+          (or_(model.next_show_at == None, model.next_show_at > show.start_time), show.start_time),
+          else_=model.next_show_at),
+      }
+    else:
+      values = {model.past_shows_count: model.past_shows_count + 1}
+    db.session.query(model).filter(model.id == entity_id).update(values, synchronize_session=False)
+
+def refresh(model, criterion, now=None):
+  # recompute the counters of every model row matching criterion
+  now = now or datetime.now()
+  show_fk = dict(PARTIES)[model]
+
+  def aggregate(column, *filters):
+    return db.session.query(column).filter(show_fk == model.id, *filters).scalar_subquery()
+
+  return db.session.query(model).filter(criterion).update({
+    model.upcoming_shows_count: aggregate(db.func.count(Shows.id), Shows.start_time > now),
+    model.past_shows_count: aggregate(db.func.count(Shows.id), Shows.start_time <= now),
+    model.next_show_at: aggregate(db.func.min(Shows.start_time), Shows.start_time > now),
+  }, synchronize_session=False)
+
+def rollover(now=None):
+  now = now or datetime.now()
+  return sum(refresh(model, model.next_show_at <= now, now) for model, _ in PARTIES)
+
+def rebuild(now=None):
+  return sum(refresh(model, model.id != None, now) for model, _ in PARTIES)
+
+
+counters_cli = AppGroup('counters', help='Maintain the denormalized show counters.')
+
+@counters_cli.command('rollover')
+def rollover_command():
+  """Move shows that have started from upcoming to past."""
+  updated = rollover()
+  db.session.commit()
+  click.echo('%d rows updated' % updated)
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+  """Recompute every venue and artist counter from the shows table."""
+  updated = rebuild()
+  db.session.commit()
+  click.echo('%d rows updated' % updated)
@@ -0,0 +1,61 @@
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+# Backs the `datetime` Jinja filter. Listings render thousands of show
+# times, so the babel pattern for each (format, locale) is parsed once and
+# formatted strings are memoized in a bounded LRU (DATETIME_CACHE_SIZE
+# entries). The filter takes datetime objects; strings are still parsed
+# with dateutil for callers that pass them. The `date` filter formats
+# calendar days with the same compiled patterns. dateutil is imported on
+# first use, few requests need it.
+
+from datetime import datetime, timezone
+from functools import lru_cache
+import babel.dates
+from babel import Locale
+
+# named formats accepted by the filter, anything else is a babel pattern
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+  'day': "EEEE, MMMM d, y",
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+  return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+def _format(value, format, locale):
+  pattern, locale = compiled_pattern(format, locale)
+  if value.tzinfo is None:
+    # what babel.dates.format_datetime does with naive datetimes
+    value = value.replace(tzinfo=timezone.utc)
+  return pattern.apply(value, locale)
+
+cached_format = lru_cache(maxsize=4096)(_format)
+
+
+def set_cache_size(size):
+  global cached_format
+  cached_format = lru_cache(maxsize=size)(_format) if size else _format
+
+def parse(value):
+  # dateutil's parser, for query strings and legacy string values
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+def format_datetime(value, format='medium', locale='en'):
+  if not isinstance(value, datetime):
+    value = parse(value)
+  return cached_format(value, format, locale)
+
+def format_date(value, format='day', locale='en'):
+  # the `date` filter, for datetime.date values
+  pattern, locale = compiled_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+def cache_info():
+  info = getattr(cached_format, 'cache_info', None)
+  return info()._asdict() if info else None
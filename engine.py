@@ -0,0 +1,115 @@
+#----------------------------------------------------------------------------#
+# Engine.
+#----------------------------------------------------------------------------#
+
+# Turns the DB_* settings in config.py into SQLALCHEMY_ENGINE_OPTIONS and
+# records how long requests wait to check a connection out of the pool.
+#
+# DB_PGBOUNCER switches to a mode that is safe behind PgBouncer in
+# transaction pooling: no client-side pool (PgBouncer is the pool) and no
+# session state, so the statement timeout is applied with SET LOCAL at the
+# start of every transaction instead of as a connection startup option.
+
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+# upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics(object):
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.checkouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+    self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+  def record(self, seconds):
+    with self._lock:
+      self.checkouts += 1
+      self.wait_total += seconds
+      self.wait_max = max(self.wait_max, seconds)
+      for i, bound in enumerate(WAIT_BUCKETS):
+        if seconds <= bound:
+          self.buckets[i] += 1
+          break
+      else:
+        self.buckets[-1] += 1
+
+  def snapshot(self, pool=None):
+    with self._lock:
+      data = {
+        "checkouts": self.checkouts,
+        "wait_total_ms": round(self.wait_total * 1000, 3),
+        "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+        "wait_max_ms": round(self.wait_max * 1000, 3),
+        "wait_histogram": dict(zip(["<=%gs" % bound for bound in WAIT_BUCKETS] + ["+Inf"], self.buckets)),
+      }
+    if isinstance(pool, QueuePool):
+      data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedPoolMixin(object):
+  # Pool.connect() is what engine.connect() and the sessions call; it
+  # blocks while the pool is exhausted (and covers the pre-ping), so its
+  # duration is the wait for a usable connection. Only the public method is
+  # wrapped, the pool's internals are left alone.
+
+  def connect(self):
+    start = time.perf_counter()
+    try:
+      return super(TimedPoolMixin, self).connect()
+    finally:
+      pool_metrics.record(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+  pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+  pass
+
+
+def engine_options(config):
+  uri = config['SQLALCHEMY_DATABASE_URI']
+  options = {"pool_pre_ping": config['DB_POOL_PRE_PING']}
+  if not uri.startswith('postgresql'):
+    # SQLite and friends keep their dialect's default pool
+    return options
+
+  timeout = config['DB_STATEMENT_TIMEOUT_MS']
+  if config['DB_PGBOUNCER']:
+    options["poolclass"] = TimedNullPool
+  else:
+    options.update(
+      poolclass=TimedQueuePool,
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'],
+      pool_recycle=config['DB_POOL_RECYCLE'],
+    )
+    if timeout:
+      options["connect_args"] = {"options": "-c statement_timeout=%d" % timeout}
+  return options
+
+
+def init_engine(app):
+  timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+  if app.config['DB_PGBOUNCER'] and timeout:
+    @event.listens_for(Engine, 'begin')
+    def _set_local_statement_timeout(conn):
+      if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql("SET LOCAL statement_timeout = %d" % timeout)
@@ -5,14 +5,23 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # statuses and query counts only; latencies vary run to run (GC pauses,
+    # fsync), compare them with bench()
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest -q && python -m benchmarks.routes --duration 0 --tolerance 100"
+            " --check benchmarks/baseline.json", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench():
+    # latency and throughput against the baseline, on the hardware it was
+    # recorded on
+    local("python -m benchmarks.routes --check benchmarks/baseline.json")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -39,8 +48,10 @@ def heroku():
 
 
 def heroku_test():
+    # statuses and query counts only, dyno latencies aren't comparable
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python -m benchmarks.routes --duration 0 --tolerance 100"
+        " --check benchmarks/baseline.json"
     )
 
 
@@ -0,0 +1,122 @@
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+# A Jinja tag that reuses rendered pieces of a page across requests:
+#
+#   {% cache ('venue-show', show.id), show.version %} ... {% endcache %}
+#
+# The key names the fragment (the template it appears in and the entity it
+# renders), the version is whatever the body is built from changing with
+# it, normally the updated_at of the rows involved as returned by
+# queries.py. A lookup whose stored version differs renders the body again
+# and replaces the entry, so only changed entities re-render and nothing
+# needs invalidating. The body must depend on nothing but the key and
+# version.
+#
+# This sits under the response cache (cache.py): when a page is evicted or
+# invalidated after a write, rebuilding it only renders the tiles that
+# changed. Entries live in a per-process LRU bounded by
+# FRAGMENT_CACHE_MAX_ENTRIES and FRAGMENT_CACHE_MAX_BYTES; setting the
+# former to 0 renders every fragment normally.
+
+import threading
+from collections import OrderedDict
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCache(object):
+
+  def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.stale = 0
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  def init_app(self, app):
+    self.max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+    self.max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', self.max_bytes)
+    self.clear()
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.extend(fragment_cache=self)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def render(self, key, version, caller):
+    if not self.max_entries:
+      return caller()
+    with self._lock:
+      item = self._entries.get(key)
+      if item is not None and item[0] == version:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return Markup(item[1])
+      self.misses += 1
+      if item is not None:
+        self.stale += 1
+    html = str(caller())
+    self.set(key, version, html)
+    return Markup(html)
+
+  def set(self, key, version, html):
+    size = len(html)
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      self._pop(key)
+      self._entries[key] = (version, html)
+      self._bytes += size
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._pop(next(iter(self._entries)))
+        self.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def _pop(self, key):
+    item = self._entries.pop(key, None)
+    if item is not None:
+      self._bytes -= len(item[1])
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      "entries": len(self._entries),
+      "bytes": self._bytes,
+      "hits": self.hits,
+      "misses": self.misses,
+      "stale": self.stale,
+      "evictions": self.evictions,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+    }
+
+
+class FragmentCacheExtension(Extension):
+  # {% cache key[, version] %} body {% endcache %}
+  tags = {'cache'}
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    args = [parser.parse_expression()]
+    if parser.stream.skip_if('comma'):
+      args.append(parser.parse_expression())
+    else:
+      args.append(nodes.Const(None))
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+  def _render(self, key, version, caller):
+    return self.environment.fragment_cache.render(key, version, caller)
+
+
+fragments = FragmentCache()
@@ -0,0 +1,66 @@
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# Helpers around the genre table and the venue_genre / artist_genre
+# association tables: seeding from forms.Genre, turning submitted names
+# into Genre rows, the indexed "has any of these genres" filter used by the
+# listings, search and API, and batch name lookups for exports.
+
+from sqlalchemy import select
+from forms import Genre as GENRES
+from models import db, Genre, Venue, Artist, venue_genre, artist_genre
+
+NAMES = [genre.value for genre in GENRES]
+
+# model -> (association table, its foreign key to the model)
+LINKS = {
+  Venue: (venue_genre, venue_genre.c.venue_id),
+  Artist: (artist_genre, artist_genre.c.artist_id),
+}
+
+
+def seed_genres():
+  # adds any forms.Genre name the table is missing, returns how many
+  existing = set(name for name, in db.session.query(Genre.name))
+  missing = [name for name in NAMES if name not in existing]
+  if missing:
+    db.session.execute(Genre.__table__.insert(), [{"name": name} for name in missing])
+  return len(missing)
+
+def lookup_genres(names):
+  # Genre rows for the given names, in order, creating unknown ones
+  names = list(dict.fromkeys(names))
+  found = dict((genre.name, genre) for genre in Genre.query.filter(Genre.name.in_(names)))
+  for name in names:
+    if name not in found:
+      found[name] = Genre(name=name)
+      db.session.add(found[name])
+  return [found[name] for name in names]
+
+def parse_genre_args(values):
+  # genre filter from the query string: repeated ?genre= and/or commas
+  names = []
+  for value in values:
+    names.extend(name.strip() for name in value.split(',') if name.strip())
+  return names
+
+def has_genre(model, names):
+  # criterion for entities tagged with any of names (case-insensitive). An
+  # EXISTS probe of the (genre_id, entity_id) index: SQLite will not use
+  # that index for the equivalent IN (subquery), Postgres plans both alike.
+  table, fk = LINKS[model]
+  genre_ids = select(Genre.id).where(db.func.lower(Genre.name).in_([name.lower() for name in names]))
+  return select(fk).where(fk == model.id, table.c.genre_id.in_(genre_ids)).exists()
+
+def genre_names_by_id(model, ids):
+  # {entity id: [genre names]} for a batch of ids in one statement
+  table, fk = LINKS[model]
+  rows = db.session.query(fk, Genre.name) \
+    .join(Genre, Genre.id == table.c.genre_id) \
+    .filter(fk.in_(ids)) \
+    .order_by(fk, Genre.name)
+  names = dict((id, []) for id in ids)
+  for id, name in rows:
+    names[id].append(name)
+  return names
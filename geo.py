@@ -0,0 +1,226 @@
+#----------------------------------------------------------------------------#
+# Geo.
+#----------------------------------------------------------------------------#
+
+# Venue coordinates and the /venues/nearby radius search.
+#
+# Geocoding is offline: venues are placed at their city's centroid from
+# the bundled gazetteer (GAZETTEER_PATH, a city,state,latitude,longitude
+# CSV). Unknown cities leave the coordinates empty. `flask geo backfill`
+# fills in existing rows.
+#
+# Every located venue also stores the geohash of its coordinates, and
+# ix_venue_geohash is a plain B-tree over it, so it works the same on
+# SQLite and Postgres. A radius search covers the circle's bounding box
+# with a handful of geohash cells. Each cell is one index range scan
+# (geohash >= cell AND geohash < next cell). The candidates are then
+# measured exactly and sorted by great-circle distance. Searches widen
+# from a small circle, so dense areas stop early.
+
+import csv
+import heapq
+import math
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+from models import db, Venue
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+# most cells a search may cover before it drops to a coarser precision
+MAX_CELLS = 16
+# radius of the first circle nearby_venues tries
+FIRST_RADIUS_KM = 2.0
+
+
+#  Geohash
+#  ----------------------------------------------------------------
+
+def geohash(lat, lng, precision=PRECISION):
+  lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+  chars, bits, ch, even = [], 0, 0, True
+  while len(chars) < precision:
+    rng, value = (lng_range, lng) if even else (lat_range, lat)
+    mid = (rng[0] + rng[1]) / 2
+    ch <<= 1
+    if value >= mid:
+      ch |= 1
+      rng[0] = mid
+    else:
+      rng[1] = mid
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(BASE32[ch])
+      bits, ch = 0, 0
+  return ''.join(chars)
+
+def cell_size(precision):
+  # (degrees of latitude, degrees of longitude) spanned by one cell
+  lng_bits = (5 * precision + 1) // 2
+  lat_bits = 5 * precision // 2
+  return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def next_prefix(prefix):
+  # smallest string sorting after every string starting with prefix, or
+  # None when there is none ('zzz')
+  prefix = prefix.rstrip(BASE32[-1])
+  if not prefix:
+    return None
+  return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+def distance_km(lat1, lng1, lat2, lng2):
+  # haversine
+  lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(lat, lng, radius_km):
+  dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+  dlng = dlat / max(math.cos(math.radians(lat)), 0.01)
+  return max(lat - dlat, -90.0), min(lat + dlat, 90.0), lng - min(dlng, 180.0), lng + min(dlng, 180.0)
+
+def covering_cells(lat, lng, radius_km):
+  # geohash prefixes whose cells together cover the circle's bounding box,
+  # at the finest precision that needs no more than MAX_CELLS of them
+  south, north, west, east = bounding_box(lat, lng, radius_km)
+  for precision in range(PRECISION, 0, -1):
+    lat_step, lng_step = cell_size(precision)
+    rows = math.floor(north / lat_step) - math.floor(south / lat_step) + 1
+    cols = math.floor(east / lng_step) - math.floor(west / lng_step) + 1
+    if rows * cols <= MAX_CELLS or precision == 1:
+      break
+  cells = set()
+  for row in range(rows):
+    cell_lat = min((math.floor(south / lat_step) + row + 0.5) * lat_step, 90.0)
+    for col in range(cols):
+      cell_lng = (math.floor(west / lng_step) + col + 0.5) * lng_step
+      cell_lng = (cell_lng + 180.0) % 360.0 - 180.0
+      cells.add(geohash(cell_lat, cell_lng, precision))
+  return sorted(cells)
+
+
+#  Gazetteer
+#  ----------------------------------------------------------------
+
+def place_key(city, state):
+  return (" ".join((city or '').replace('.', '').casefold().split()), (state or '').strip().upper())
+
+
+class Gazetteer(object):
+
+  def __init__(self, path=None):
+    self.path = path
+    self._places = None
+
+  def init_app(self, app):
+    self.path = app.config['GAZETTEER_PATH']
+    self._places = None
+
+  def load(self):
+    places = {}
+    with open(self.path, encoding='utf-8') as f:
+      for row in csv.DictReader(f):
+        places[place_key(row['city'], row['state'])] = (float(row['latitude']), float(row['longitude']))
+    self._places = places
+    return places
+
+  def lookup(self, city, state):
+    places = self._places if self._places is not None else self.load()
+    return places.get(place_key(city, state))
+
+  def locate(self, venue):
+    # sets latitude/longitude/geohash from the venue's city and state
+    point = self.lookup(venue.city, venue.state)
+    if point is None:
+      venue.latitude = venue.longitude = venue.geohash = None
+    else:
+      venue.latitude, venue.longitude = point
+      venue.geohash = geohash(*point)
+    return point is not None
+
+
+gazetteer = Gazetteer()
+
+
+#  Search
+#  ----------------------------------------------------------------
+
+def candidates(lat, lng, radius_km):
+  # (distance, id, row) for every venue within radius_km
+  ranges = []
+  for cell in covering_cells(lat, lng, radius_km):
+    upper = next_prefix(cell)
+    ranges.append(and_(Venue.geohash >= cell, Venue.geohash < upper) if upper else Venue.geohash >= cell)
+  south, north, west, east = bounding_box(lat, lng, radius_km)
+  query = db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      Venue.latitude,
+      Venue.longitude,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(or_(*ranges), Venue.latitude.between(south, north))
+  if -180.0 <= west and east < 180.0:
+    # cheap residual filter; skipped when the box wraps the antimeridian
+    query = query.filter(Venue.longitude.between(west, east))
+
+  matches = []
+  for row in query:
+    distance = distance_km(lat, lng, row.latitude, row.longitude)
+    if distance <= radius_km:
+      matches.append((distance, row.id, row))
+  return matches
+
+def nearby_venues(lat, lng, radius_km, limit=20):
+  # the limit venues within radius_km of (lat, lng), nearest first. Starts
+  # with a small circle and doubles it until it holds limit venues: every
+  # venue closer than the circle's edge is in it, so its nearest are the
+  # answer, and a dense city never reads every venue within radius_km.
+  search_km = min(radius_km, FIRST_RADIUS_KM)
+  while True:
+    matches = candidates(lat, lng, search_km)
+    if len(matches) >= limit or search_km >= radius_km:
+      break
+    search_km = min(radius_km, search_km * 2)
+  return [{
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "latitude": row.latitude,
+    "longitude": row.longitude,
+    "distance_km": round(distance, 3),
+    "num_upcoming_shows": row.num_upcoming_shows,
+  } for distance, _, row in heapq.nsmallest(limit, matches)]
+
+
+#  CLI
+#  ----------------------------------------------------------------
+
+geo_cli = AppGroup('geo', help='Venue geocoding.')
+
+@geo_cli.command('backfill')
+@click.option('--all', 'everything', is_flag=True, help='Re-geocode venues that already have coordinates.')
+@click.option('--batch-size', default=1000, show_default=True)
+def backfill_command(everything, batch_size):
+  """Geocode venues from the bundled gazetteer."""
+  located = missing = 0
+  last_id = 0
+  while True:
+    query = Venue.query.filter(Venue.id > last_id)
+    if not everything:
+      query = query.filter(Venue.latitude.is_(None))
+    venues = query.order_by(Venue.id).limit(batch_size).all()
+    if not venues:
+      break
+    for venue in venues:
+      if gazetteer.locate(venue):
+        located += 1
+      else:
+        missing += 1
+    last_id = venues[-1].id
+    db.session.commit()
+  click.echo('%d venues located, %d not in the gazetteer' % (located, missing))
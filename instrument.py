@@ -0,0 +1,223 @@
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#----------------------------------------------------------------------------#
+
+# Per-request profile of every view: statements sent to the database and
+# the time spent in them (engine cursor events), template render time
+# (Flask's before_render_template / template_rendered signals) and the
+# slowest statements. Each response gets a Server-Timing header. Statements
+# slower than SLOW_QUERY_MS are logged as warnings, and with REQUEST_LOG
+# every request is logged as one JSON line.
+#
+# Totals are aggregated per endpoint and exposed in the Prometheus text
+# format at /_metrics: request counts, a latency histogram, database
+# statements and time. The histograms stop at the view's return, so the
+# body of a streamed response is not included.
+
+import heapq
+import json
+import threading
+import time
+from flask import g, has_request_context, request, request_started, request_finished, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds (seconds) of the request latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# slowest statements kept per request
+SLOWEST = 3
+
+
+class Profile(object):
+  # what one request did, kept on flask.g
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+    self.template_time = 0.0
+    self.slowest = []
+    self._template_started = None
+
+  def record_query(self, statement, seconds):
+    self.queries += 1
+    self.db_time += seconds
+    item = (seconds, self.queries, " ".join(statement.split())[:300])
+    if len(self.slowest) < SLOWEST:
+      heapq.heappush(self.slowest, item)
+    else:
+      heapq.heappushpop(self.slowest, item)
+
+  def slowest_statements(self):
+    return [{"ms": round(seconds * 1000, 3), "statement": statement} for seconds, _, statement in sorted(self.slowest, reverse=True)]
+
+
+class EndpointStats(object):
+
+  def __init__(self):
+    self.requests = {}
+    self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    self.latency_sum = 0.0
+    self.queries = 0
+    self.db_time = 0.0
+    self.template_time = 0.0
+
+
+class Instrumentation(object):
+
+  def __init__(self):
+    self.enabled = False
+    self.slow_query_seconds = 0.1
+    self.log_requests = False
+    self._stats = {}
+    self._lock = threading.Lock()
+    self._app = None
+
+  def init_app(self, app):
+    self.enabled = app.config.get('INSTRUMENT_REQUESTS', True)
+    self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 100) / 1000.0
+    self.log_requests = app.config.get('REQUEST_LOG', False)
+    if not self.enabled:
+      return
+    self._app = app
+    # class-level listeners also cover the replica engines
+    if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+    request_started.connect(self._request_started, app)
+    before_render_template.connect(self._before_render, app)
+    template_rendered.connect(self._rendered, app)
+    request_finished.connect(self._request_finished, app)
+
+  #  Signal and event handlers
+  #  ----------------------------------------------------------------
+
+  def _profile(self):
+    return g.get('_profile') if has_request_context() else None
+
+  def _request_started(self, sender, **extra):
+    g._profile = Profile()
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    if self._profile() is not None:
+      conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    profile = self._profile()
+    started = conn.info.get('_query_started')
+    if profile is None or not started:
+      return
+    seconds = time.perf_counter() - started.pop()
+    profile.record_query(statement, seconds)
+    if seconds >= self.slow_query_seconds:
+      self._app.logger.warning('slow query %.1fms on %s: %s', seconds * 1000, request.endpoint, " ".join(statement.split())[:1000])
+
+  def _before_render(self, sender, template, context, **extra):
+    profile = self._profile()
+    if profile is not None:
+      profile._template_started = time.perf_counter()
+
+  def _rendered(self, sender, template, context, **extra):
+    profile = self._profile()
+    if profile is not None and profile._template_started is not None:
+      profile.template_time += time.perf_counter() - profile._template_started
+      profile._template_started = None
+
+  def _request_finished(self, sender, response, **extra):
+    profile = self._profile()
+    if profile is None:
+      return
+    elapsed = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unmatched'
+    response.headers['Server-Timing'] = ', '.join([
+      'db;desc="%d queries";dur=%.2f' % (profile.queries, profile.db_time * 1000),
+      'tpl;dur=%.2f' % (profile.template_time * 1000),
+      'app;dur=%.2f' % (elapsed * 1000),
+    ])
+    self.record(endpoint, request.method, response.status_code, elapsed, profile)
+    if self.log_requests:
+      self._app.logger.info(json.dumps({
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 3),
+        "db_queries": profile.queries,
+        "db_ms": round(profile.db_time * 1000, 3),
+        "template_ms": round(profile.template_time * 1000, 3),
+        "slowest": profile.slowest_statements(),
+      }))
+
+  #  Aggregates
+  #  ----------------------------------------------------------------
+
+  def record(self, endpoint, method, status, seconds, profile):
+    with self._lock:
+      stats = self._stats.get(endpoint)
+      if stats is None:
+        stats = self._stats[endpoint] = EndpointStats()
+      key = (method, status)
+      stats.requests[key] = stats.requests.get(key, 0) + 1
+      for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+          stats.buckets[i] += 1
+          break
+      else:
+        stats.buckets[-1] += 1
+      stats.latency_sum += seconds
+      stats.queries += profile.queries
+      stats.db_time += profile.db_time
+      stats.template_time += profile.template_time
+
+  def reset(self):
+    with self._lock:
+      self._stats = {}
+
+  def prometheus(self, extra=()):
+    # the aggregates in the Prometheus text exposition format; extra is an
+    # iterable of (name, type, help, [(labels, value)]) families
+    lines = []
+    with self._lock:
+      stats = sorted(self._stats.items())
+      family(lines, 'fyyur_requests_total', 'counter', 'Requests handled, by endpoint, method and status.', [
+        ((('endpoint', endpoint), ('method', method), ('status', status)), count)
+        for endpoint, stat in stats for (method, status), count in sorted(stat.requests.items())])
+
+      header(lines, 'fyyur_request_duration_seconds', 'histogram', 'Time to produce the response, by endpoint.')
+      for endpoint, stat in stats:
+        cumulative = 0
+        for bound, count in zip([repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], stat.buckets):
+          cumulative += count
+          lines.append(sample('fyyur_request_duration_seconds_bucket', (('endpoint', endpoint), ('le', bound)), cumulative))
+        lines.append(sample('fyyur_request_duration_seconds_sum', (('endpoint', endpoint),), stat.latency_sum))
+        lines.append(sample('fyyur_request_duration_seconds_count', (('endpoint', endpoint),), cumulative))
+
+      family(lines, 'fyyur_db_queries_total', 'counter', 'SQL statements issued, by endpoint.',
+             [((('endpoint', endpoint),), stat.queries) for endpoint, stat in stats])
+      family(lines, 'fyyur_db_seconds_total', 'counter', 'Time spent in SQL statements, by endpoint.',
+             [((('endpoint', endpoint),), stat.db_time) for endpoint, stat in stats])
+      family(lines, 'fyyur_template_seconds_total', 'counter', 'Time spent rendering templates, by endpoint.',
+             [((('endpoint', endpoint),), stat.template_time) for endpoint, stat in stats])
+    for name, kind, help, samples in extra:
+      family(lines, name, kind, help, samples)
+    return '\n'.join(lines) + '\n'
+
+
+def header(lines, name, kind, help):
+  lines.append('# HELP %s %s' % (name, help))
+  lines.append('# TYPE %s %s' % (name, kind))
+
+def sample(name, labels, value):
+  if isinstance(value, float):
+    value = repr(value)
+  if not labels:
+    return '%s %s' % (name, value)
+  escaped = ('%s="%s"' % (key, str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, val in labels)
+  return '%s{%s} %s' % (name, ','.join(escaped), value)
+
+def family(lines, name, kind, help, samples):
+  header(lines, name, kind, help)
+  lines.extend(sample(name, labels, value) for labels, value in samples)
+
+
+instrumentation = Instrumentation()
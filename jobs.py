@@ -0,0 +1,388 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-up work the write handlers hand off instead of doing it before
+# they respond. Tasks are functions registered by name:
+#
+#     @task()
+#     def invalidate_venue_artists(venue_id): ...
+#
+#     jobs.enqueue(invalidate_venue_artists, venue_id)
+#
+# Enqueued inside a transaction (before db.session.commit()), a job waits
+# for that transaction to commit and is dropped if it rolls back; outside
+# one it is queued right away. Arguments go through JSON, so tasks take ids
+# rather than model instances, and each run gets an app context (and
+# session) of its own.
+#
+# JOBS_BACKEND picks where jobs run:
+#
+# - 'thread': a pool of JOBS_WORKERS threads in each web process
+# - 'process': a pool of JOBS_WORKERS processes forked from the web process
+# - 'database': rows in the job table, inserted in the transaction of the
+#   write they follow up on and run by dedicated workers:
+#
+#       flask jobs work [--concurrency 4] [--burst]
+#
+#   Workers claim a job with a conditional UPDATE (after SELECT ... FOR
+#   UPDATE SKIP LOCKED on Postgres), so any number of them share the table.
+#   A job whose worker died is run again after JOBS_LOCK_SECONDS.
+# - 'inline' (or None): right after the commit, before the response
+#
+# A failing job is retried until it has run JOBS_MAX_ATTEMPTS times,
+# JOBS_RETRY_SECONDS after the first failure and twice as long after each
+# further one. The pools keep their queue in memory, lost when the process
+# exits; only 'database' survives a restart. Tasks that change per-process
+# state (the 'memory' response cache) only reach the web process from the
+# 'thread' and 'inline' backends.
+#
+# Queue depth and totals are served at /_jobs/stats and /_metrics, and
+#
+#     flask jobs status         (the job table by status and task)
+#     flask jobs retry          (queue its failed jobs again)
+
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Job
+
+BACKENDS = ('thread', 'process', 'database', 'inline')
+STATUSES = ('queued', 'running', 'failed')
+# session.info key of the jobs waiting for the session to commit
+PENDING = 'jobs_pending'
+
+TASKS = {}
+
+
+class Task(object):
+
+  def __init__(self, fn, name, attempts=None):
+    self.fn = fn
+    self.name = name
+    self.attempts = attempts
+
+  def __call__(self, *args):
+    return self.fn(*args)
+
+def task(name=None, attempts=None):
+  # registers the function under name (default: its own); attempts
+  # overrides JOBS_MAX_ATTEMPTS for it
+  def register(fn):
+    registered = Task(fn, name or fn.__name__, attempts)
+    TASKS[registered.name] = registered
+    return registered
+  return register
+
+def execute(name, args):
+  # one run of a job, in a pool worker or `flask jobs work`
+  with jobs.app.app_context():
+    TASKS[name](*args)
+
+def init_process():
+  # pool processes are forked from a web worker, which owns the pooled
+  # connections they inherit
+  with jobs.app.app_context():
+    db.engine.dispose(close=False)
+
+
+class JobQueue(object):
+
+  def __init__(self):
+    self.app = None
+    self.backend = 'thread'
+    self.workers = 2
+    self.max_attempts = 3
+    self.retry_seconds = 5.0
+    self.poll_seconds = 1.0
+    self.lock_seconds = 300
+    self.executor = None
+    # jobs of this process not finished yet, including retries waiting
+    self.pending = 0
+    self.enqueued = 0
+    self.succeeded = 0
+    self.retried = 0
+    self.failed = 0
+    self._idle = threading.Condition()
+
+  def init_app(self, app):
+    backend = app.config.get('JOBS_BACKEND') or 'inline'
+    if backend not in BACKENDS:
+      raise ValueError('JOBS_BACKEND must be one of %s, not %r' % (', '.join(BACKENDS), backend))
+    self.shutdown()
+    self.app = app
+    self.backend = backend
+    self.workers = app.config.get('JOBS_WORKERS', self.workers)
+    self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', self.max_attempts)
+    self.retry_seconds = app.config.get('JOBS_RETRY_SECONDS', self.retry_seconds)
+    self.poll_seconds = app.config.get('JOBS_POLL_SECONDS', self.poll_seconds)
+    self.lock_seconds = app.config.get('JOBS_LOCK_SECONDS', self.lock_seconds)
+    app.extensions['jobs'] = self
+
+  def enqueue(self, task, *args):
+    name = getattr(task, 'name', task)
+    if name not in TASKS:
+      raise KeyError('unknown task %r' % name)
+    # every backend sees the arguments the job table would store
+    args = json.loads(json.dumps(args))
+    session = db.session()
+    self.count('enqueued')
+    if self.backend == 'database':
+      insert = Job.__table__.insert().values(task=name, args=json.dumps(args))
+      if session.in_transaction():
+        session.execute(insert)
+      else:
+        with db.engine.begin() as connection:
+          connection.execute(insert)
+    elif session.in_transaction():
+      session.info.setdefault(PENDING, []).append((name, args))
+    else:
+      self.submit(name, args)
+
+  def count(self, counter, pending=0):
+    with self._idle:
+      setattr(self, counter, getattr(self, counter) + 1)
+      self.pending += pending
+      if not self.pending:
+        self._idle.notify_all()
+
+  def attempts(self, name):
+    attempts = TASKS[name].attempts if name in TASKS else None
+    return attempts or self.max_attempts
+
+  def retry_delay(self, attempt):
+    # after the attempt'th failure
+    return self.retry_seconds * 2 ** (attempt - 1)
+
+  #  In-process pools
+  #  ----------------------------------------------------------------
+
+  def pool(self):
+    with self._idle:
+      if self.executor is None:
+        if self.backend == 'process':
+          self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'), initializer=init_process)
+        else:
+          self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='jobs')
+      return self.executor
+
+  def submit(self, name, args):
+    with self._idle:
+      self.pending += 1
+    self.start(name, args, 1)
+
+  def start(self, name, args, attempt):
+    if self.backend == 'inline':
+      try:
+        execute(name, args)
+      except Exception as e:
+        self.done(name, args, attempt, e)
+      else:
+        self.done(name, args, attempt, None)
+      return
+    future = self.pool().submit(execute, name, args)
+    future.add_done_callback(lambda future: self.done(name, args, attempt, future.exception()))
+
+  def done(self, name, args, attempt, error):
+    if error is None:
+      self.count('succeeded', pending=-1)
+    elif attempt < self.attempts(name):
+      delay = self.retry_delay(attempt)
+      self.app.logger.warning('job %s%r failed (attempt %d), retrying in %.1fs: %r', name, tuple(args), attempt, delay, error)
+      self.count('retried')
+      timer = threading.Timer(delay, self.start, (name, args, attempt + 1))
+      timer.daemon = True
+      timer.start()
+    else:
+      self.app.logger.error('job %s%r failed after %d attempts', name, tuple(args), attempt, exc_info=error)
+      self.count('failed', pending=-1)
+
+  def wait(self, timeout=None):
+    # until every job of this process has finished; False on timeout
+    with self._idle:
+      return self._idle.wait_for(lambda: not self.pending, timeout)
+
+  def shutdown(self, wait=True):
+    executor, self.executor = self.executor, None
+    if executor is not None:
+      executor.shutdown(wait=wait)
+
+  #  Job table
+  #  ----------------------------------------------------------------
+
+  def claim(self, worker):
+    # the next due job, marked as running by worker: (id, task, args,
+    # attempt), or None when no job is due
+    while True:
+      now = datetime.utcnow()
+      due = db.or_(
+        db.and_(Job.status == 'queued', Job.run_at <= now),
+        db.and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=self.lock_seconds)))
+      query = db.session.query(Job.id, Job.task, Job.args, Job.attempts).filter(due).order_by(Job.run_at, Job.id).limit(1)
+      if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+      job = query.first()
+      if job is None:
+        db.session.rollback()
+        return None
+      # repeats the condition, so of two workers that picked the same job
+      # only one updates it
+      claimed = db.session.query(Job).filter(Job.id == job.id, due).update(
+        {Job.status: 'running', Job.locked_at: now, Job.locked_by: worker, Job.attempts: Job.attempts + 1},
+        synchronize_session=False)
+      db.session.commit()
+      if claimed:
+        return job.id, job.task, json.loads(job.args), job.attempts + 1
+
+  def finish(self, job_id, name, attempt, worker, error):
+    job = db.session.query(Job).filter(Job.id == job_id, Job.locked_by == worker)
+    if error is None:
+      job.delete(synchronize_session=False)
+      self.count('succeeded')
+    elif attempt < self.attempts(name):
+      delay = self.retry_delay(attempt)
+      self.app.logger.warning('job %d %s failed (attempt %d), retrying in %.1fs: %r', job_id, name, attempt, delay, error)
+      job.update({Job.status: 'queued', Job.run_at: datetime.utcnow() + timedelta(seconds=delay),
+                  Job.locked_at: None, Job.locked_by: None, Job.last_error: repr(error)}, synchronize_session=False)
+      self.count('retried')
+    else:
+      self.app.logger.error('job %d %s failed after %d attempts', job_id, name, attempt, exc_info=error)
+      job.update({Job.status: 'failed', Job.locked_at: None, Job.locked_by: None, Job.last_error: repr(error)},
+                 synchronize_session=False)
+      self.count('failed')
+    db.session.commit()
+
+  def work_one(self, worker):
+    # runs the next due job; False when there was none
+    job = self.claim(worker)
+    if job is None:
+      return False
+    job_id, name, args, attempt = job
+    error = None
+    try:
+      if name not in TASKS:
+        raise KeyError('unknown task %r' % name)
+      execute(name, args)
+    except Exception as e:
+      error = e
+    self.finish(job_id, name, attempt, worker, error)
+    return True
+
+  def work(self, concurrency=1, burst=False):
+    # runs jobs from the table in concurrency threads until SIGTERM or
+    # Ctrl-C (each thread finishes its current job), or with burst until
+    # no job is due
+    stop = threading.Event()
+
+    def loop(number):
+      worker = '%s:%d:%d' % (socket.gethostname(), os.getpid(), number)
+      with self.app.app_context():
+        while not stop.is_set():
+          try:
+            if self.work_one(worker):
+              continue
+          except Exception:
+            db.session.rollback()
+            self.app.logger.exception('job worker %s', worker)
+          if burst:
+            break
+          stop.wait(self.poll_seconds)
+
+    threads = [threading.Thread(target=loop, args=(number,), name='jobs-%d' % number, daemon=True)
+               for number in range(concurrency)]
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+      for thread in threads:
+        thread.start()
+      while any(thread.is_alive() for thread in threads):
+        try:
+          for thread in threads:
+            thread.join(0.5)
+        except KeyboardInterrupt:
+          stop.set()
+    finally:
+      signal.signal(signal.SIGTERM, previous)
+
+  def depth(self):
+    # {status: (jobs, seconds since the oldest was created)} of the job table
+    now = datetime.utcnow()
+    rows = db.session.query(Job.status, db.func.count(Job.id), db.func.min(Job.created_at)).group_by(Job.status).all()
+    depth = dict((status, (0, 0.0)) for status in STATUSES)
+    for status, count, oldest in rows:
+      depth[status] = (count, (now - oldest).total_seconds() if oldest else 0.0)
+    return depth
+
+  def stats(self):
+    stats = {
+      "backend": self.backend,
+      "workers": self.workers,
+      "pending": self.pending,
+      "enqueued": self.enqueued,
+      "succeeded": self.succeeded,
+      "retried": self.retried,
+      "failed": self.failed,
+    }
+    if self.backend == 'database':
+      stats["queue"] = dict((status, {"jobs": count, "oldest_seconds": round(age, 1)})
+                            for status, (count, age) in self.depth().items())
+    return stats
+
+
+jobs = JobQueue()
+
+
+@event.listens_for(Session, 'after_commit')
+def _submit_pending(session):
+  for name, args in session.info.pop(PENDING, ()):
+    jobs.submit(name, args)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_pending(session, transaction):
+  # rolled back, or closed without committing
+  if transaction.parent is None:
+    session.info.pop(PENDING, None)
+
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+@jobs_cli.command('work')
+@click.option('--concurrency', default=1, show_default=True, help='Jobs run at once.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due.')
+def work_command(concurrency, burst):
+  """Run jobs from the job table (JOBS_BACKEND=database)."""
+  if jobs.backend != 'database':
+    raise click.UsageError('JOBS_BACKEND is %r, workers only run the "database" backend' % jobs.backend)
+  jobs.work(concurrency, burst)
+  click.echo('%d succeeded, %d retried, %d failed' % (jobs.succeeded, jobs.retried, jobs.failed))
+
+@jobs_cli.command('status')
+def status_command():
+  """Count the jobs in the job table by status and task."""
+  rows = db.session.query(Job.status, Job.task, db.func.count(Job.id), db.func.min(Job.created_at)) \
+    .group_by(Job.status, Job.task).order_by(Job.status, Job.task).all()
+  for status, name, count, oldest in rows:
+    click.echo('%-8s %-32s %7d  oldest %s' % (status, name, count, oldest.isoformat(' ', 'seconds')))
+  if not rows:
+    click.echo('no jobs')
+  for job in db.session.query(Job).filter(Job.status == 'failed').order_by(Job.id.desc()).limit(10):
+    click.echo('failed job %d %s%s: %s' % (job.id, job.task, tuple(json.loads(job.args)), job.last_error))
+
+@jobs_cli.command('retry')
+@click.option('--task', 'name', help='Only jobs of this task.')
+def retry_command(name):
+  """Queue the failed jobs again, with their attempts reset."""
+  query = db.session.query(Job).filter(Job.status == 'failed')
+  if name:
+    query = query.filter(Job.task == name)
+  count = query.update({Job.status: 'queued', Job.attempts: 0, Job.run_at: datetime.utcnow()}, synchronize_session=False)
+  db.session.commit()
+  click.echo('%d jobs queued' % count)
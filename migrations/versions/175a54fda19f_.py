@@ -0,0 +1,31 @@
+"""add updated_at version columns
+
+Revision ID: 175a54fda19f
+Revises: 8cdd88191f12
+Create Date: 2026-10-18 11:26:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '175a54fda19f'
+down_revision = '8cdd88191f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows are stamped with the migration time through the server default
+    for table in ('venue', 'artist', 'shows'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+            batch_op.create_index(batch_op.f('ix_%s_updated_at' % table), ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('shows', 'artist', 'venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_%s_updated_at' % table))
+            batch_op.drop_column('updated_at')
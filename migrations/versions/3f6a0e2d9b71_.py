@@ -0,0 +1,33 @@
+"""add venue coordinates and geohash index
+
+Revision ID: 3f6a0e2d9b71
+Revises: c1b04c275233
+Create Date: 2026-10-18 15:10:44.027316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a0e2d9b71'
+down_revision = 'c1b04c275233'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing venues are geocoded afterwards with `flask geo backfill`
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index('ix_venue_geohash', ['geohash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.drop_index('ix_venue_geohash')
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,32 @@
+"""add indexes for show and venue filter columns
+
+Revision ID: 5509ffa6b986
+Revises: 38dd87dee505
+Create Date: 2026-10-18 09:12:41.532804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5509ffa6b986'
+down_revision = '38dd87dee505'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    # the keyset index the /shows pagination (queries.show_feed) relies on;
+    # it has no migration of its own and is created here
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+    op.create_index('ix_venue_city_state', 'venue', ['city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_city_state', table_name='venue')
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
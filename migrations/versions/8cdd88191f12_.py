@@ -0,0 +1,30 @@
+"""add trigram indexes for venue and artist name search
+
+Revision ID: 8cdd88191f12
+Revises: 5509ffa6b986
+Create Date: 2026-10-18 10:03:17.118240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8cdd88191f12'
+down_revision = '5509ffa6b986'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GIN trigram indexes on Postgres; other databases get a plain index on
+    # name, which is what the model metadata creates there as well.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venue_name_trgm', 'venue', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artist_name_trgm', 'artist', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_trgm', table_name='artist')
+    op.drop_index('ix_venue_name_trgm', table_name='venue')
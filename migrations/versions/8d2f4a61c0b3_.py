@@ -0,0 +1,45 @@
+"""add show_calendar summary table
+
+Revision ID: 8d2f4a61c0b3
+Revises: 3f6a0e2d9b71
+Create Date: 2026-10-18 18:20:51.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f4a61c0b3'
+down_revision = '3f6a0e2d9b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_calendar',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=True),
+        sa.Column('state', sa.String(length=120), nullable=True),
+        sa.Column('area', sa.String(length=120), nullable=True),
+        sa.Column('show_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('venue_id', 'day')
+    )
+    op.create_index('ix_show_calendar_area_day', 'show_calendar', ['area', 'day'], unique=False)
+    op.create_index('ix_show_calendar_day', 'show_calendar', ['day'], unique=False)
+
+    # backfill, the same statement as show_calendar.refresh()
+    op.execute(
+        'INSERT INTO show_calendar (venue_id, day, city, state, area, show_count) '
+        'SELECT shows.venue_id, date(shows.start_time), venue.city, venue.state, lower(trim(venue.city)), count(shows.id) '
+        'FROM shows JOIN venue ON venue.id = shows.venue_id '
+        'GROUP BY shows.venue_id, date(shows.start_time), venue.city, venue.state'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_show_calendar_day', table_name='show_calendar')
+    op.drop_index('ix_show_calendar_area_day', table_name='show_calendar')
+    op.drop_table('show_calendar')
@@ -0,0 +1,99 @@
+"""normalize genres into genre, venue_genre and artist_genre
+
+Revision ID: c1b04c275233
+Revises: cc3a91f85206
+Create Date: 2026-10-18 14:02:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1b04c275233'
+down_revision = 'cc3a91f85206'
+branch_labels = None
+depends_on = None
+
+# forms.Genre at the time of this migration
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Heavy Metal',
+    'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+# (entity table, legacy text column, association table, foreign key)
+LINKS = (
+    ('venue', 'genre', 'venue_genre', 'venue_id'),
+    ('artist', 'genres', 'artist_genre', 'artist_id'),
+)
+
+
+def parse_legacy(text, known):
+    # The old columns held the form values joined with spaces (written by
+    # the create/edit handlers) or with commas (seed data). Multi-word
+    # genres are recovered by matching the longest known name at each word.
+    names = []
+    for part in (text or '').strip('{}').split(','):
+        words = part.strip().strip('"').split()
+        while words:
+            for size in range(len(words), 0, -1):
+                candidate = " ".join(words[:size])
+                if candidate.lower() in known or size == 1:
+                    names.append(known.get(candidate.lower(), candidate))
+                    words = words[size:]
+                    break
+    return list(dict.fromkeys(names))
+
+
+def upgrade():
+    genre = op.create_table('genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    for table, _, link, fk in LINKS:
+        op.create_table(link,
+            sa.Column(fk, sa.Integer(), nullable=False),
+            sa.Column('genre_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+            sa.ForeignKeyConstraint([fk], ['%s.id' % table], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(fk, 'genre_id')
+        )
+        op.create_index('ix_%s_genre_id_%s' % (link, fk), link, ['genre_id', fk], unique=False)
+
+    # seed, then backfill the links from the legacy text columns
+    conn = op.get_bind()
+    op.bulk_insert(genre, [{"name": name} for name in GENRES])
+    ids = dict((name, id) for id, name in conn.execute(sa.text('SELECT id, name FROM genre')))
+    known = dict((name.lower(), name) for name in ids)
+    for table, column, link, fk in LINKS:
+        rows = []
+        for id, text in conn.execute(sa.text('SELECT id, %s FROM %s WHERE %s IS NOT NULL' % (column, table, column))):
+            for name in parse_legacy(text, known):
+                if name not in ids:
+                    conn.execute(sa.text('INSERT INTO genre (name) VALUES (:name)'), {"name": name})
+                    ids[name] = conn.execute(sa.text('SELECT id FROM genre WHERE name = :name'), {"name": name}).scalar()
+                    known[name.lower()] = name
+                rows.append({fk: id, "genre_id": ids[name]})
+        if rows:
+            conn.execute(sa.text('INSERT INTO %s (%s, genre_id) VALUES (:%s, :genre_id)' % (link, fk, fk)), rows)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(column)
+
+
+def downgrade():
+    conn = op.get_bind()
+    for table, column, link, fk in LINKS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column(column, sa.String(length=120), nullable=True))
+        names = {}
+        for id, name in conn.execute(sa.text(
+                'SELECT l.%s, g.name FROM %s l JOIN genre g ON g.id = l.genre_id ORDER BY l.%s, g.name' % (fk, link, fk))):
+            names.setdefault(id, []).append(name)
+        if names:
+            conn.execute(sa.text('UPDATE %s SET %s = :value WHERE id = :id' % (table, column)),
+                         [{"id": id, "value": " ".join(value)} for id, value in names.items()])
+        op.drop_index('ix_%s_genre_id_%s' % (link, fk), table_name=link)
+        op.drop_table(link)
+    op.drop_table('genre')
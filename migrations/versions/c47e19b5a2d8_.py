@@ -0,0 +1,38 @@
+"""add job table for the background job queue
+
+Revision ID: c47e19b5a2d8
+Revises: 8d2f4a61c0b3
+Create Date: 2026-10-18 21:04:37.118420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e19b5a2d8'
+down_revision = '8d2f4a61c0b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task', sa.String(length=120), nullable=False),
+        sa.Column('args', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=10), server_default='queued', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_by', sa.String(length=120), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_status_run_at', 'job', ['status', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_job_status_run_at', table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,44 @@
+"""add denormalized show counters to venue and artist
+
+Revision ID: cc3a91f85206
+Revises: 175a54fda19f
+Create Date: 2026-10-18 12:41:09.370562
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc3a91f85206'
+down_revision = '175a54fda19f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, show_fk in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('next_show_at', sa.DateTime(), nullable=True))
+            batch_op.create_index(batch_op.f('ix_%s_next_show_at' % table), ['next_show_at'], unique=False)
+
+        # backfill; `flask counters rollover` keeps them current from here on
+        op.get_bind().execute(sa.text(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND shows.start_time > :now), '
+            'past_shows_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND shows.start_time <= :now), '
+            'next_show_at = (SELECT min(start_time) FROM shows WHERE shows.{fk} = {table}.id AND shows.start_time > :now)'
+            .format(table=table, fk=show_fk)
+        ), {"now": datetime.now()})
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_%s_next_show_at' % table))
+            batch_op.drop_column('next_show_at')
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
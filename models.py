@@ -3,12 +3,76 @@
 #----------------------------------------------------------------------------#
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.orm import Session
 from datetime import datetime
+from routing import RoutingSession
 
-db = SQLAlchemy()
+class RoutingSQLAlchemy(SQLAlchemy):
+    # Flask-SQLAlchemy 3 picks the session class from session_options,
+    # 2.x builds its sessionmaker here
+    def create_session(self, options):
+        options = dict(options)
+        options.pop('class_', None)
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy(session_options={'class_': RoutingSession})
+
+# Relationships load on demand. Every query in app.py states how it wants
+# them loaded (selectinload, raiseload or a column-only projection); with
+# RAISE_ON_LAZY_LOAD set, anything left to an implicit lazy load fails.
+
+class LazyLoadError(Exception):
+    pass
+
+def _raise_on_lazy_load(orm_execute_state):
+    if not orm_execute_state.is_select:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    if state is not None:
+        raise LazyLoadError(
+            'unexpected lazy load from %s; add a loader option to the query' % state.class_.__name__)
+
+def forbid_lazy_loads():
+    # the listener is global; register it once however many apps ask
+    if not event.contains(Session, 'do_orm_execute', _raise_on_lazy_load):
+        event.listen(Session, 'do_orm_execute', _raise_on_lazy_load)
+
+# Genres live in their own table, linked to venues and artists through
+# association tables indexed (genre_id, entity_id) so "jazz venues" is an
+# index range scan instead of parsing a text column on every row. The
+# table is seeded from forms.Genre (see genres.py).
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+venue_genre = db.Table(
+    'venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genre = db.Table(
+    'artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        # /venues groups by area
+        db.Index('ix_venue_city_state', 'city', 'state'),
+        # trigram index for ILIKE name search (needs the pg_trgm extension)
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # /venues/nearby scans geohash prefix ranges (see geo.py)
+        db.Index('ix_venue_geohash', 'geohash'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -16,31 +80,51 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genre = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship("Shows", backref="venues", lazy=False, cascade="all")
+    # bumped on every write; drives the ETags of the read pages
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+    # denormalized from shows, kept up to date by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    # geocoded from city/state by geo.py, empty when the city is unknown
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    shows = db.relationship("Shows", backref="venues", lazy="select", cascade="all")
+    genres = db.relationship("Genre", secondary=venue_genre, lazy="select", order_by=Genre.name)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        # trigram index for ILIKE name search (needs the pg_trgm extension)
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship("Shows", backref="artists", lazy=False, cascade="all")
+    # bumped on every write; drives the ETags of the read pages
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+    # denormalized from shows, kept up to date by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    shows = db.relationship("Shows", backref="artists", lazy="select", cascade="all")
+    genres = db.relationship("Genre", secondary=artist_genre, lazy="select", order_by=Genre.name)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -48,7 +132,59 @@ class Artist(db.Model):
 
 class Shows(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # detail pages split a venue's/artist's shows on start_time
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # keyset pagination of the /shows feed
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey("artist.id"), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey("venue.id"), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
\ No newline at end of file
+    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # bumped on every write; drives the ETags of the read pages
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+
+# Shows per venue per day, maintained by show_calendar.py so the date/city
+# filters on /shows read a few summary rows instead of scanning shows.
+
+class ShowCalendar(db.Model):
+    __tablename__ = 'show_calendar'
+    __table_args__ = (
+        # /shows?city=&from=&to=, and the same without a city
+        db.Index('ix_show_calendar_area_day', 'area', 'day'),
+        db.Index('ix_show_calendar_day', 'day'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    # lower(trim(city)), what the city filter matches
+    area = db.Column(db.String(120))
+    show_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Background jobs queued by jobs.py with JOBS_BACKEND = 'database'. A job's
+# row is deleted once it succeeds and kept, as failed, when it runs out of
+# attempts.
+
+class Job(db.Model):
+    __tablename__ = 'job'
+    __table_args__ = (
+        # the workers' next due job
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(120), nullable=False)
+    # JSON list of the task's arguments
+    args = db.Column(db.Text, nullable=False, default='[]')
+    # queued, running or failed
+    status = db.Column(db.String(10), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(120))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,363 @@
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# Read-side query shapes used by the controllers in app.py. Each helper
+# returns plain dicts/lists ready for the templates and issues a fixed
+# number of statements no matter how many rows it returns.
+
+from itertools import groupby
+from datetime import datetime
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import raiseload, selectinload
+from models import db, Artist, Venue, Shows, ShowCalendar
+from genres import has_genre
+
+
+def upcoming_shows_count(now):
+  # COUNT(shows.id) FILTER (WHERE shows.start_time > :now), meant to be
+  # used together with an outer join on shows and a GROUP BY.
+  return db.func.count(Shows.id).filter(Shows.start_time > now)
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def venue_areas(genres=None):
+  # areas -> venues -> num_upcoming_shows for /venues in one statement,
+  # counts come from the denormalized column (see counters.py); genres
+  # limits it to venues tagged with any of them
+  query = db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      Venue.upcoming_shows_count.label('num_upcoming_shows'),
+      Venue.updated_at
+    )
+  if genres:
+    query = query.filter(has_genre(Venue, genres))
+  rows = query.order_by(Venue.state, Venue.city, Venue.id).all()
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{"id": venue.id, "name": venue.name, "num_upcoming_shows": venue.num_upcoming_shows, "version": venue.updated_at} for venue in venues]
+    })
+  return areas
+
+
+#  Detail pages
+#  ----------------------------------------------------------------
+
+def entity_with_shows(model, show_fk, other, other_fk, entity_id, past_page=1, per_page=12, now=None):
+  # One statement for a venue/artist page: the entity outer-joined to its
+  # shows (and the artist/venue playing each), where every show row is
+  # tagged upcoming/past, numbered within its group and carries the group
+  # size. All upcoming shows come back, but only one page of past shows.
+  # Returns None when the entity does not exist.
+  now = now or datetime.now()
+  upcoming = Shows.start_time > now
+  ranked = db.session.query(
+      Shows.id,
+      show_fk.label('entity_id'),
+      other_fk.label('other_id'),
+      Shows.start_time,
+      Shows.updated_at,
+      upcoming.label('upcoming'),
+      db.func.row_number().over(partition_by=upcoming, order_by=(Shows.start_time.desc(), Shows.id.desc())).label('position'),
+      db.func.count().over(partition_by=upcoming).label('total')
+    ).filter(show_fk == entity_id) \
+    .subquery()
+
+  first = (past_page - 1) * per_page + 1
+  rows = db.session.query(
+      model,
+      ranked.c.id.label('show_id'),
+      ranked.c.updated_at.label('show_updated_at'),
+      ranked.c.start_time,
+      ranked.c.upcoming,
+      ranked.c.total,
+      other.id.label('other_id'),
+      other.name.label('other_name'),
+      other.image_link.label('other_image_link'),
+      other.updated_at.label('other_updated_at')
+    ).options(raiseload(model.shows), selectinload(model.genres)) \
+    .outerjoin(ranked, and_(
+      ranked.c.entity_id == model.id,
+      or_(ranked.c.upcoming, ranked.c.position.between(first, first + per_page - 1)))) \
+    .outerjoin(other, other.id == ranked.c.other_id) \
+    .filter(model.id == entity_id) \
+    .order_by(ranked.c.start_time) \
+    .all()
+  if not rows:
+    return None
+
+  shows = {True: [], False: []}
+  totals = {True: 0, False: 0}
+  for row in rows:
+    if row.start_time is None:
+      continue
+    shows[bool(row.upcoming)].append(row)
+    totals[bool(row.upcoming)] = row.total
+  # past shows newest first
+  shows[False].reverse()
+  return rows[0][0], shows[True], totals[True], shows[False], totals[False]
+
+def show_info(row, prefix):
+  return {
+    "id": row.show_id,
+    prefix + "_id": row.other_id,
+    prefix + "_name": row.other_name,
+    prefix + "_image_link": row.other_image_link,
+    "start_time": row.start_time,
+    # what the show tile is rendered from, see fragments.py
+    "version": (row.show_updated_at, row.other_updated_at),
+  }
+
+def detail_page(result, past_page, per_page, prefix):
+  entity, upcoming, upcoming_count, past, past_count = result
+  past_shows = [show_info(row, prefix) for row in past]
+  return {
+    "upcoming_shows": [show_info(row, prefix) for row in upcoming],
+    "upcoming_shows_count": upcoming_count,
+    "past_shows": past_shows,
+    "past_shows_count": past_count,
+    "past_shows_version": (past_count, tuple((show["id"], show["version"]) for show in past_shows)),
+    "past_page": past_page,
+    "past_has_next": past_page * per_page < past_count,
+  }
+
+def venue_detail(venue_id, past_page=1, per_page=12):
+  result = entity_with_shows(Venue, Shows.venue_id, Artist, Shows.artist_id, venue_id, past_page, per_page)
+  if result is None:
+    return None
+  venue = result[0]
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [genre.name for genre in venue.genres],
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website_link,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+  }
+  data.update(detail_page(result, past_page, per_page, "artist"))
+  return data
+
+def artist_detail(artist_id, past_page=1, per_page=12):
+  result = entity_with_shows(Artist, Shows.artist_id, Venue, Shows.venue_id, artist_id, past_page, per_page)
+  if result is None:
+    return None
+  artist = result[0]
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": [genre.name for genre in artist.genres],
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website_link,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+  }
+  data.update(detail_page(result, past_page, per_page, "venue"))
+  return data
+
+
+def venue_artist_ids(venue_id):
+  # artists whose pages list a show at this venue
+  return [row.artist_id for row in db.session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()]
+
+def artist_venue_ids(artist_id):
+  # venues whose pages list a show by this artist
+  return [row.venue_id for row in db.session.query(Shows.venue_id).filter(Shows.artist_id == artist_id).distinct()]
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def encode_show_cursor(start_time, show_id):
+  return f"{start_time.isoformat()}_{show_id}"
+
+def decode_show_cursor(cursor):
+  # raises ValueError on anything that did not come from encode_show_cursor
+  start_time, _, show_id = cursor.rpartition('_')
+  return datetime.fromisoformat(start_time), int(show_id)
+
+def show_listing():
+  # shows joined with the venue and artist columns the listings display
+  return db.session.query(
+      Shows.id,
+      Shows.start_time,
+      Shows.venue_id,
+      Venue.name.label('venue_name'),
+      Shows.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Shows.venue_id) \
+    .join(Artist, Artist.id == Shows.artist_id)
+
+def show_feed(after=None, limit=30):
+  # one page of the /shows feed, keyset-paginated on (start_time, id) so
+  # the cost of a page does not depend on how deep into the table it is
+  query = show_listing().add_columns(Shows.updated_at, Venue.updated_at.label('venue_updated_at'), Artist.updated_at.label('artist_updated_at'))
+  if after is not None:
+    query = query.filter(tuple_(Shows.start_time, Shows.id) > tuple_(*after))
+  rows = query.order_by(Shows.start_time, Shows.id).limit(limit + 1).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+
+  data = []
+  for show in rows:
+    data.append({
+      "id": show.id,
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": show.start_time,
+      "version": (show.updated_at, show.venue_updated_at, show.artist_updated_at),
+    })
+  return data, next_cursor
+
+def calendar_days(start, end, city=None, state=None):
+  # /shows?from=&to=&city=: the days between start and end (inclusive)
+  # with shows, each with its venues and their show counts. Read from the
+  # show_calendar summary (see show_calendar.py): one index range scan over
+  # (area, day), or day alone without a city, touching one row per venue
+  # per day however many shows each holds.
+  query = db.session.query(
+      ShowCalendar.day,
+      ShowCalendar.venue_id,
+      Venue.name.label('venue_name'),
+      ShowCalendar.city,
+      ShowCalendar.state,
+      ShowCalendar.show_count
+    ).join(Venue, Venue.id == ShowCalendar.venue_id) \
+    .filter(ShowCalendar.day >= start, ShowCalendar.day <= end)
+  if city:
+    query = query.filter(ShowCalendar.area == db.func.lower(db.func.trim(city)))
+  if state:
+    query = query.filter(ShowCalendar.state == state.strip().upper())
+  rows = query.order_by(ShowCalendar.day, ShowCalendar.state, ShowCalendar.city, Venue.name, ShowCalendar.venue_id).all()
+
+  days = []
+  for day, venues in groupby(rows, key=lambda row: row.day):
+    venues = [{
+      "id": venue.venue_id,
+      "name": venue.venue_name,
+      "city": venue.city,
+      "state": venue.state,
+      "num_shows": venue.show_count,
+    } for venue in venues]
+    days.append({"day": day, "num_shows": sum(venue["num_shows"] for venue in venues), "venues": venues})
+  return days
+
+def show_stream(venue_id=None, artist_id=None, city=None, state=None, start=None, end=None, genres=None, batch_size=500):
+  # every matching show in (start_time, id) order for /api/shows, fetched
+  # batch_size rows at a time through a server-side cursor so memory stays
+  # flat however many shows match; genres filters on the artist's genres
+  query = show_listing()
+  if venue_id is not None:
+    query = query.filter(Shows.venue_id == venue_id)
+  if artist_id is not None:
+    query = query.filter(Shows.artist_id == artist_id)
+  # city and state match as on the /shows calendar
+  if city:
+    query = query.filter(db.func.lower(db.func.trim(Venue.city)) == db.func.lower(db.func.trim(city)))
+  if state:
+    query = query.filter(Venue.state == state.strip().upper())
+  if genres:
+    query = query.filter(has_genre(Artist, genres))
+  if start is not None:
+    query = query.filter(Shows.start_time >= start)
+  if end is not None:
+    query = query.filter(Shows.start_time < end)
+  rows = query.order_by(Shows.start_time, Shows.id) \
+    .execution_options(stream_results=True) \
+    .yield_per(batch_size)
+  for show in rows:
+    yield {
+      "id": show.id,
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": show.start_time.isoformat(),
+    }
+
+
+#  Versions
+#  ----------------------------------------------------------------
+# Cheap aggregate lookups describing everything a page is rendered from.
+# The whole tuple (row counts included, so deletes and shows moving from
+# upcoming to past change it) is hashed into the ETag; as the counts
+# don't fit a Last-Modified date, these pages send none (conditional.py).
+# None means the entity does not exist.
+
+def venue_version(venue_id, now=None):
+  now = now or datetime.now()
+  row = db.session.query(
+      db.func.max(Venue.updated_at),
+      db.func.max(Shows.updated_at),
+      db.func.max(Artist.updated_at),
+      db.func.count(Shows.id),
+      upcoming_shows_count(now)
+    ).select_from(Venue) \
+    .outerjoin(Shows, Shows.venue_id == Venue.id) \
+    .outerjoin(Artist, Artist.id == Shows.artist_id) \
+    .filter(Venue.id == venue_id) \
+    .one()
+  return tuple(row) if row[0] is not None else None
+
+def artist_version(artist_id, now=None):
+  now = now or datetime.now()
+  row = db.session.query(
+      db.func.max(Artist.updated_at),
+      db.func.max(Shows.updated_at),
+      db.func.max(Venue.updated_at),
+      db.func.count(Shows.id),
+      upcoming_shows_count(now)
+    ).select_from(Artist) \
+    .outerjoin(Shows, Shows.artist_id == Artist.id) \
+    .outerjoin(Venue, Venue.id == Shows.venue_id) \
+    .filter(Artist.id == artist_id) \
+    .one()
+  return tuple(row) if row[0] is not None else None
+
+def table_version(model):
+  return [
+    db.session.query(db.func.max(model.updated_at)).scalar_subquery(),
+    db.session.query(db.func.count(model.id)).scalar_subquery(),
+  ]
+
+def venues_version(now=None):
+  now = now or datetime.now()
+  upcoming = db.session.query(db.func.count(Shows.id)).filter(Shows.start_time > now).scalar_subquery()
+  return tuple(db.session.query(*table_version(Venue) + table_version(Shows) + [upcoming]).one())
+
+def artists_version():
+  return tuple(db.session.query(*table_version(Artist)).one())
+
+def shows_version():
+  return tuple(db.session.query(*table_version(Shows) + table_version(Venue) + table_version(Artist)).one())
+
+def calendar_version(today):
+  # the default window starts today, and "today" is part of any window
+  # that includes it: a new day is a new version
+  return shows_version() + (datetime.combine(today, datetime.min.time()),)
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# Session that sends the reads of GET/HEAD requests to a read replica and
+# everything else to the primary (the SQLALCHEMY_DATABASE_URI engine).
+#
+# - Replicas listed in DB_REPLICA_URLS are used round-robin, skipping any
+#   whose replication lag exceeds DB_REPLICA_MAX_LAG_SECONDS (checked at
+#   most every DB_REPLICA_LAG_CHECK_SECONDS).
+# - A request reads from one replica: the first read picks it and the
+#   rest reuse it, so a page never mixes data from replicas lagging by
+#   different amounts.
+# - Once a request writes, the rest of it stays on the primary.
+# - After a write the client is kept on the primary for
+#   DB_READ_YOUR_WRITES_SECONDS (stored in the Flask session), so the
+#   redirect from edit_*_submission shows the edit it just made.
+#
+# Two SQLite files work as local stand-ins for a primary/replica pair.
+
+import itertools
+import math
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context, request, session as flask_session
+from sqlalchemy import create_engine
+from sqlalchemy.sql.dml import UpdateBase
+
+try:
+  from flask_sqlalchemy.session import Session as BaseSession
+except ImportError:
+  # Flask-SQLAlchemy 2.x
+  from flask_sqlalchemy import SignallingSession as BaseSession
+
+PRIMARY_UNTIL = '_db_primary_until'
+
+
+def is_write(clause):
+  return isinstance(clause, UpdateBase)
+
+def reads_from_replica():
+  return (
+    request.method in ('GET', 'HEAD')
+    and not g.get('_db_pinned', False)
+    and flask_session.get(PRIMARY_UNTIL, 0) < time.time()
+  )
+
+
+def request_replica():
+  # chosen once per request; None (no replica close enough) sticks too
+  if '_db_replica' not in g:
+    replicas = current_app.extensions.get('replicas')
+    g._db_replica = replicas.choose() if replicas else None
+  return g._db_replica
+
+
+class RoutingSession(BaseSession):
+
+  def get_bind(self, mapper=None, clause=None, **kwargs):
+    if has_request_context():
+      if self._flushing or is_write(clause):
+        g._db_pinned = True
+      elif has_app_context() and reads_from_replica():
+        engine = request_replica()
+        if engine is not None:
+          return engine
+    return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+class ReplicaSet(object):
+
+  def __init__(self, engines, max_lag, lag_check_seconds):
+    self.engines = engines
+    self.max_lag = max_lag
+    self.lag_check_seconds = lag_check_seconds
+    self._lags = {}
+    self._lock = threading.Lock()
+    self._order = itertools.cycle(range(len(engines)))
+
+  def lag(self, engine):
+    # seconds behind the primary, cached for lag_check_seconds
+    checked_at, lag = self._lags.get(engine, (None, None))
+    if checked_at is not None and time.monotonic() - checked_at < self.lag_check_seconds:
+      return lag
+    try:
+      if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+          lag = conn.exec_driver_sql(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+          ).scalar()
+        lag = float(lag)
+      else:
+        lag = 0.0
+    except Exception:
+      current_app.logger.warning('replica %s unavailable', engine.url, exc_info=True)
+      lag = math.inf
+    self._lags[engine] = (time.monotonic(), lag)
+    return lag
+
+  def choose(self):
+    # next replica in round-robin order that is close enough to the primary
+    for _ in range(len(self.engines)):
+      with self._lock:
+        engine = self.engines[next(self._order)]
+      if self.lag(engine) <= self.max_lag:
+        return engine
+    return None
+
+
+def init_replicas(app, engine_options):
+  urls = app.config['DB_REPLICA_URLS']
+  if not urls:
+    return
+  engines = []
+  for url in urls:
+    options = engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url))
+    engines.append(create_engine(url, **options))
+  app.extensions['replicas'] = ReplicaSet(engines, app.config['DB_REPLICA_MAX_LAG_SECONDS'], app.config['DB_REPLICA_LAG_CHECK_SECONDS'])
+
+  @app.after_request
+  def remember_write(response):
+    if g.get('_db_pinned', False):
+      flask_session[PRIMARY_UNTIL] = time.time() + app.config['DB_READ_YOUR_WRITES_SECONDS']
+    return response
@@ -0,0 +1,59 @@
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Case-insensitive partial name search for venues and artists. On Postgres
+# the ILIKE filter is served by the pg_trgm GIN indexes on venue.name and
+# artist.name and matches are ranked by trigram similarity. Other databases
+# (SQLite when running locally) rank by where the term appears in the name.
+# An optional genre filter goes through the genre association indexes.
+# Each page, its upcoming-show counts (the denormalized counter columns)
+# and the total match count come back from a single statement.
+
+from models import db, Artist, Venue
+from genres import has_genre
+
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def rank_by(column, search_term):
+  # ORDER BY terms, best match first
+  if db.engine.dialect.name == 'postgresql':
+    return [db.func.similarity(column, search_term).desc()]
+  return [db.func.instr(db.func.lower(column), search_term.lower()), db.func.length(column)]
+
+def search_by_name(model, search_term, page=1, per_page=20, genres=None):
+  query = db.session.query(
+      model.id,
+      model.name,
+      model.upcoming_shows_count.label('num_upcoming_shows'),
+      db.func.count().over().label('total')
+    ).filter(model.name.ilike(f"%{escape_like(search_term)}%", escape='\\'))
+  if genres:
+    query = query.filter(has_genre(model, genres))
+  rows = query.order_by(*rank_by(model.name, search_term), model.id) \
+    .limit(per_page) \
+    .offset((page - 1) * per_page) \
+    .all()
+
+  if rows:
+    total = rows[0].total
+  elif page > 1:
+    # paged past the end, the window count came back with no rows
+    total = query.count()
+  else:
+    total = 0
+  return {
+    "count": total,
+    "page": page,
+    "per_page": per_page,
+    "has_next": page * per_page < total,
+    "data": [{"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows} for row in rows]
+  }
+
+def search_venues(search_term, page=1, per_page=20, genres=None):
+  return search_by_name(Venue, search_term, page, per_page, genres)
+
+def search_artists(search_term, page=1, per_page=20, genres=None):
+  return search_by_name(Artist, search_term, page, per_page, genres)
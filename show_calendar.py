@@ -0,0 +1,94 @@
+#----------------------------------------------------------------------------#
+# Show calendar.
+#----------------------------------------------------------------------------#
+
+# Maintains show_calendar, one row per venue per day with shows, behind the
+# date/city filters on /shows ("what's on this weekend in San Francisco").
+# It is a summary table rather than a Postgres materialized view, so it
+# works on SQLite as well and stays current row by row instead of through
+# full refreshes:
+#
+# - show_added() bumps the (venue, day) bucket of a new show inside the
+#   caller's transaction, as an upsert.
+# - venue_deleted() and venue_moved() drop or relabel a venue's buckets.
+# - refresh() recomputes the buckets of the matching venues from shows,
+#   used after bulk imports and by rebuild.
+#
+#     flask calendar rebuild      (recompute everything)
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Venue, Shows, ShowCalendar
+
+COLUMNS = ['venue_id', 'day', 'city', 'state', 'area', 'show_count']
+
+
+def area(city):
+  # the normalized city stored in show_calendar.area and matched by the filter
+  return db.func.lower(db.func.trim(city))
+
+def upsert(rows):
+  # INSERT ... SELECT rows, adding show_count to buckets that already exist
+  table = ShowCalendar.__table__
+  dialect = db.engine.dialect.name
+  if dialect in ('postgresql', 'sqlite'):
+    insert = (postgresql if dialect == 'postgresql' else sqlite).insert
+    statement = insert(table).from_select(COLUMNS, rows)
+    db.session.execute(statement.on_conflict_do_update(
+      index_elements=['venue_id', 'day'],
+      set_={'show_count': table.c.show_count + statement.excluded.show_count}))
+    return
+  for row in db.session.execute(rows):
+    values = dict(zip(COLUMNS, row))
+    updated = db.session.query(ShowCalendar) \
+      .filter(ShowCalendar.venue_id == values['venue_id'], ShowCalendar.day == values['day']) \
+      .update({ShowCalendar.show_count: ShowCalendar.show_count + values['show_count']}, synchronize_session=False)
+    if not updated:
+      db.session.execute(table.insert(), values)
+
+def show_added(show):
+  venue_id = int(show.venue_id)
+  upsert(select(
+      Venue.id,
+      literal(show.start_time.date(), db.Date),
+      Venue.city,
+      Venue.state,
+      area(Venue.city),
+      literal(1)
+    ).where(Venue.id == venue_id))
+
+def venue_deleted(venue_id):
+  db.session.query(ShowCalendar).filter(ShowCalendar.venue_id == venue_id).delete(synchronize_session=False)
+
+def venue_moved(venue):
+  db.session.query(ShowCalendar).filter(ShowCalendar.venue_id == venue.id).update({
+    ShowCalendar.city: venue.city,
+    ShowCalendar.state: venue.state,
+    ShowCalendar.area: area(literal(venue.city)),
+  }, synchronize_session=False)
+
+def refresh(criterion=None):
+  # recompute the buckets of every venue matching criterion (all venues
+  # when it is None) from shows
+  day = db.func.date(Shows.start_time)
+  delete = db.session.query(ShowCalendar)
+  rows = select(Shows.venue_id, day, Venue.city, Venue.state, area(Venue.city), db.func.count(Shows.id)) \
+    .join(Venue, Venue.id == Shows.venue_id) \
+    .group_by(Shows.venue_id, day, Venue.city, Venue.state)
+  if criterion is not None:
+    delete = delete.filter(ShowCalendar.venue_id.in_(select(Venue.id).where(criterion)))
+    rows = rows.where(criterion)
+  delete.delete(synchronize_session=False)
+  db.session.execute(ShowCalendar.__table__.insert().from_select(COLUMNS, rows))
+
+
+calendar_cli = AppGroup('calendar', help='Maintain the show calendar summary.')
+
+@calendar_cli.command('rebuild')
+def rebuild_command():
+  """Recompute the whole show calendar from the shows table."""
+  refresh()
+  db.session.commit()
+  click.echo('%d calendar rows' % db.session.query(ShowCalendar).count())
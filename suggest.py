@@ -0,0 +1,158 @@
+#----------------------------------------------------------------------------#
+# Suggestions.
+#----------------------------------------------------------------------------#
+
+# In-process prefix index behind /search/suggest. Venue names, artist names
+# and "City, State" areas are kept as sorted (token, id) arrays, one entry
+# per word so "hop" finds "The Musical Hop", and looked up with bisect.
+# The index is built from the database on first use, patched by the write
+# handlers in app.py after they commit, and rebuilt every
+# SUGGEST_REBUILD_SECONDS to pick up writes made by other processes.
+
+import threading
+import time
+from bisect import bisect_left, insort
+from models import db, Artist, Venue
+
+
+def normalize(text):
+  return " ".join((text or "").casefold().split())
+
+
+class PrefixIndex(object):
+
+  def __init__(self):
+    self._keys = []
+    self._labels = {}
+
+  def __len__(self):
+    return len(self._labels)
+
+  def _tokens(self, label):
+    words = normalize(label).split(" ")
+    return set(" ".join(words[i:]) for i in range(len(words)) if words[i])
+
+  def add(self, id, label):
+    self.remove(id)
+    self._labels[id] = label
+    for token in self._tokens(label):
+      insort(self._keys, (token, id))
+
+  def load(self, items):
+    # bulk (id, label) load: one sort instead of an insort per token
+    for id, label in items:
+      self._labels[id] = label
+      self._keys.extend((token, id) for token in self._tokens(label))
+    self._keys.sort()
+
+  def remove(self, id):
+    label = self._labels.pop(id, None)
+    if label is None:
+      return
+    for token in self._tokens(label):
+      i = bisect_left(self._keys, (token, id))
+      if i < len(self._keys) and self._keys[i] == (token, id):
+        del self._keys[i]
+
+  def search(self, prefix, limit):
+    prefix = normalize(prefix)
+    matches = []
+    if not prefix:
+      return matches
+    i = bisect_left(self._keys, (prefix,))
+    while i < len(self._keys) and len(matches) < limit:
+      token, id = self._keys[i]
+      if not token.startswith(prefix):
+        break
+      if id not in matches:
+        matches.append(id)
+      i += 1
+    return [(id, self._labels[id]) for id in matches]
+
+
+class Suggestions(object):
+
+  def __init__(self, rebuild_seconds=300):
+    self.rebuild_seconds = rebuild_seconds
+    self._lock = threading.Lock()
+    self._built_at = None
+    self._reset()
+
+  def _reset(self):
+    self.venues = PrefixIndex()
+    self.artists = PrefixIndex()
+    self.areas = PrefixIndex()
+    # (kind, id) -> (city, state) and (city, state) -> number of entities
+    self._area_of = {}
+    self._area_refs = {}
+
+  def init_app(self, app):
+    self.rebuild_seconds = app.config.get('SUGGEST_REBUILD_SECONDS', self.rebuild_seconds)
+
+  def build(self):
+    venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state).all()
+    artists = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state).all()
+    with self._lock:
+      self._reset()
+      self.venues.load((venue.id, venue.name) for venue in venues)
+      self.artists.load((artist.id, artist.name) for artist in artists)
+      for kind, rows in (('venue', venues), ('artist', artists)):
+        for row in rows:
+          self._add_area(kind, row.id, row.city, row.state)
+      self._built_at = time.monotonic()
+
+  def _stale(self):
+    return self._built_at is None or time.monotonic() - self._built_at > self.rebuild_seconds
+
+  def _put(self, kind, id, name, city, state):
+    self._drop(kind, id)
+    (self.venues if kind == 'venue' else self.artists).add(id, name)
+    self._add_area(kind, id, city, state)
+
+  def _add_area(self, kind, id, city, state):
+    if city and state:
+      area = (city, state)
+      self._area_of[(kind, id)] = area
+      self._area_refs[area] = self._area_refs.get(area, 0) + 1
+      if self._area_refs[area] == 1:
+        self.areas.add(area, f"{city}, {state}")
+
+  def _drop(self, kind, id):
+    (self.venues if kind == 'venue' else self.artists).remove(id)
+    area = self._area_of.pop((kind, id), None)
+    if area is not None:
+      self._area_refs[area] -= 1
+      if not self._area_refs[area]:
+        del self._area_refs[area]
+        self.areas.remove(area)
+
+  # called by the write handlers after a successful commit; before the
+  # first build there is nothing to patch, the build will see the row
+
+  def saved(self, kind, id, name, city, state):
+    with self._lock:
+      if self._built_at is not None:
+        self._put(kind, id, name, city, state)
+
+  def deleted(self, kind, id):
+    with self._lock:
+      if self._built_at is not None:
+        self._drop(kind, id)
+
+  def expire(self):
+    # too many changes to patch in (bulk imports): rebuild on next use
+    with self._lock:
+      self._built_at = None
+
+  def suggest(self, prefix, limit=5):
+    if self._stale():
+      self.build()
+    with self._lock:
+      return {
+        "venues": [{"id": id, "name": name} for id, name in self.venues.search(prefix, limit)],
+        "artists": [{"id": id, "name": name} for id, name in self.artists.search(prefix, limit)],
+        "areas": [{"city": city, "state": state, "label": label} for (city, state), label in self.areas.search(prefix, limit)],
+      }
+
+
+suggestions = Suggestions()
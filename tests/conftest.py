@@ -0,0 +1,32 @@
+#----------------------------------------------------------------------------#
+# Test fixtures.
+#----------------------------------------------------------------------------#
+
+# One app per test run, set up like the benchmarks' (benchmarks/common.py):
+# a throwaway SQLite file, no response cache, follow-up jobs run inline
+# and RAISE_ON_LAZY_LOAD on. app.py reads config.py when it is imported,
+# so every test shares this app and its seeded database.
+
+import pytest
+from benchmarks.common import bench_app, reset_db, seed
+from benchmarks import routes
+
+
+@pytest.fixture(scope='session')
+def seeded():
+  app = bench_app()
+  app.config['BULK_IMPORT_TOKEN'] = routes.IMPORT_TOKEN
+  app.config['OPS_TOKEN'] = routes.OPS_TOKEN
+  from models import db
+  with app.app_context():
+    reset_db(db)
+    counts = seed(db, 20)
+  return app, counts
+
+@pytest.fixture
+def app(seeded):
+  return seeded[0]
+
+@pytest.fixture
+def route_table(seeded):
+  return routes.route_table(seeded[1]['venues'], seeded[1]['artists'])
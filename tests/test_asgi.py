@@ -0,0 +1,63 @@
+#----------------------------------------------------------------------------#
+# ASGI mode.
+#----------------------------------------------------------------------------#
+
+# Serves the async pages through asgi.application and checks they match
+# the WSGI app's and that their statements ran on the async engine, i.e.
+# that bind_session still swaps db.session under the installed
+# Flask-SQLAlchemy. Skipped without asgiref and aiosqlite.
+
+import asyncio
+import pytest
+from sqlalchemy import event
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+
+PATHS = ['/venues', '/venues/1', '/artists/1', '/shows', '/venues/search?search_term=venue']
+
+
+def asgi_get(application, path):
+  path, _, query = path.partition('?')
+  scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+           'root_path': '', 'query_string': query.encode('latin-1'), 'headers': [(b'host', b'localhost')],
+           'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+  messages = []
+
+  async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+  async def send(message):
+    messages.append(message)
+
+  async def run():
+    try:
+      await application(scope, receive, send)
+    finally:
+      # the pool's connections belong to this event loop
+      await application.engine.dispose()
+
+  asyncio.run(run())
+  return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+
+@pytest.fixture(scope='module')
+def application(seeded):
+  import asgi
+  return asgi.application
+
+@pytest.mark.parametrize('path', PATHS)
+def test_async_page_matches_wsgi(app, application, path):
+  assert application.is_async({'method': 'GET', 'path': path.partition('?')[0]})
+  statements = []
+  def count(*args):
+    statements.append(args[2])
+  event.listen(application.engine.sync_engine, 'before_cursor_execute', count)
+  try:
+    status, body = asgi_get(application, path)
+  finally:
+    event.remove(application.engine.sync_engine, 'before_cursor_execute', count)
+  response = app.test_client().get(path)
+  assert status == response.status_code == 200
+  assert body == response.data
+  assert statements, 'no statement ran on the async engine'
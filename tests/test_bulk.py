@@ -0,0 +1,86 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# POST /api/import/<kind> with valid and invalid rows mixed: the valid rows
+# are committed batch by batch, each invalid one is reported with its line
+# in the streamed batch reports, and fix_sequence runs once the rows
+# carried explicit ids.
+
+import json
+import pytest
+from sqlalchemy.orm import selectinload
+import bulk
+from benchmarks import routes
+from models import db, Shows, Venue
+
+VENUES_CSV = '\n'.join([
+  'id,name,city,state,address,phone,genres,facebook_link,seeking_talent',
+  '900001,Imported Hall,Austin,TX,1 Main St,512-555-0100,Jazz;Blues,https://facebook.com/imported,yes',
+  ',Missing City,,TX,2 Main St,512-555-0101,Jazz,https://facebook.com/missing,no',
+  ',Imported Club,Dallas,TX,3 Main St,214-555-0102,Rock n Roll,https://facebook.com/club,',
+  ',Bad Link,Dallas,TX,4 Main St,214-555-0103,Jazz,not a url,',
+  ',Imported Loft,Houston,TX,5 Main St,713-555-0104,Folk,https://facebook.com/loft,',
+]) + '\n'
+
+
+@pytest.fixture
+def sequences_fixed(monkeypatch):
+  fixed = []
+  fix_sequence = bulk.fix_sequence
+  def spy(kind):
+    fixed.append(kind)
+    fix_sequence(kind)
+  monkeypatch.setattr(bulk, 'fix_sequence', spy)
+  return fixed
+
+def post_import(app, kind, fmt, body, batch_size):
+  response = app.test_client().post(
+    '/api/import/%s?format=%s&batch_size=%d' % (kind, fmt, batch_size), data=body.encode('utf-8'),
+    headers={'Authorization': 'Bearer %s' % routes.IMPORT_TOKEN})
+  assert response.status_code == 200
+  assert response.mimetype == 'application/x-ndjson'
+  return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def error_lines(reports):
+  return dict((error['line'], sorted(error['errors'])) for report in reports for error in report['errors'])
+
+
+def test_import_csv_reports_invalid_rows(app, sequences_fixed):
+  reports = post_import(app, 'venues', 'csv', VENUES_CSV, batch_size=2)
+  # two rows per batch (valid or not); the header is line 1
+  assert [(r['batch'], r['first_line'], r['last_line'], r['inserted']) for r in reports] == \
+    [(1, 2, 3, 1), (2, 4, 5, 1), (3, 6, 6, 1)]
+  assert error_lines(reports) == {3: ['city'], 5: ['facebook_link']}
+  assert sequences_fixed == ['venues']
+
+  with app.app_context():
+    imported = dict((venue.name, venue) for venue in Venue.query.options(selectinload(Venue.genres)).filter(Venue.name.like('Imported %')))
+    assert sorted(imported) == ['Imported Club', 'Imported Hall', 'Imported Loft']
+    assert imported['Imported Hall'].id == 900001
+    assert imported['Imported Hall'].seeking_talent is True
+    assert [genre.name for genre in imported['Imported Hall'].genres] == ['Blues', 'Jazz']
+    assert not Venue.query.filter(Venue.name.in_(['Missing City', 'Bad Link'])).count()
+    # ids after the explicit one keep counting from it
+    assert imported['Imported Club'].id > 900001
+
+def test_import_jsonl_reports_invalid_rows(app, sequences_fixed):
+  lines = [
+    {"venue_id": 1, "artist_id": 1, "start_time": "2031-01-02 20:00:00"},
+    '{"venue_id": 1, "artist_id": ',
+    {"venue_id": 999999, "artist_id": 1, "start_time": "2031-01-03 20:00:00"},
+    {"venue_id": 2, "artist_id": 1, "start_time": "not a date"},
+    [1, 2, 3],
+    {"venue_id": 2, "artist_id": 2, "start_time": "2031-01-04 20:00:00"},
+  ]
+  body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n'
+  reports = post_import(app, 'shows', 'jsonl', body, batch_size=3)
+  assert [(r['batch'], r['first_line'], r['last_line'], r['inserted']) for r in reports] == \
+    [(1, 1, 3, 1), (2, 4, 6, 1)]
+  assert error_lines(reports) == {2: ['row'], 3: ['venue_id'], 4: ['start_time'], 5: ['row']}
+  # no explicit ids, nothing to fix
+  assert sequences_fixed == []
+
+  with app.app_context():
+    imported = db.session.query(Shows.venue_id, Shows.artist_id).filter(Shows.start_time >= '2031-01-01').order_by(Shows.start_time).all()
+    assert [tuple(row) for row in imported] == [(1, 1), (2, 2)]
@@ -0,0 +1,52 @@
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+
+# The file backend's bounds and sweep, and the cache key ignoring query
+# arguments the view doesn't read.
+
+import os
+from cache import FileBackend, cache
+
+
+def entry(i, size=10):
+  return (200, b'x' * size + b'%d' % i, 'text/html')
+
+def test_file_backend_keeps_within_bounds(tmp_path):
+  backend = FileBackend(str(tmp_path), max_entries=8, max_bytes=1000)
+  for i in range(40):
+    backend.set('venues', '/venues?x=%d' % i, entry(i), 60)
+  backend.sweep()
+  assert len(backend) == 8
+  assert backend.evictions == 32
+  # the newest entries are the ones kept
+  assert backend.get('venues', '/venues?x=39') == entry(39)
+  assert backend.get('venues', '/venues?x=0') is None
+
+  for i in range(8):
+    backend.set('venue:%d' % i, '/venues/%d' % i, entry(i, size=200), 60)
+  backend.sweep()
+  assert sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(str(tmp_path)) for name in names) <= 1000
+
+def test_file_backend_sweeps_expired(tmp_path):
+  backend = FileBackend(str(tmp_path), max_entries=100)
+  backend.set('venues', '/venues', entry(0), 60)
+  backend.set('artists', '/artists', entry(1), -1)
+  backend.sweep()
+  assert len(backend) == 1
+  assert backend.get('venues', '/venues') == entry(0)
+
+def test_unknown_query_arguments_share_an_entry(app):
+  backend = app.config['CACHE_BACKEND']
+  app.config['CACHE_BACKEND'] = 'memory'
+  cache.init_app(app)
+  try:
+    client = app.test_client()
+    assert client.get('/venues').headers['X-Cache'] == 'MISS'
+    assert client.get('/venues?x=1').headers['X-Cache'] == 'HIT'
+    assert client.get('/venues?x=2&genre=Jazz').headers['X-Cache'] == 'MISS'
+    assert client.get('/venues?genre=Jazz&y=3').headers['X-Cache'] == 'HIT'
+    assert len(cache.backend) == 2
+  finally:
+    app.config['CACHE_BACKEND'] = backend
+    cache.init_app(app)
@@ -0,0 +1,60 @@
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+# Writes made where this process's response cache doesn't see them (another
+# worker, `flask jobs work`, a bulk import) must still change what a client
+# gets: the page's version, not the cache entry, decides. The writes below
+# go straight to the database, without cache.invalidate().
+
+from datetime import datetime
+import pytest
+from cache import cache
+from models import db, Venue
+
+
+@pytest.fixture
+def memory_cache(app):
+  backend = app.config['CACHE_BACKEND']
+  app.config['CACHE_BACKEND'] = 'memory'
+  cache.init_app(app)
+  yield cache
+  app.config['CACHE_BACKEND'] = backend
+  cache.init_app(app)
+
+def write(app, statement):
+  with app.app_context():
+    db.session.execute(statement)
+    db.session.commit()
+
+
+def test_stale_cache_entry_is_a_miss(app, memory_cache):
+  client = app.test_client()
+  first = client.get('/venues/1')
+  assert client.get('/venues/1').headers['X-Cache'] == 'HIT'
+  write(app, Venue.__table__.update().where(Venue.id == 1).values(name='Renamed elsewhere', updated_at=datetime.utcnow()))
+
+  response = client.get('/venues/1', headers={'If-None-Match': first.headers['ETag']})
+  assert response.status_code == 200
+  assert response.headers['X-Cache'] == 'MISS'
+  assert response.headers['ETag'] != first.headers['ETag']
+  assert b'Renamed elsewhere' in response.data
+  assert client.get('/venues/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_delete_is_not_modified_since(app, memory_cache):
+  with app.app_context():
+    venue = Venue(name='Short-lived', city='Austin', state='TX', address='1 Main St')
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+  client = app.test_client()
+  listed = client.get('/venues')
+  assert b'Short-lived' in listed.data
+  # the listing's version counts rows, so it has no Last-Modified
+  assert 'Last-Modified' not in listed.headers
+  write(app, Venue.__table__.delete().where(Venue.id == venue_id))
+
+  for headers in ({'If-None-Match': listed.headers['ETag']}, {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}):
+    response = client.get('/venues', headers=headers)
+    assert response.status_code == 200
+    assert b'Short-lived' not in response.data
@@ -0,0 +1,89 @@
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# The denormalized counters on venue and artist must match a fresh count of
+# their shows after show_added() and after the rollover moves started shows
+# from upcoming to past.
+
+from datetime import datetime, timedelta
+import pytest
+import counters
+from models import db, Artist, Shows, Venue
+
+
+def counted(model, now):
+  # (upcoming, past, next show) per row, straight from shows
+  show_fk = dict(counters.PARTIES)[model]
+  rows = db.session.query(
+      model.id,
+      db.func.count(Shows.id).filter(Shows.start_time > now),
+      db.func.count(Shows.id).filter(Shows.start_time <= now),
+      db.func.min(Shows.start_time).filter(Shows.start_time > now),
+    ).select_from(model).outerjoin(Shows, show_fk == model.id).group_by(model.id)
+  return dict((row[0], tuple(row[1:])) for row in rows)
+
+def stored(model):
+  rows = db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count, model.next_show_at)
+  return dict((row[0], tuple(row[1:])) for row in rows)
+
+
+@pytest.fixture
+def booked(app):
+  # a venue and an artist with shows on both sides of the test's "now"
+  with app.app_context():
+    venue = Venue(name='Counted Hall', city='Austin', state='TX', address='1 Main St')
+    artist = Artist(name='The Counters', city='Austin', state='TX')
+    db.session.add_all([venue, artist])
+    db.session.commit()
+    ids = (venue.id, artist.id)
+  yield ids
+  with app.app_context():
+    db.session.query(Shows).filter(Shows.venue_id == ids[0]).delete()
+    db.session.query(Venue).filter(Venue.id == ids[0]).delete()
+    db.session.query(Artist).filter(Artist.id == ids[1]).delete()
+    # back to counters as of now for the other tests
+    counters.rebuild()
+    db.session.commit()
+
+def add_shows(venue_id, artist_id, now, hours):
+  for offset in hours:
+    show = Shows(venue_id=venue_id, artist_id=artist_id, start_time=now + timedelta(hours=offset))
+    db.session.add(show)
+    db.session.flush()
+    counters.show_added(show, now=now)
+
+
+def test_rollover_matches_a_fresh_count(app, booked):
+  venue_id, artist_id = booked
+  booked_at = datetime(2030, 6, 1, 20, 0)
+  with app.app_context():
+    add_shows(venue_id, artist_id, booked_at, (-48, -1, 1, 5, 30))
+    db.session.commit()
+    for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+      assert stored(model)[entity_id] == counted(model, booked_at)[entity_id] == (3, 2, booked_at + timedelta(hours=1))
+
+    # six hours later the +1h and +5h shows have started
+    later = booked_at + timedelta(hours=6)
+    counters.rollover(now=later)
+    db.session.commit()
+    for model in (Venue, Artist):
+      assert stored(model) == counted(model, later)
+    assert stored(Venue)[venue_id] == (1, 4, booked_at + timedelta(hours=30))
+    assert stored(Artist)[artist_id] == (1, 4, booked_at + timedelta(hours=30))
+
+def test_rollover_command(app, booked):
+  venue_id, artist_id = booked
+  now = datetime.now()
+  with app.app_context():
+    # counted a day ago, when the show an hour ago was still upcoming
+    add_shows(venue_id, artist_id, now - timedelta(days=1), (23, 48))
+    db.session.commit()
+    assert stored(Venue)[venue_id] == (2, 0, now + timedelta(hours=23) - timedelta(days=1))
+
+  result = app.test_cli_runner().invoke(args=['counters', 'rollover'])
+  assert result.exit_code == 0, result.output
+  assert 'rows updated' in result.output
+  with app.app_context():
+    for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+      assert stored(model)[entity_id] == counted(model, datetime.now())[entity_id] == (1, 1, now + timedelta(days=1))
@@ -0,0 +1,174 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# The outbox semantics of jobs.py on the 'inline' and 'database' backends:
+# a job enqueued in a transaction runs only if it commits, a job in the
+# table is claimed by one worker only, and failures are retried with the
+# documented backoff until the attempts run out.
+
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+import jobs as jobs_module
+from jobs import jobs, task
+from models import db, Job, Venue
+
+runs = []
+failures = {}
+
+@task(name='test_record')
+def record(value):
+  runs.append(value)
+
+@task(name='test_flaky')
+def flaky(value):
+  # fails the first failures[value] runs
+  runs.append(value)
+  if failures.get(value, 0) > 0:
+    failures[value] -= 1
+    raise RuntimeError('flaky %s' % value)
+
+
+@pytest.fixture(params=['inline', 'database'])
+def backend(request, app):
+  previous = dict((name, app.config[name]) for name in ('JOBS_BACKEND', 'JOBS_MAX_ATTEMPTS', 'JOBS_RETRY_SECONDS'))
+  app.config.update(JOBS_BACKEND=request.param, JOBS_MAX_ATTEMPTS=3, JOBS_RETRY_SECONDS=10)
+  jobs.init_app(app)
+  del runs[:]
+  failures.clear()
+  yield request.param
+  with app.app_context():
+    db.session.query(Job).delete()
+    db.session.commit()
+  app.config.update(previous)
+  jobs.init_app(app)
+
+def run_queued(app):
+  # what a `flask jobs work --burst` would do with the job table
+  if jobs.backend == 'database':
+    with app.app_context():
+      jobs.work(1, burst=True)
+
+def queued(app):
+  with app.app_context():
+    return db.session.query(Job.task, Job.args, Job.status).order_by(Job.id).all()
+
+
+def test_rolled_back_job_is_dropped(app, backend):
+  with app.app_context():
+    db.session.query(Venue.id).first()
+    jobs.enqueue(record, 'rolled back')
+    db.session.rollback()
+
+    db.session.query(Venue.id).first()
+    jobs.enqueue(record, 'committed')
+    # not before the commit
+    assert runs == []
+    db.session.commit()
+  if backend == 'database':
+    assert queued(app) == [('test_record', '["committed"]', 'queued')]
+  run_queued(app)
+  assert runs == ['committed']
+  assert queued(app) == []
+
+def test_job_outside_a_transaction_runs(app, backend):
+  with app.app_context():
+    jobs.enqueue(record, 1)
+  run_queued(app)
+  assert runs == [1]
+
+
+def test_one_claimer_per_job(app, backend):
+  if backend != 'database':
+    pytest.skip('only the job table is claimed')
+  with app.app_context():
+    jobs.enqueue(record, 'once')
+  claims = {}
+
+  def claim(worker):
+    with app.app_context():
+      claims[worker] = jobs.claim(worker)
+
+  # worker b claims the job between worker a's SELECT and its UPDATE
+  def interleave(conn, cursor, statement, *args):
+    if statement.startswith('UPDATE job') and 'b' not in claims:
+      claims['b'] = None
+      thread = threading.Thread(target=claim, args=('b',))
+      thread.start()
+      thread.join()
+
+  with app.app_context():
+    engine = db.engine
+  event.listen(engine, 'before_cursor_execute', interleave)
+  try:
+    claim('a')
+  finally:
+    event.remove(engine, 'before_cursor_execute', interleave)
+  assert claims['a'] is None
+  assert claims['b'][1:] == ('test_record', ['once'], 1)
+  with app.app_context():
+    assert db.session.query(Job.status, Job.locked_by).one() == ('running', 'b')
+
+def test_concurrent_workers_run_each_job_once(app, backend):
+  if backend != 'database':
+    pytest.skip('only the job table has workers')
+  with app.app_context():
+    for value in range(20):
+      jobs.enqueue(record, value)
+    jobs.work(4, burst=True)
+  assert sorted(runs) == list(range(20))
+  assert queued(app) == []
+
+
+def test_retries_back_off(app, backend, monkeypatch):
+  failures['twice'] = 2
+  delays = []
+  if backend == 'inline':
+    # the pools retry on a timer: record its delay and fire it right away
+    class Timer(object):
+      def __init__(self, delay, fn, args):
+        delays.append(delay)
+        self.fn, self.args = fn, args
+      def start(self):
+        self.fn(*self.args)
+    monkeypatch.setattr(jobs_module.threading, 'Timer', Timer)
+    with app.app_context():
+      jobs.enqueue(flaky, 'twice')
+  else:
+    with app.app_context():
+      jobs.enqueue(flaky, 'twice')
+      for attempt in (1, 2):
+        started = datetime.utcnow()
+        assert jobs.work_one('w')
+        job = db.session.query(Job).one()
+        assert (job.status, job.attempts, job.locked_by) == ('queued', attempt, None)
+        assert 'flaky twice' in job.last_error
+        delays.append(round((job.run_at - started).total_seconds()))
+        # not due before its delay is up
+        assert not jobs.work_one('w')
+        db.session.query(Job).update({Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+      assert jobs.work_one('w')
+  # JOBS_RETRY_SECONDS after the first failure, doubling after each further one
+  assert delays == [10, 20]
+  assert runs == ['twice'] * 3
+  assert queued(app) == []
+
+def test_attempts_run_out(app, backend, monkeypatch):
+  failures['always'] = 10
+  monkeypatch.setattr(jobs, 'retry_seconds', 0)
+  failed = jobs.failed
+  with app.app_context():
+    jobs.enqueue(flaky, 'always')
+  if backend == 'inline':
+    assert jobs.wait(5)
+  else:
+    with app.app_context():
+      for _ in range(3):
+        assert jobs.work_one('w')
+      assert not jobs.work_one('w')
+    assert queued(app) == [('test_flaky', '["always"]', 'failed')]
+  assert runs == ['always'] * 3
+  assert jobs.failed == failed + 1
@@ -0,0 +1,36 @@
+#----------------------------------------------------------------------------#
+# N+1 guard.
+#----------------------------------------------------------------------------#
+
+# Requests every route of the route benchmark against the seeded SQLite
+# database (conftest.py) with RAISE_ON_LAZY_LOAD on, so a query that
+# leaves a relationship to an implicit lazy load fails here instead of
+# turning into an N+1 in production. The write handlers catch their own
+# errors and print them, so their output is checked as well.
+#
+#   python -m pytest
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def test_mode_is_on(app):
+  from models import db, Venue, LazyLoadError, _raise_on_lazy_load
+  assert event.contains(Session, 'do_orm_execute', _raise_on_lazy_load)
+  with app.app_context():
+    venue = db.session.get(Venue, 1)
+    with pytest.raises(LazyLoadError):
+      venue.shows
+    db.session.rollback()
+
+
+def test_routes_do_not_lazy_load(app, route_table, capsys, caplog):
+  client = app.test_client()
+  for name, method, path, kwargs, _ in route_table:
+    response = client.open(path(0), method=method, **(kwargs(0) if kwargs else {}))
+    response.get_data()
+    assert response.status_code < 500, name
+  output = capsys.readouterr()
+  assert 'LazyLoadError' not in output.out + output.err
+  assert 'LazyLoadError' not in caplog.text
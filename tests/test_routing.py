@@ -0,0 +1,42 @@
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# Two engines on the test database stand in for a pair of replicas; a GET
+# must read everything from the one replica it picked.
+
+import pytest
+from sqlalchemy import create_engine, event
+from routing import ReplicaSet
+
+
+@pytest.fixture
+def replicas(app):
+  from models import db
+  with app.app_context():
+    url = db.engine.url
+  engines = [create_engine(url), create_engine(url)]
+  used = []
+  for engine in engines:
+    event.listen(engine, 'before_cursor_execute', lambda conn, *args: used.append(conn.engine))
+  app.extensions['replicas'] = ReplicaSet(engines, 5, 10)
+  yield engines, used
+  del app.extensions['replicas']
+  for engine in engines:
+    engine.dispose()
+
+def test_request_reads_from_one_replica(app, replicas):
+  engines, used = replicas
+  client = app.test_client()
+  for path in ('/venues/1', '/artists/1', '/venues/2'):
+    del used[:]
+    assert client.get(path).status_code == 200
+    assert len(used) > 1
+    assert len(set(used)) == 1
+  # the next requests still go round-robin
+  chosen = set()
+  for _ in range(2):
+    del used[:]
+    client.get('/venues/1')
+    chosen.update(used)
+  assert chosen == set(engines)
@@ -0,0 +1,154 @@
+#----------------------------------------------------------------------------#
+# Warm-up.
+#----------------------------------------------------------------------------#
+
+# Startup timing and warm-up for worker processes. app.py imports this
+# module first and calls startup.mark() after each stage, so the time to
+# import the app is broken down into phases (imports, extensions, routes).
+#
+# The first requests a new worker serves otherwise pay for compiling their
+# templates, configuring the mappers, loading babel's locale data and
+# opening a database connection. With WARMUP set, warm() does that before
+# the worker takes traffic, each step a phase of its own:
+#
+# - every template under templates/ is compiled; with TEMPLATE_CACHE_DIR
+#   set the bytecode is cached on disk, so later processes skip the parse
+# - the mappers are configured and the forms built once
+# - the `datetime`/`date` filter formats are compiled
+# - a pooled connection is opened and each of WARMUP_PATHS requested
+#
+# The breakdown is logged, served at /_metrics and printed by
+#
+#     flask warmup report       (warm up and print the phases)
+#     flask warmup templates    (fill the bytecode cache, e.g. at deploy)
+#
+# `python -X importtime` breaks the imports phase down further. Modules
+# only a few requests or commands use are imported on first use instead,
+# see DeferredCommand and dates.parse.
+
+import time
+
+STARTED = time.perf_counter()
+
+import os
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+
+class Startup(object):
+
+  def __init__(self, started):
+    self.started = started
+    self.last = started
+    self.phases = []
+
+  def init_app(self, app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+      app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+  def mark(self, name):
+    # the time since the previous mark is phase `name`
+    now = time.perf_counter()
+    self.phases.append((name, now - self.last))
+    self.last = now
+
+  def total(self):
+    return self.last - self.started
+
+  def report(self):
+    return {
+      "phases": [{"name": name, "ms": round(seconds * 1000, 2)} for name, seconds in self.phases],
+      "total_ms": round(self.total() * 1000, 2),
+    }
+
+  def summary(self):
+    return '  '.join(['%s=%.1fms' % (name, seconds * 1000) for name, seconds in self.phases]
+                     + ['total=%.1fms' % (self.total() * 1000)])
+
+
+startup = Startup(STARTED)
+
+
+def template_names(app):
+  return sorted(name for name in app.jinja_env.list_templates() if name.endswith('.html'))
+
+def precompile(app):
+  # loads (compiles, or reads from the bytecode cache) every template
+  names = template_names(app)
+  for name in names:
+    app.jinja_env.get_template(name)
+  return len(names)
+
+def warm(app):
+  # app.py imports this module before any of these
+  import dates
+  from forms import VenueForm, ArtistForm, ShowForm
+  from sqlalchemy import text
+  from sqlalchemy.orm import configure_mappers
+  from models import db
+
+  precompile(app)
+  startup.mark('templates')
+
+  configure_mappers()
+  with app.test_request_context():
+    VenueForm(), ArtistForm(), ShowForm()
+  startup.mark('forms')
+
+  sample = datetime(2000, 1, 1)
+  for format in dates.FORMATS:
+    dates.format_datetime(sample, format)
+  dates.format_date(sample.date())
+  startup.mark('dates')
+
+  try:
+    with app.app_context():
+      db.session.execute(text('SELECT 1'))
+      db.session.remove()
+  except Exception:
+    # a worker still starts while the database is unreachable
+    app.logger.warning('warm-up could not connect to the database', exc_info=True)
+  startup.mark('database')
+
+  paths = app.config.get('WARMUP_PATHS') or []
+  if paths:
+    client = app.test_client()
+    for path in paths:
+      client.get(path)
+    startup.mark('pages')
+
+  app.logger.info('startup %s', startup.summary())
+
+
+class DeferredCommand(click.Command):
+  # stands in for a CLI command or group that is slow to import: load()
+  # imports and returns the real one when it is run
+
+  def __init__(self, name, load, **kwargs):
+    super(DeferredCommand, self).__init__(name, **kwargs)
+    self.load = load
+
+  def make_context(self, info_name, args, parent=None, **extra):
+    return self.load().make_context(info_name, args, parent=parent, **extra)
+
+
+warmup_cli = AppGroup('warmup', help='Warm-up and startup timing.')
+
+@warmup_cli.command('templates')
+def templates_command():
+  """Compile every template, into TEMPLATE_CACHE_DIR when it is set."""
+  click.echo('%d templates compiled' % precompile(current_app))
+
+@warmup_cli.command('report')
+def report_command():
+  """Warm the app up and print how long each startup phase took."""
+  if not any(name == 'templates' for name, _ in startup.phases):
+    warm(current_app)
+  for name, seconds in startup.phases:
+    click.echo('%-12s %9.1fms' % (name, seconds * 1000))
+  click.echo('%-12s %9.1fms' % ('total', startup.total() * 1000))